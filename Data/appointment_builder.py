@@ -0,0 +1,460 @@
+# -*- coding: utf-8 -*-
+"""
+Column-oriented RAPOR -> appointments builder.
+
+Every field is parsed for the whole column at once (pandas string/datetime
+operations) instead of row by row:
+  - 'Müşteri Koordinat'   -> canonical 'lon,lat' key (coord_registry.latlon_to_key, per unique value),
+  - 'Randevu Tarih saat'  -> arrival window start/end,
+  - start-time column (Z) -> job end (data_parser) with the window start as fallback,
+  - duration              -> merge of (Çağrı Tipi, Ürün grubu adı) against the
+                             'Ürün grubu çağrı tipi süre' sheet, wildcard ('*') rows
+                             as per-call-type fallback.
+Rows that cannot be used are returned as a frame (row_id, reason) instead of
+being printed one by one. Only values that the vectorized patterns do not
+recognise go through the scalar parsers below (once per distinct value).
+
+The scalar parsers are LRU-memoized on the raw string and have a hand-written
+fast path for the usual shapes, so row-wise callers pay the regex / dateutil
+cost once per distinct value as well; parse_cache_stats() shows the counters.
+"""
+
+import re
+from datetime import date, time as dtime
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dateutil import parser as dtparser
+
+from coord_registry import latlon_to_key
+
+MAX_DURATION_MIN = 24 * 60 * 30
+JOB_TIMES_FROM_COLUMN = "column"   # end = start-time column (or window start), start = end - duration
+JOB_TIMES_FROM_WINDOW = "window"   # start = window start, end = start + duration
+PARSE_CACHE_SIZE = 8192            # distinct raw strings kept per scalar parser (LRU)
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+
+
+# ---------- scalar helpers ----------
+def normalize_text(s: Optional[str]) -> str:
+    if s is None:
+        return ""
+    return " ".join(str(s).strip().split())
+
+
+def normalize_column(col: pd.Series) -> pd.Series:
+    """normalize_text() for a whole column; missing values become ''."""
+    return col.fillna("").astype(str).str.split().str.join(" ")
+
+
+def _normalize_aw(s: str) -> str:
+    if not isinstance(s, str):
+        return ""
+    s = (s.replace("\u2012", "-")
+           .replace("\u2013", "-")
+           .replace("\u2014", "-")
+           .replace("\u2212", "-"))
+    s = s.replace("\xa0", " ")
+    s = " ".join(s.split())
+    return s
+
+
+# 'DD.MM.YYYY HH:MM[:SS]-HH:MM[:SS]' (after _normalize_aw), the shape of almost every RAPOR window
+_AW_FAST = re.compile(r"^(\d{1,2})([./-])(\d{1,2})\2(\d{4}) "
+                      r"(\d{1,2}):(\d{2})(?::(\d{2}))? ?- ?(\d{1,2}):(\d{2})(?::(\d{2}))?$")
+
+
+def _arrival_window_fast(s: str) -> Optional[Tuple[str, str]]:
+    """Hand-written parse of the _AW_FAST shape; None if 's' has another shape or invalid fields."""
+    m = _AW_FAST.match(s)
+    if not m:
+        return None
+    dd, _, mo, yyyy, h1, m1, s1, h2, m2, s2 = m.groups()
+    try:
+        d = date(int(yyyy), int(mo), int(dd))
+        t1 = dtime(int(h1), int(m1), int(s1 or 0))
+        t2 = dtime(int(h2), int(m2), int(s2 or 0))
+    except ValueError:
+        return None   # dateutil decides (e.g. month-first dates)
+    return f"{d.isoformat()}T{t1.isoformat()}", f"{d.isoformat()}T{t2.isoformat()}"
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_arrival_window(yy: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    'Randevu Tarih saat' -> (start, end) ISO strings, (None, None) if unparseable.
+    Memoized on the raw string; the known shape skips regex search + dateutil.
+    """
+    if not isinstance(yy, str):
+        return None, None
+    s = _normalize_aw(yy)
+    fast = _arrival_window_fast(s)
+    if fast is not None:
+        return fast
+
+    m_date = re.search(r"(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})", s)
+    if not m_date:
+        return None, None
+    date_part = m_date.group(1)
+    try:
+        d = dtparser.parse(date_part, dayfirst=True).date()
+    except Exception:
+        return None, None
+
+    times = re.findall(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", s)
+    if len(times) < 2:
+        packed = re.search(r"(\d{1,2}:\d{2}(?::\d{2})?)(\d{1,2}:\d{2}(?::\d{2})?)", s)
+        if packed:
+            times = [packed.group(1), packed.group(2)]
+        else:
+            return None, None
+
+    t_start, t_end = times[0], times[1]
+
+    def to_iso(time_str: str) -> Optional[str]:
+        try:
+            ts = dtparser.parse(time_str).time()
+            return f"{d.isoformat()}T{ts.strftime('%H:%M:%S')}"
+        except Exception:
+            return None
+
+    return to_iso(t_start), to_iso(t_end)
+
+
+_YMD_HMS = re.compile(r"^\s*(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})(?::(\d{2}))?\s*$")
+_DMY_HMS = re.compile(r"^\s*(\d{1,2})[./-](\d{1,2})[./-](\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$")
+_ONLY_DATE_YMD = re.compile(r"^\s*\d{4}-\d{2}-\d{2}\s*$")
+_ONLY_DATE_DMY = re.compile(r"^\s*\d{1,2}[./-]\d{1,2}[./-]\d{4}\s*$")
+
+
+_EXCEL_SERIAL = re.compile(r"^\d+(?:\.\d+)?$")
+
+
+def _job_start_fast(s: str) -> Optional[pd.Timestamp]:
+    """Excel serials and 'YYYY-MM-DD HH:MM[:SS]' without pd.to_numeric / format parsing; None otherwise."""
+    if _EXCEL_SERIAL.match(s):
+        return pd.to_datetime(float(s), unit="D", origin=EXCEL_EPOCH)
+    m = _YMD_HMS.match(s)
+    if m:
+        y, mo, d, h, mi, sec = m.groups()
+        try:
+            return pd.Timestamp(int(y), int(mo), int(d), int(h), int(mi), int(sec or 0))
+        except ValueError:
+            return None
+    return None
+
+
+def parse_job_start(raw) -> Optional[pd.Timestamp]:
+    """
+    Parse RAPOR 'Z' column value into a Timestamp with explicit formats when possible,
+    falling back safely. Handles:
+      - 'YYYY-MM-DD HH:MM[:SS]'
+      - 'DD.MM.YYYY HH:MM[:SS]'
+      - Date-only variants above (assumes 00:00)
+      - Excel serial numbers (days since 1899-12-30)
+    Strings are memoized (_parse_job_start_str); the first two shapes above have a fast path.
+    """
+    if raw is None:
+        return None
+    return _parse_job_start_str(str(raw).strip())
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse_job_start_str(s: str) -> Optional[pd.Timestamp]:
+    if not s:
+        return None
+    fast = _job_start_fast(s)
+    if fast is not None:
+        return fast
+
+    n = pd.to_numeric(s, errors="coerce")
+    if pd.notna(n):
+        try:
+            return pd.to_datetime(n, unit="D", origin="1899-12-30")
+        except Exception:
+            pass
+
+    if _YMD_HMS.match(s):
+        fmt = "%Y-%m-%d %H:%M:%S" if s.count(":") == 2 else "%Y-%m-%d %H:%M"
+        return pd.to_datetime(s.replace("T", " "), format=fmt, errors="coerce")
+
+    if _DMY_HMS.match(s):
+        s2 = re.sub(r"[/-]", ".", s)
+        fmt = "%d.%m.%Y %H:%M:%S" if s2.count(":") == 2 else "%d.%m.%Y %H:%M"
+        return pd.to_datetime(s2, format=fmt, errors="coerce")
+
+    if _ONLY_DATE_YMD.match(s):
+        return pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
+
+    if _ONLY_DATE_DMY.match(s):
+        s2 = re.sub(r"[/-]", ".", s)
+        return pd.to_datetime(s2, format="%d.%m.%Y", errors="coerce")
+
+    return pd.to_datetime(s, dayfirst=True, errors="coerce")
+
+
+def parse_cache_stats() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters of the memoized scalar parsers."""
+    out = {}
+    for name, fn in (("arrival_window", parse_arrival_window), ("job_start", _parse_job_start_str)):
+        info = fn.cache_info()
+        out[name] = {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+    return out
+
+
+def parse_cache_summary() -> str:
+    """One line for the parser summaries: 'arrival_window 190/204 hits (14 distinct), ...'."""
+    parts = []
+    for name, st in parse_cache_stats().items():
+        calls = st["hits"] + st["misses"]
+        if calls:
+            parts.append(f"{name} {st['hits']}/{calls} hits ({st['size']} distinct)")
+    return ", ".join(parts) if parts else "no scalar fallbacks (all values matched the column patterns)"
+
+
+def clear_parse_caches() -> None:
+    parse_arrival_window.cache_clear()
+    _parse_job_start_str.cache_clear()
+
+
+def parse_technician_ids(val) -> List[str]:
+    """
+    Accept 'T' values like 'T001', 'T001,T002', 'T001; T002', 'T001|T002', 'T001 T002' etc.
+    Returns a list of normalized non-empty strings.
+    """
+    if val is None or (isinstance(val, float) and np.isnan(val)):
+        return []
+    s = str(val).strip()
+    if not s:
+        return []
+    # unify separators to comma
+    s = re.sub(r"[;|/]", ",", s)
+    # also split on whitespace
+    parts = []
+    for chunk in s.split(","):
+        parts.extend(chunk.strip().split())
+    return [normalize_text(p) for p in parts if normalize_text(p)]
+
+
+# ---------- column parsers ----------
+def _map_unique(col: pd.Series, fn) -> pd.Series:
+    """fn() applied once per distinct value of 'col'."""
+    uniq = pd.unique(col)
+    return col.map(dict(zip(uniq, (fn(v) for v in uniq))))
+
+
+def _to_datetime(parts: pd.DataFrame) -> pd.Series:
+    """year/month/day[/hour/minute/second] columns (numeric, NaN allowed) -> datetime64, NaT where invalid."""
+    return pd.to_datetime(parts, errors="coerce")
+
+
+def _time_parts(col: pd.Series) -> pd.DataFrame:
+    t = col.str.extract(r"^(\d{1,2}):(\d{2})(?::(\d{2}))?$").astype(float)
+    t.columns = ["hour", "minute", "second"]
+    t["second"] = t["second"].fillna(0)
+    ok = (t["hour"] < 24) & (t["minute"] < 60) & (t["second"] < 60)
+    return t.where(ok)
+
+
+def parse_arrival_windows(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    """'Randevu Tarih saat' column -> (start, end) datetime64 columns, NaT where unparseable."""
+    s = col.where(col.map(lambda v: isinstance(v, str)), "").astype(str)
+    s = (s.str.replace("[\u2012\u2013\u2014\u2212]", "-", regex=True)
+          .str.replace("\xa0", " ", regex=False)
+          .str.split().str.join(" "))
+
+    date = s.str.extract(r"(\d{1,2})[./-](\d{1,2})[./-](\d{2,4})").astype(float)
+    date.columns = ["day", "month", "year"]
+    date.loc[date["year"] < 100, "year"] += 2000
+
+    times = s.str.findall(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b")
+    packed = s.str.extract(r"(\d{1,2}:\d{2}(?::\d{2})?)(\d{1,2}:\d{2}(?::\d{2})?)")
+    two = times.str.len() >= 2
+    t_start = times.str[0].where(two, packed[0])
+    t_end = times.str[1].where(two, packed[1])
+
+    out = []
+    for t in (t_start, t_end):
+        parts = _time_parts(t.fillna(""))
+        out.append(_to_datetime(pd.concat([date[["year", "month", "day"]], parts], axis=1)))
+    start, end = out
+
+    # dateutil also accepts a few spellings the patterns above do not (e.g. month-first dates)
+    retry = (start.isna() | end.isna()) & date["day"].notna()
+    if retry.any():
+        parsed = _map_unique(col[retry], parse_arrival_window)
+        start.loc[retry] = pd.to_datetime(parsed.str[0], errors="coerce")
+        end.loc[retry] = pd.to_datetime(parsed.str[1], errors="coerce")
+    return start, end
+
+
+def parse_job_starts(col: pd.Series) -> pd.Series:
+    """Start-time column (Z) -> datetime64, NaT where empty or unparseable (see parse_job_start)."""
+    s = col.fillna("").astype(str).str.strip()
+    out = pd.Series(pd.NaT, index=col.index, dtype="datetime64[ns]")
+
+    num = pd.to_numeric(s.where(s != ""), errors="coerce")
+    is_num = num.notna()
+    if is_num.any():
+        out[is_num] = pd.to_datetime(num[is_num], unit="D", origin="1899-12-30")
+
+    ymd = s.str.extract(_YMD_HMS.pattern).astype(float)
+    ymd.columns = ["year", "month", "day", "hour", "minute", "second"]
+    ymd["second"] = ymd["second"].fillna(0)
+    is_ymd = ymd["year"].notna() & ~is_num
+    if is_ymd.any():
+        out[is_ymd] = _to_datetime(ymd[is_ymd])
+
+    rest = ~is_num & ~is_ymd & (s != "")
+    if rest.any():
+        out[rest] = pd.to_datetime(_map_unique(s[rest], parse_job_start), errors="coerce")
+    return out
+
+
+def duration_minutes(call_type: pd.Series, product_group: pd.Series, ugcts: pd.DataFrame,
+                     ct_col: str = "Çağrı tipi", pg_col: str = "Ürün grubu", dur_col: str = "Süre") -> pd.Series:
+    """
+    Minutes per row: exact (call type, product group) rule, else the call type's
+    wildcard ('*' product group) rule, else NaN. Later sheet rows win on duplicates.
+    """
+    out = pd.Series(np.nan, index=call_type.index)
+    if ugcts is None or ugcts.empty:
+        return out
+
+    rules = pd.DataFrame({
+        "ct": normalize_column(ugcts[ct_col]),
+        "pg": normalize_column(ugcts[pg_col]),
+        "minutes": np.trunc(pd.to_numeric(ugcts[dur_col].astype(str).str.replace(",", ".", regex=False),
+                                          errors="coerce")),
+        "wildcard": ugcts[pg_col].astype(str).str.contains(r"\*", na=False),
+    }).dropna(subset=["minutes"])
+    exact = rules[~rules["wildcard"]].drop_duplicates(["ct", "pg"], keep="last")
+    wildcard = rules[rules["wildcard"]].drop_duplicates(["ct"], keep="last")
+
+    keys = pd.DataFrame({"ct": normalize_column(call_type).to_numpy(),
+                         "pg": normalize_column(product_group).to_numpy()})
+    by_exact = keys.merge(exact[["ct", "pg", "minutes"]], on=["ct", "pg"], how="left")["minutes"]
+    by_wildcard = keys[["ct"]].merge(wildcard[["ct", "minutes"]], on="ct", how="left")["minutes"]
+    out[:] = by_exact.fillna(by_wildcard).to_numpy()
+    return out
+
+
+def _column(df: pd.DataFrame, name: Optional[str]) -> pd.Series:
+    if name is not None and name in df.columns:
+        return df[name]
+    return pd.Series(np.nan, index=df.index, dtype=object)
+
+
+# ---------- builder ----------
+def build_appointments(rapor: pd.DataFrame,
+                       ugcts: pd.DataFrame,
+                       planning_horizon: Dict[str, str],
+                       job_times: str = JOB_TIMES_FROM_COLUMN,
+                       start_col: Optional[str] = None,
+                       tech_col: Optional[str] = None,
+                       known_tech_ids: Optional[Iterable[str]] = None,
+                       keep_if_no_window: bool = False,
+                       keep_if_no_duration: bool = False,
+                       default_duration_min: int = 60,
+                       ph_job_times_if_no_window: bool = False,
+                       coord_map: Optional[Dict[str, str]] = None,
+                       ) -> Tuple[List[Dict], pd.DataFrame]:
+    """
+    Returns (appointments, dropped) where dropped has columns row_id, reason
+    (no_arrival_window / no_duration_mapping / time_build_error:...), in RAPOR order.
+    Appointments have empty eligible_technicians; they are filled from the business units.
+    'coord_map' ({coordinate: representative}, snapping.py) replaces snapped locations.
+    """
+    idx = rapor.index
+    raw_id = _column(rapor, "Teyit No")
+    has_id = raw_id.notna() & (raw_id.astype(str) != "")
+    row_id = raw_id.astype(str).where(has_id, "row" + pd.Series(idx, index=idx).astype(str))
+    appt_id = normalize_column(raw_id).where(lambda s: s != "", row_id)
+
+    reason = pd.Series(None, index=idx, dtype=object)
+
+    # arrival window
+    win_start, win_end = parse_arrival_windows(_column(rapor, "Randevu Tarih saat"))
+    no_window = win_start.isna() | win_end.isna()
+    if keep_if_no_window:
+        win_start = win_start.where(~no_window, pd.Timestamp(planning_horizon["start"]))
+        win_end = win_end.where(~no_window, pd.Timestamp(planning_horizon["end"]))
+    else:
+        reason[no_window] = "no_arrival_window"
+
+    # duration
+    minutes = duration_minutes(_column(rapor, "Çağrı Tipi"), _column(rapor, "Ürün grubu adı"), ugcts)
+    if keep_if_no_duration:
+        minutes = minutes.fillna(float(default_duration_min))
+    else:
+        reason[minutes.isna() & reason.isna()] = "no_duration_mapping"
+    out_of_range = ~((minutes > 0) & (minutes < MAX_DURATION_MIN)) & reason.isna()
+    reason[out_of_range] = "time_build_error:adjusted_minutes out of range: " + minutes[out_of_range].astype(str)
+
+    # job times
+    span = pd.to_timedelta(minutes, unit="m")
+    if job_times == JOB_TIMES_FROM_COLUMN:
+        job_end = win_start
+        if start_col is not None and start_col in rapor.columns:
+            job_end = parse_job_starts(rapor[start_col]).fillna(win_start)
+        job_start = job_end - span
+    elif job_times == JOB_TIMES_FROM_WINDOW:
+        job_start = win_start
+        job_end = win_start + span
+    else:
+        raise ValueError(f"Unknown job_times {job_times!r}")
+    if ph_job_times_if_no_window and keep_if_no_window:
+        job_start = job_start.where(~no_window, pd.Timestamp(planning_horizon["start"]))
+        job_end = job_end.where(~no_window, pd.Timestamp(planning_horizon["end"]))
+
+    keep = reason.isna()
+    dropped = pd.DataFrame({"row_id": row_id[~keep], "reason": reason[~keep]}).reset_index(drop=True)
+
+    # per-row text columns
+    rows = rapor[keep]
+    coords = _map_unique(_column(rows, "Müşteri Koordinat"), latlon_to_key)
+    if coord_map:
+        coords = coords.map(lambda c: coord_map.get(c, c))
+    zones = normalize_column(_column(rows, "Müşteri İlçe"))
+    names = normalize_column(_column(rows, "Müşteri no"))
+    bu_ids = (normalize_column(_column(rows, "Çağrı Tipi")) + "|"
+              + normalize_column(_column(rows, "Ürün grubu adı")) + "|"
+              + normalize_column(_column(rows, "Yetkinlik grubu")))
+    ws = win_start[keep].dt.strftime("%Y-%m-%dT%H:%M:%S") + ".000Z"
+    we = win_end[keep].dt.strftime("%Y-%m-%dT%H:%M:%S") + ".000Z"
+    js = job_start[keep].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    je = job_end[keep].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    if tech_col is not None and tech_col in rapor.columns:
+        tech_ids = _column(rows, tech_col).map(parse_technician_ids)
+    else:
+        tech_ids = pd.Series([[] for _ in range(len(rows))], index=rows.index, dtype=object)
+    if known_tech_ids is not None:
+        known = set(known_tech_ids)
+        for rid, ids in zip(row_id[keep], tech_ids):
+            unknown = [t for t in ids if t not in known]
+            if unknown:
+                print(f"⚠️ Row {rid}: technician(s) not found in TECH sheet -> {unknown}")
+
+    appointments = [
+        {
+            "location": {"coordinate": c, "zone": z or None},
+            "arrival_window": {"start": a_s, "end": a_e},
+            "eligible_technicians": [],            # will be filled from BU
+            "id": i,
+            "start": s,
+            "end": e,
+            "technician_ids": list(t),
+            "priority": 1,
+            "name": n,
+            "business_unit_id": bu,
+            "optimize_for": "score",
+            "score_type": "average_revenue",
+        }
+        for c, z, a_s, a_e, i, s, e, t, n, bu in zip(
+            coords, zones, ws, we, appt_id[keep], js, je, tech_ids, names, bu_ids
+        )
+    ]
+    return appointments, dropped
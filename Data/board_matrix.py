@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Per-board matrix pruning.
+
+A daily board only visits its own appointment locations, the office and the
+technicians' homes, so the dataloader only needs the matrix rows/columns of
+those coordinates instead of the whole region.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from coord_registry import CoordRegistry
+
+
+def depot_coordinates(technicians: Iterable[Dict[str, Any]],
+                      options: Optional[Dict[str, Any]]) -> List[str]:
+    """Canonical keys of the office and the technician homes (routes start/end there)."""
+    reg = CoordRegistry()
+    reg.add(((options or {}).get("office") or {}).get("coordinate"))
+    for t in technicians:
+        reg.add((t.get("home") or {}).get("coordinate"))
+    return list(reg.keys)
+
+
+def board_coordinates(appointments: Iterable[Dict[str, Any]],
+                      technicians: Iterable[Dict[str, Any]],
+                      options: Optional[Dict[str, Any]]) -> List[str]:
+    """Canonical keys of office, technician homes and appointment locations (deduplicated)."""
+    reg = CoordRegistry(depot_coordinates(technicians, options))
+    for ap in appointments:
+        reg.add((ap.get("location") or {}).get("coordinate"))
+    return list(reg.keys)
+
+
+def pruning_summary(kept: int, total: int) -> str:
+    cells_kept = kept * kept
+    cells_total = total * total
+    saved = 100.0 * (1 - cells_kept / cells_total) if cells_total else 0.0
+    return f"matrix {kept}/{total} locations, {cells_kept:,} of {cells_total:,} cells per matrix ({saved:.1f}% saved)"
+
+
+def prune_nested_matrix(matrix: Dict[str, Dict[str, Dict[str, Any]]],
+                        coords: Iterable[str]) -> Tuple[Dict[str, Dict[str, Dict[str, Any]]], int, int]:
+    """
+    Restrict an already built {"duration": {from: {to: v}}, "distance": ...} section to 'coords'.
+    Returns (pruned matrix, kept locations, total locations).
+    """
+    keep = CoordRegistry(coords)
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    total = kept = 0
+    for kind, rows in (matrix or {}).items():
+        rows = rows or {}
+        total = max(total, len(rows))
+        out[kind] = {
+            f: {t: v for t, v in (inner or {}).items() if t in keep}
+            for f, inner in rows.items() if f in keep
+        }
+        kept = max(kept, len(out[kind]))
+    return out, kept, total
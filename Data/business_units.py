@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Business units (call type | product group | competency) and their rules.
+
+Every rule table is turned into a hash index once, and each business unit
+then looks its values up in one pass (no rule x BU loops):
+  - buffer_slot_length: 'Ürün grubu çağrı tipi süre'
+      (call type, product group) -> minutes   exact rows, later rows win
+      call type                  -> minutes   '*' product-group rows, first row wins
+      exact beats wildcard.
+  - technician_ids: 'Teknisyen Yetkinlikleri'
+      (call type, competency)    -> technicians
+      call type                  -> technicians   ('*' in the competency)
+      a BU gets the union of both.
+"""
+
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from appointment_builder import normalize_column
+
+UGCTS_CALL_TYPE = "Çağrı tipi"
+UGCTS_PRODUCT_GROUP = "Ürün grubu"
+UGCTS_DURATION = "Süre"
+TECH_ID = "Teknisyen no"
+TECH_CALL_TYPE = "Çağrı Tanım"        # CALL TYPE name
+TECH_COMPETENCY = "Yetkinlik tanım"   # competency/product family
+
+
+def business_unit_keys(rapor: pd.DataFrame) -> pd.DataFrame:
+    """Distinct (id, call_type, product_group, competency) of RAPOR, sorted by id."""
+    def col(name: str) -> pd.Series:
+        return normalize_column(rapor[name] if name in rapor.columns else pd.Series("", index=rapor.index))
+
+    keys = pd.DataFrame({
+        "call_type": col("Çağrı Tipi"),
+        "product_group": col("Ürün grubu adı"),
+        "competency": col("Yetkinlik grubu"),
+    })
+    keys["id"] = keys["call_type"] + "|" + keys["product_group"] + "|" + keys["competency"]
+    return keys.drop_duplicates("id").sort_values("id").reset_index(drop=True)
+
+
+def buffer_slot_index(ugcts: pd.DataFrame) -> Tuple[Dict[Tuple[str, str], float], Dict[str, float]]:
+    """(exact {(call type, product group): minutes}, wildcard {call type: minutes})."""
+    if ugcts is None or ugcts.empty:
+        return {}, {}
+    rules = pd.DataFrame({
+        "ct": normalize_column(ugcts[UGCTS_CALL_TYPE]),
+        "pg": normalize_column(ugcts[UGCTS_PRODUCT_GROUP]),
+        "minutes": pd.to_numeric(ugcts[UGCTS_DURATION].astype(str).str.replace(",", ".", regex=False),
+                                 errors="coerce"),
+        "wildcard": ugcts[UGCTS_PRODUCT_GROUP].astype(str).str.contains(r"\*", na=False),
+    }).dropna(subset=["minutes"])
+    exact = rules[~rules["wildcard"]].drop_duplicates(["ct", "pg"], keep="last")
+    wildcard = rules[rules["wildcard"]].drop_duplicates("ct", keep="first")
+    return (dict(zip(zip(exact["ct"], exact["pg"]), exact["minutes"])),
+            dict(zip(wildcard["ct"], wildcard["minutes"])))
+
+
+def technician_index(tech: pd.DataFrame) -> Tuple[Dict[Tuple[str, str], Set[str]], Dict[str, Set[str]]]:
+    """(exact {(call type, competency): technicians}, wildcard {call type: technicians})."""
+    exact: Dict[Tuple[str, str], Set[str]] = {}
+    wildcard: Dict[str, Set[str]] = {}
+    if tech is None or tech.empty:
+        return exact, wildcard
+    rules = pd.DataFrame({
+        "tid": normalize_column(tech[TECH_ID]),
+        "ct": normalize_column(tech[TECH_CALL_TYPE]),
+        "comp": normalize_column(tech[TECH_COMPETENCY]),
+    })
+    rules = rules[rules["tid"] != ""]
+    is_wild = rules["comp"].str.contains("*", regex=False)
+    for (ct, comp), tids in rules[~is_wild].groupby(["ct", "comp"], sort=False)["tid"]:
+        exact[(ct, comp)] = set(tids)
+    for ct, tids in rules[is_wild].groupby("ct", sort=False)["tid"]:
+        wildcard[ct] = set(tids)
+    return exact, wildcard
+
+
+def rule_indexes(tech: pd.DataFrame, ugcts: pd.DataFrame) -> Dict[str, tuple]:
+    """Both rule indexes, to be built once and shared by several RAPOR sheets."""
+    return {"buffer": buffer_slot_index(ugcts), "technicians": technician_index(tech)}
+
+
+def build_business_units(rapor: pd.DataFrame, tech: pd.DataFrame, ugcts: pd.DataFrame,
+                         rules: Optional[Dict[str, tuple]] = None) -> List[Dict]:
+    """Business units of the RAPOR rows with buffer_slot_length and technician_ids, sorted by id."""
+    keys = business_unit_keys(rapor)
+    rules = rules or rule_indexes(tech, ugcts)
+    buf_exact, buf_wild = rules["buffer"]
+    tech_exact, tech_wild = rules["technicians"]
+
+    business_units = []
+    for bu_id, ct, pg, comp in keys[["id", "call_type", "product_group", "competency"]].itertuples(index=False):
+        buf_len = buf_exact.get((ct, pg), buf_wild.get(ct))
+        techs = tech_exact.get((ct, comp), set()) | tech_wild.get(ct, set())
+        business_units.append(
+            {
+                "id": bu_id,
+                "buffer_slot_count": 0,
+                "buffer_slot_length": int(np.trunc(buf_len)) if buf_len is not None else 0,
+                "technician_ids": sorted(techs),
+            }
+        )
+    return business_units
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+One place for coordinate keys.
+
+Every coordinate that goes into a dataloader, a matrix store or a report is
+written as a canonical 'lon,lat' key:
+  - both numbers parsed as float,
+  - at most 6 decimals (~0.1 m), trailing zeros and '.' trimmed,
+  - no spaces, ',' as separator.
+
+Accepted spellings: 'lon,lat', 'lon;lat', 'lon, lat', 'lonvlat' (routing tool ids),
+with or without surrounding quotes; with ';' or 'v' as separator the numbers
+may use a decimal comma ('27,2999;38,6749'). RAPOR 'Müşteri Koordinat' values are
+'lat;lon' and go through latlon_to_key() instead.
+
+CoordRegistry gives every distinct canonical key a dense integer id (0..N-1),
+so matrix rows/columns and lookups are plain array indexing.
+"""
+
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+COORD_DECIMALS = 6
+
+
+def _fmt(x: float) -> str:
+    t = f"{x:.{COORD_DECIMALS}f}".rstrip("0").rstrip(".")
+    return t if t and t != "-0" else "0"
+
+
+def _split_pair(s: str) -> Optional[tuple]:
+    # ';' / 'v' ayraçsa ',' ondalık olabilir ('38,6749;27,2999'); ',' sadece başka ayraç yoksa ayraçtır
+    t = s.strip().strip('"')
+    sep = ";" if ";" in t else "v" if "v" in t else "," if "," in t else None
+    if sep is None:
+        return None
+    a, b = [p.strip().replace(",", ".") for p in t.split(sep, 1)]
+    try:
+        return float(a), float(b)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=1 << 20)
+def _canonical(s: str) -> Optional[str]:
+    pair = _split_pair(s)
+    if pair is None:
+        return None
+    return f"{_fmt(pair[0])},{_fmt(pair[1])}"
+
+
+def canonical_coord(coord: Optional[str]) -> Optional[str]:
+    """'lon,lat'-like string -> canonical 'lon,lat' key; None if it is not a coordinate."""
+    if not isinstance(coord, str):
+        return None
+    return _canonical(coord)
+
+
+@lru_cache(maxsize=1 << 20)
+def _latlon_to_key(s: str) -> Optional[str]:
+    pair = _split_pair(s)
+    if pair is None:
+        return None
+    lat, lon = pair
+    return f"{_fmt(lon)},{_fmt(lat)}"
+
+
+def latlon_to_key(val: Optional[str]) -> Optional[str]:
+    """RAPOR 'lat;lon' (or 'lat,lon') -> canonical 'lon,lat' key."""
+    if not isinstance(val, str) or not val.strip():
+        return None
+    return _latlon_to_key(val)
+
+
+def key_to_lonlat(key: str) -> tuple:
+    """Canonical key -> (lon, lat) floats."""
+    lon_s, lat_s = key.split(",", 1)
+    return float(lon_s), float(lat_s)
+
+
+class CoordRegistry:
+    """Canonical coordinate key <-> dense integer id."""
+
+    def __init__(self, coords: Iterable[Optional[str]] = ()):
+        self.keys: List[str] = []
+        self._ids: Dict[str, int] = {}
+        for c in coords:
+            self.add(c)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, coord: Optional[str]) -> bool:
+        return self.get(coord) is not None
+
+    def add(self, coord: Optional[str]) -> Optional[int]:
+        """Id of 'coord', assigning the next free id if it is new; None if not a coordinate."""
+        key = canonical_coord(coord)
+        if key is None:
+            return None
+        i = self._ids.get(key)
+        if i is None:
+            i = len(self.keys)
+            self._ids[key] = i
+            self.keys.append(key)
+        return i
+
+    def get(self, coord: Optional[str]) -> Optional[int]:
+        """Id of 'coord' if it is registered (any accepted spelling), else None."""
+        if coord in self._ids:
+            return self._ids[coord]
+        key = canonical_coord(coord)
+        return self._ids.get(key) if key is not None else None
+
+    def ids_of(self, coords: Iterable[Optional[str]]) -> np.ndarray:
+        """Vector of ids for 'coords'; -1 where the coordinate is unknown."""
+        out = [self.get(c) for c in coords]
+        return np.array([-1 if i is None else i for i in out], dtype=np.int64)
+
+    def key_of(self, i: int) -> str:
+        return self.keys[i]
+
+    def lonlat(self) -> np.ndarray:
+        """(N, 2) float array of [lon, lat] in id order."""
+        if not self.keys:
+            return np.empty((0, 2), dtype=np.float64)
+        return np.array([key_to_lonlat(k) for k in self.keys], dtype=np.float64)
@@ -7,240 +7,68 @@ This version:
 - Uses RAPOR sheet column 'Z' as the appointment job start time
 - Sets job end = job start + adjusted duration
 - Leaves arrival windows unchanged (still parsed from 'Randevu Tarih saat')
-- Cleans trailing zeros in coordinate strings
-- Normalizes coord-like keys in matrices
+- Writes appointment, office and matrix coordinates as canonical 'lon,lat' keys (coord_registry.py)
 - Appends '_fixed_arrivals' ONCE to the output file name
 - Parses 'Z' start times with explicit formats to avoid pandas dayfirst warnings
 - Reads RAPOR sheet column 'T' as technician(s) for each appointment and sets "technician_ids"
+- Builds appointments column by column (appointment_builder.py), not row by row
+- `--all-days`: reads the workbook once, finds every RAPOR-DD_MM_YYYY sheet and
+  builds the per-day dataloaders in parallel (the matrix store is mmap-shared)
+- `--stream`: reads RAPOR lazily in batches and writes appointments as they are
+  built (rapor_stream.py), for exports too large to hold in memory
+- PRESOLVE: moves appointments the solver can never place (presolve.py) out of
+  the written board into <output>_prerejected.csv
 """
 
-import json
+import argparse
 import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date
 from pathlib import Path
-from typing import Dict, Tuple, Optional, List
+from typing import Dict, Iterable, Tuple, Optional, List, Union
 
+import numpy as np
 import pandas as pd
-from dateutil import parser as dtparser
+
+from appointment_builder import JOB_TIMES_FROM_COLUMN, clear_parse_caches, normalize_text, parse_cache_summary
+from board_matrix import depot_coordinates, pruning_summary
+from business_units import rule_indexes
+from coord_registry import CoordRegistry, canonical_coord
+from eligibility import EligibilityIndex, eligibility_path, save_eligibility
+from json_stream import StreamedMapping, write_json
+from presolve import presolve_file, rejection_summary, report_path_for
+from matrix_store import load_matrix_store
+from rapor_stream import BATCH_ROWS, AppointmentStream, iter_sheet_batches, peek_columns
+from sheet_cache import read_sheets, sheet_names
+from slot_matrix import SlotDurations
+from snapping import load_snap_mapping
+from sparse_matrix import sparsify_store, sparsity_summary
 
 sayi = 14
 # --------------------- CONFIG ---------------------
 INPUT_XLSX = "28002357 Yiğit Klima 10-14 Mart 2025_SON Veri_Düzeltilmiştir.xlsx"
-SHEET_RAPOR = f"RAPOR-{sayi}_03_2025"
+SHEET_RAPOR = f"RAPOR-{sayi}_03_2025"   # single-day run; --all-days builds every RAPOR-DD_MM_YYYY sheet
 SHEET_TECH = "Teknisyen Yetkinlikleri"
 SHEET_UGCTS = "Ürün grubu çağrı tipi süre"
 
-DISTANCE_JSON = "distance.json"
-DURATION_JSON = "duration.json"
+MATRIX_STORE = "matrix_store"   # prefix of the binary store written by matrix_to_json.py
+COMPACT_JSON = True             # False -> indent=2 (human readable, ~2x larger)
+PRUNE_MATRIX = True             # only office, technician homes and this board's appointment locations
+MATRIX_MODE = "dense"           # "dense" | "radius" (distance_limit_between_jobs) | "knn" (KNN_K nearest)
+KNN_K = 50                      # neighbours per location in "knn" mode
+DURATION_SLOT = None            # None (store durations) | "08:00-10:00" ... | "worst" (max over slots, time_slots.py factors)
+SNAP_MAPPING_CSV = None         # e.g. "coord_snap_map.csv" (snapping.py): near-duplicate locations -> representative
+PRESOLVE = False                # True -> move infeasible appointments to <output>_prerejected.csv (presolve.py)
 
-OUTPUT_JSON = f"./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/dataloader-{sayi}_03_2025_fixed_arrivals.json"
+OUTPUT_JSON_TEMPLATE = "./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/dataloader-{day}_fixed_arrivals.json"
+OUTPUT_JSON = OUTPUT_JSON_TEMPLATE.format(day=f"{sayi}_03_2025")
 
 # Which Excel columns (letters) to use in RAPOR sheet:
 START_TIME_COLUMN_LETTER = "Z"   # job start time
 TECH_COLUMN_LETTER = "T"         # technician of an appointment
 # --------------------------------------------------
 
-def normalize_text(s: Optional[str]) -> str:
-    if s is None:
-        return ""
-    return " ".join(str(s).strip().split())
-
-def _to_z_no_ms(dt_like) -> str:
-    ts = pd.to_datetime(dt_like)
-    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-def _to_z_ms(dt_like) -> str:
-    ts = pd.to_datetime(dt_like)
-    return ts.strftime("%Y-%m-%dT%H:%M:%S") + ".000Z"
-
-def build_duration_lookups(ugcts: pd.DataFrame):
-    exact: Dict[Tuple[str, str], int] = {}
-    wildcard: Dict[str, int] = {}
-
-    if ugcts is None or ugcts.empty:
-        return exact, wildcard
-
-    ct_col = "Çağrı tipi"
-    pg_col = "Ürün grubu"
-    dur_col = "Süre"
-
-    wc_rows = ugcts[ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-    for _, row in wc_rows.iterrows():
-        a_ct = normalize_text(row.get(ct_col))
-        c_len = numeric_or_none(row.get(dur_col))
-        if c_len is None:
-            continue
-        try:
-            wildcard[a_ct] = int(float(c_len))
-        except Exception:
-            pass
-
-    ex_rows = ugcts[~ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-    for _, row in ex_rows.iterrows():
-        a_ct = normalize_text(row.get(ct_col))
-        b_pg = normalize_text(row.get(pg_col))
-        c_len = numeric_or_none(row.get(dur_col))
-        if c_len is None:
-            continue
-        try:
-            exact[(a_ct, b_pg)] = int(float(c_len))
-        except Exception:
-            pass
-
-    return exact, wildcard
-
-def get_appt_duration_minutes(call_type: str, product_group: str,
-                              exact: Dict[Tuple[str, str], int],
-                              wildcard: Dict[str, int]) -> Optional[int]:
-    ct = normalize_text(call_type)
-    pg = normalize_text(product_group)
-    if (ct, pg) in exact:
-        return exact[(ct, pg)]
-    return wildcard.get(ct, None)
-
-def parse_coord_latlon_to_lonlat_str(val: str) -> Optional[str]:
-    if not isinstance(val, str):
-        return None
-    s = val.strip()
-    if not s:
-        return None
-    if ";" in s:
-        lat_s, lon_s = [x.strip() for x in s.split(";", 1)]
-    elif "," in s:
-        lat_s, lon_s = [x.strip() for x in s.split(",", 1)]
-    else:
-        return None
-    try:
-        lat = float(lat_s.replace(",", "."))
-        lon = float(lon_s.replace(",", "."))
-        return f"{lon},{lat}"
-    except Exception:
-        return None
-
-def normalize_lonlat_key(s: Optional[str]) -> Optional[str]:
-    """
-    'lon,lat' ya da 'lon;lat' gelen stringi:
-      - boşlukları temizleyip,
-      - float'a çevirip,
-      - en fazla 6 ondalıkla yazıp,
-      - sonda kalan gereksiz 0 ve '.' karakterlerini kırparak
-    'lon,lat' formatında geri döndürür.
-    """
-    if not isinstance(s, str):
-        return None
-    s = s.strip().replace(";", ",")
-    if "," not in s:
-        return s
-    lon_s, lat_s = [p.strip() for p in s.split(",", 1)]
-    try:
-        lon = float(lon_s)
-        lat = float(lat_s)
-        def _trim(x: float) -> str:
-            t = f"{x:.6f}".rstrip("0").rstrip(".")
-            # Tam sayı ise '27.' gibi kalmasın diye:
-            return t if t else "0"
-        return f"{_trim(lon)},{_trim(lat)}"
-    except Exception:
-        return s
-
-# ---------- Coordinate cleaners ----------
-_COORD_NUM_RE = re.compile(r"^[\+\-]?\d+(?:\.\d+)?$")
-
-def _strip_trailing_zeros(num_str: str) -> str:
-    s = num_str.strip()
-    if "." in s:
-        s = s.rstrip("0").rstrip(".")
-    return s
-
-def _is_coord_string(s: str) -> bool:
-    if not isinstance(s, str):
-        return False
-    t = s.strip()
-    if "," in t:
-        part1, part2 = [p.strip() for p in t.split(",", 1)]
-    elif ";" in t:
-        part1, part2 = [p.strip() for p in t.split(";", 1)]
-    else:
-        return False
-    return bool(_COORD_NUM_RE.match(part1)) and bool(_COORD_NUM_RE.match(part2))
-
-def clean_coord_str(coord: Optional[str]) -> Optional[str]:
-    if not isinstance(coord, str):
-        return coord
-    s = coord.strip()
-    if not s:
-        return s
-    sep = "," if "," in s else (";" if ";" in s else None)
-    if not sep:
-        return s
-    a, b = [p.strip() for p in s.split(sep, 1)]
-    if not (_COORD_NUM_RE.match(a) and _COORD_NUM_RE.match(b)):
-        return s
-    a2 = _strip_trailing_zeros(a)
-    b2 = _strip_trailing_zeros(b)
-    return f"{a2}, {b2}"
-
-def remap_coord_keys_if_any(d: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
-    out: Dict[str, Dict[str, int]] = {}
-    for from_k, inner in d.items():
-        new_from = clean_coord_str(from_k) if _is_coord_string(from_k) else from_k
-        out[new_from] = {}
-        for to_k, v in inner.items():
-            new_to = clean_coord_str(to_k) if _is_coord_string(to_k) else to_k
-            out[new_from][new_to] = v
-    return out
-# -------------------------------------------------
-
-# ---------- Arrival-window parser (unchanged) ----------
-def _normalize_aw(s: str) -> str:
-    if not isinstance(s, str):
-        return ""
-    s = (s.replace("\u2012", "-")
-           .replace("\u2013", "-")
-           .replace("\u2014", "-")
-           .replace("\u2212", "-"))
-    s = s.replace("\xa0", " ")
-    s = " ".join(s.split())
-    return s
-
-def parse_arrival_window(yy: str) -> Tuple[Optional[str], Optional[str]]:
-    if not isinstance(yy, str):
-        return None, None
-    s = _normalize_aw(yy)
-
-    m_date = re.search(r"(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})", s)
-    if not m_date:
-        return None, None
-    date_part = m_date.group(1)
-    try:
-        d = dtparser.parse(date_part, dayfirst=True).date()
-    except Exception:
-        return None, None
-
-    times = re.findall(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", s)
-    if len(times) < 2:
-        packed = re.search(r"(\d{1,2}:\d{2}(?::\d{2})?)(\d{1,2}:\d{2}(?::\d{2})?)", s)
-        if packed:
-            times = [packed.group(1), packed.group(2)]
-        else:
-            return None, None
-
-    t_start, t_end = times[0], times[1]
-
-    def to_iso(time_str: str) -> Optional[str]:
-        try:
-            ts = dtparser.parse(time_str).time()
-            return f"{d.isoformat()}T{ts.strftime('%H:%M:%S')}"
-        except Exception:
-            return None
-
-    return to_iso(t_start), to_iso(t_end)
-# -------------------------------------------------------
-
-def build_business_unit_id(call_type: str, product_group: str, competency_group: str) -> str:
-    call_type = normalize_text(call_type)
-    product_group = normalize_text(product_group)
-    competency_group = normalize_text(competency_group)
-    return f"{call_type}|{product_group}|{competency_group}"
+RAPOR_SHEET_RE = re.compile(r"^RAPOR-(\d{2})_(\d{2})_(\d{4})$")
 
 def first_nonempty(series: pd.Series) -> Optional[str]:
     for v in series:
@@ -248,13 +76,6 @@ def first_nonempty(series: pd.Series) -> Optional[str]:
             return v.strip()
     return None
 
-def numeric_or_none(x) -> Optional[float]:
-    try:
-        v = float(str(x).replace(",", "."))
-        return v
-    except Exception:
-        return None
-
 # ---------- Helper: Excel letter -> zero-based index ----------
 def excel_col_to_index(col_letter: str) -> int:
     s = col_letter.strip().upper()
@@ -265,53 +86,6 @@ def excel_col_to_index(col_letter: str) -> int:
         idx = idx * 26 + (ord(ch) - ord('A') + 1)
     return idx - 1
 
-# ---------- NEW: robust, warning-free job-start parser ----------
-_YMD_HMS = re.compile(r"^\s*(\d{4})-(\d{2})-(\d{2})[ T](\d{2}):(\d{2})(?::(\d{2}))?\s*$")
-_DMY_HMS = re.compile(r"^\s*(\d{1,2})[./-](\d{1,2})[./-](\d{4})\s+(\d{1,2}):(\d{2})(?::(\d{2}))?\s*$")
-_ONLY_DATE_YMD = re.compile(r"^\s*\d{4}-\d{2}-\d{2}\s*$")
-_ONLY_DATE_DMY = re.compile(r"^\s*\d{1,2}[./-]\d{1,2}[./-]\d{4}\s*$")
-
-def parse_job_start(raw) -> Optional[pd.Timestamp]:
-    """
-    Parse RAPOR 'Z' column value into a Timestamp with explicit formats when possible,
-    falling back safely. Handles:
-      - 'YYYY-MM-DD HH:MM[:SS]'
-      - 'DD.MM.YYYY HH:MM[:SS]'
-      - Date-only variants above (assumes 00:00)
-      - Excel serial numbers (days since 1899-12-30)
-    """
-    if raw is None:
-        return None
-    s = str(raw).strip()
-    if not s:
-        return None
-
-    n = pd.to_numeric(s, errors="coerce")
-    if pd.notna(n):
-        try:
-            return pd.to_datetime(n, unit="D", origin="1899-12-30")
-        except Exception:
-            pass
-
-    if _YMD_HMS.match(s):
-        fmt = "%Y-%m-%d %H:%M:%S" if s.count(":") == 2 else "%Y-%m-%d %H:%M"
-        return pd.to_datetime(s.replace("T", " "), format=fmt, errors="coerce")
-
-    if _DMY_HMS.match(s):
-        s2 = re.sub(r"[/-]", ".", s)
-        fmt = "%d.%m.%Y %H:%M:%S" if s2.count(":") == 2 else "%d.%m.%Y %H:%M"
-        return pd.to_datetime(s2, format=fmt, errors="coerce")
-
-    if _ONLY_DATE_YMD.match(s):
-        return pd.to_datetime(s, format="%Y-%m-%d", errors="coerce")
-
-    if _ONLY_DATE_DMY.match(s):
-        s2 = re.sub(r"[/-]", ".", s)
-        return pd.to_datetime(s2, format="%d.%m.%Y", errors="coerce")
-
-    return pd.to_datetime(s, dayfirst=True, errors="coerce")
-# -------------------------------------------------------------
-
 def ensure_suffix_once(path_str: str, suffix: str = "_fixed_arrivals") -> str:
     p = Path(path_str)
     stem = p.stem
@@ -321,59 +95,60 @@ def ensure_suffix_once(path_str: str, suffix: str = "_fixed_arrivals") -> str:
         new_stem = stem + suffix
     return str(p.with_name(new_stem + p.suffix))
 
-# ---------- NEW: parse tech ids from RAPOR column T ----------
-def parse_technician_ids(val) -> List[str]:
+def day_of_sheet(sheet_name: str) -> Optional[date]:
+    """'RAPOR-14_03_2025' -> date(2025, 3, 14); None for other sheets and impossible dates."""
+    m = RAPOR_SHEET_RE.match(sheet_name)
+    if not m:
+        return None
+    dd, mm, yyyy = (int(g) for g in m.groups())
+    try:
+        return date(yyyy, mm, dd)
+    except ValueError:   # e.g. 'RAPOR-31_02_2025'
+        print(f"⚠️ Skipping sheet {sheet_name!r}: not a valid date")
+        return None
+
+
+def discover_day_sheets(sheet_names: List[str]) -> List[Tuple[str, date]]:
+    """All 'RAPOR-DD_MM_YYYY' sheets of a workbook, in date order."""
+    days = [(name, day_of_sheet(name)) for name in sheet_names]
+    return sorted(((n, d) for n, d in days if d is not None), key=lambda x: x[1])
+
+
+def output_path_for(day: date) -> str:
+    return OUTPUT_JSON_TEMPLATE.format(day=day.strftime("%d_%m_%Y"))
+
+
+def build_dataloader(rapor: Union[pd.DataFrame, Iterable[pd.DataFrame]], tech: pd.DataFrame, ugcts: pd.DataFrame,
+                     day: date, output_json: str, rules: Optional[Dict] = None) -> str:
     """
-    Accept 'T' values like 'T001', 'T001,T002', 'T001; T002', 'T001|T002', 'T001 T002' etc.
-    Returns a list of normalized non-empty strings.
+    One day's dataloader from its RAPOR sheet (a DataFrame, or DataFrame batches from
+    rapor_stream.iter_sheet_batches) and the shared sheets / rule indexes.
+    Appointments are written as they are built, batch by batch.
+    Returns the written path (output_json with the '_fixed_arrivals' suffix).
     """
-    if val is None:
-        return []
-    s = str(val).strip()
-    if not s:
-        return []
-    # unify separators to comma
-    s = re.sub(r"[;|/]", ",", s)
-    # also split on whitespace
-    parts = []
-    for chunk in s.split(","):
-        parts.extend(chunk.strip().split())
-    return [normalize_text(p) for p in parts if normalize_text(p)]
-# -------------------------------------------------------------
-
-def main():
-    # --- Load Excel ---
-    xls = pd.ExcelFile(INPUT_XLSX, engine="openpyxl")
-    rapor = pd.read_excel(xls, sheet_name=SHEET_RAPOR, dtype=str)
-    tech = pd.read_excel(xls, sheet_name=SHEET_TECH, dtype=str)
-    ugcts = pd.read_excel(xls, sheet_name=SHEET_UGCTS, dtype=str)
+    if isinstance(rapor, pd.DataFrame):
+        rapor = [rapor]
+    rapor_columns, batches = peek_columns(rapor)
+    clear_parse_caches()   # per-board hit counters; window / start strings carry the date anyway
 
     # Determine RAPOR start-time & technician column names by Excel letters
     try:
         start_col_idx = excel_col_to_index(START_TIME_COLUMN_LETTER)
-        START_TIME_COLNAME = rapor.columns[start_col_idx]
+        START_TIME_COLNAME = rapor_columns[start_col_idx]
     except Exception:
         START_TIME_COLNAME = None
 
     try:
         tech_col_idx = excel_col_to_index(TECH_COLUMN_LETTER)
-        TECH_COLNAME = rapor.columns[tech_col_idx]
+        TECH_COLNAME = rapor_columns[tech_col_idx]
     except Exception:
         TECH_COLNAME = None
 
-    exact_dur, wildcard_dur = build_duration_lookups(ugcts)
-
-    # --- Load matrices ---
-    with open(DISTANCE_JSON, "r", encoding="utf-8") as f:
-        distance_obj = json.load(f)
-    with open(DURATION_JSON, "r", encoding="utf-8") as f:
-        duration_obj = json.load(f)
-
     # ----------------- OPTIONS -----------------
     options = {
         "account_id": None,
         "office": {"coordinate": "27.436587,38.626512", "zone": "ŞEHZADELER"},
-        "planning_horizon": {"start": f"2025-03-{sayi}T08:00:00", "end": f"2025-03-{sayi}T23:00:00"},
+        "planning_horizon": {"start": f"{day.isoformat()}T08:00:00", "end": f"{day.isoformat()}T23:00:00"},
         "run_time_limit": 120,
         "enable_buffer_slot": False,
         "distance_limit_between_jobs": 400000,
@@ -391,7 +166,7 @@ def main():
         "capacity_weight": 1,
         "lunch_break": None,
     }
-    options["office"]["coordinate"] = clean_coord_str(options["office"]["coordinate"])
+    options["office"]["coordinate"] = canonical_coord(options["office"]["coordinate"])
     ph_start = options["planning_horizon"]["start"]
     ph_end = options["planning_horizon"]["end"]
     office_coord = options["office"]["coordinate"]
@@ -417,288 +192,159 @@ def main():
             }
         )
 
-    # --- Appointments ---
-    appointments: List[Dict] = []
-    dropped = []
-
+    # --- Appointments (column-oriented per batch, appointment_builder.py / rapor_stream.py) ---
     KEEP_IF_NO_DURATION = False
     DEFAULT_DURATION_MIN = 60
     KEEP_IF_NO_WINDOW = False
 
-    for idx, r in rapor.iterrows():
-        row_id = str(r.get("Teyit No") or f"row{idx}")
-
-        # Coordinate / zone
-        loc_coord = parse_coord_latlon_to_lonlat_str(r.get("Müşteri Koordinat"))
-        zone_id = normalize_text(r.get("Müşteri İlçe"))
-        if loc_coord:
-            loc_coord = clean_coord_str(loc_coord)
-
-        # Arrival window (unchanged)
-        start_iso, end_iso = parse_arrival_window(r.get("Randevu Tarih saat"))
-        if (not start_iso or not end_iso):
-            if KEEP_IF_NO_WINDOW:
-                start_iso = options["planning_horizon"]["start"]
-                end_iso   = options["planning_horizon"]["end"]
-            else:
-                dropped.append((row_id, "no_arrival_window"))
-                continue
-
-        # Duration
-        call_type = normalize_text(r.get("Çağrı Tipi"))
-        product_group = normalize_text(r.get("Ürün grubu adı"))
-        duration_min = get_appt_duration_minutes(call_type, product_group, exact_dur, wildcard_dur)
-        if duration_min is None:
-            if KEEP_IF_NO_DURATION:
-                duration_min = DEFAULT_DURATION_MIN
-            else:
-                dropped.append((row_id, "no_duration_mapping"))
-                continue
-
-        # Times
-        try:
-            arrival_start_ref = _to_z_ms(pd.to_datetime(start_iso))
-            arrival_end_ref   = _to_z_ms(pd.to_datetime(end_iso))
-
-            DURATION_DIVISOR = 1
-            adjusted_minutes = float(duration_min) / DURATION_DIVISOR
-            if not (adjusted_minutes > 0 and adjusted_minutes < 24 * 60 * 30):
-                raise ValueError(f"adjusted_minutes out of range: {adjusted_minutes}")
-
-            # Preferred start from RAPOR column Z
-            job_start_dt: Optional[pd.Timestamp] = None
-            if START_TIME_COLNAME is not None:
-                raw_start_val = r.get(START_TIME_COLNAME)
-                if raw_start_val is not None and str(raw_start_val).strip():
-                    job_start_dt = parse_job_start(raw_start_val)
-            if job_start_dt is None or pd.isna(job_start_dt):
-                job_start_dt = pd.to_datetime(start_iso)
-
-            job_end_dt = job_start_dt 
-            job_start_dt = job_end_dt - pd.to_timedelta(adjusted_minutes, unit="m")
-            job_start_ref = _to_z_no_ms(job_start_dt)
-            job_end_ref   = _to_z_no_ms(job_end_dt)
-
-        except Exception as e:
-            dropped.append((row_id, f"time_build_error:{e}"))
-            continue
-
-        # Technician IDs from RAPOR column T
-        tech_ids_for_row: List[str] = []
-        if TECH_COLNAME is not None:
-            tech_ids_for_row = parse_technician_ids(r.get(TECH_COLNAME))
-
-        # Optionally, warn if any are unknown
-        unknown = [t for t in tech_ids_for_row if t not in known_tech_ids]
-        if unknown:
-            print(f"⚠️ Row {row_id}: technician(s) not found in TECH sheet -> {unknown}")
-
-        # Build BU
-        bu_id = build_business_unit_id(
-            r.get("Çağrı Tipi"),
-            r.get("Ürün grubu adı"),
-            r.get("Yetkinlik grubu"),
-        )
-
-        appt_id = normalize_text(r.get("Teyit No")) or row_id
-        appt_name = normalize_text(r.get("Müşteri no"))
-
-        appointments.append(
-            {
-                "location": {"coordinate": loc_coord, "zone": zone_id or None},
-                "arrival_window": {"start": arrival_start_ref, "end": arrival_end_ref},
-                "eligible_technicians": [],            # will be filled from BU below
-                "id": appt_id,
-                "start": job_start_ref,
-                "end": job_end_ref,
-                "technician_ids": tech_ids_for_row,    # <-- SET FROM COLUMN T
-                "priority": 1,
-                "name": appt_name,
-                "business_unit_id": bu_id,
-                "optimize_for": "score",
-                "score_type": "average_revenue",
-            }
-        )
-
-    if dropped:
-        print("⚠️ Skipped rows:", len(dropped))
-        for rid, reason in dropped[:10]:
-            print(f"  - {rid}: {reason}")
-
-    # Zones
-    unique_zones = sorted(
-        {
-            normalize_text(z)
-            for z in rapor.get("Müşteri İlçe", pd.Series(dtype=str)).tolist()
-            if isinstance(z, str) and normalize_text(z)
-        }
+    # Zones, business units (+ buffer slot and technician rules, business_units.py) and the
+    # board coordinates are collected while the appointments are written; eligible_technicians
+    # are filled from the BU of each appointment.
+    stream = AppointmentStream(
+        batches,
+        tech,
+        ugcts,
+        options["planning_horizon"],
+        rules=rules,
+        job_times=JOB_TIMES_FROM_COLUMN,
+        start_col=START_TIME_COLNAME,
+        tech_col=TECH_COLNAME,
+        known_tech_ids=known_tech_ids,
+        keep_if_no_window=KEEP_IF_NO_WINDOW,
+        keep_if_no_duration=KEEP_IF_NO_DURATION,
+        default_duration_min=DEFAULT_DURATION_MIN,
+        coord_map=load_snap_mapping(SNAP_MAPPING_CSV) if SNAP_MAPPING_CSV else None,
     )
-    zones = [{"id": z, "can_go_with": []} for z in unique_zones]
-
-    # Business Units from RAPOR
-    bu_records = {}
-    for _, r in rapor.iterrows():
-        call_type = normalize_text(r.get("Çağrı Tipi"))
-        product_group = normalize_text(r.get("Ürün grubu adı"))
-        competency = normalize_text(r.get("Yetkinlik grubu"))
-        bu_id = build_business_unit_id(call_type, product_group, competency)
-        if bu_id not in bu_records:
-            bu_records[bu_id] = {
-                "id": bu_id,
-                "call_type": call_type,
-                "product_group": product_group,
-                "competency": competency,
-                "buffer_slot_count": 0,
-                "buffer_slot_length": None,
-                "technician_ids": set(),
-            }
-
-    # Buffer slot rules
-    if not ugcts.empty:
-        ct_col = "Çağrı tipi"
-        pg_col = "Ürün grubu"
-        dur_col = "Süre"
-
-        wildcard_rows = ugcts[ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-        exact_rows = ugcts[~ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-
-        for _, row in wildcard_rows.iterrows():
-            a_ct = normalize_text(row.get(ct_col))
-            c_len = numeric_or_none(row.get(dur_col))
-            if c_len is None:
-                continue
-            for bu in bu_records.values():
-                if bu["call_type"] == a_ct and bu["buffer_slot_length"] is None:
-                    bu["buffer_slot_length"] = c_len
-
-        for _, row in exact_rows.iterrows():
-            a_ct = normalize_text(row.get(ct_col))
-            b_pg = normalize_text(row.get(pg_col))
-            c_len = numeric_or_none(row.get(dur_col))
-            if c_len is None:
-                continue
-            for bu in bu_records.values():
-                if bu["call_type"] == a_ct and bu["product_group"] == b_pg:
-                    bu["buffer_slot_length"] = c_len
-
-    # Technician eligibility rules from TECH sheet
-    t_id_col = "Teknisyen no"
-    t_pg_col = "Çağrı Tanım"
-    t_comp_col = "Yetkinlik tanım"
-
-    if not tech.empty:
-        for _, row in tech.iterrows():
-            tid = normalize_text(row.get(t_id_col))
-            if not tid:
-                continue
-            c_calltype = normalize_text(row.get(t_pg_col))
-            d_comp = normalize_text(row.get(t_comp_col))
-
-            if "*" in d_comp:
-                for bu in bu_records.values():
-                    if bu["call_type"] == c_calltype:
-                        bu["technician_ids"].add(tid)
-            else:
-                for bu in bu_records.values():
-                    if bu["call_type"] == c_calltype and bu["competency"] == d_comp:
-                        bu["technician_ids"].add(tid)
-
-    business_units = []
-    for bu in sorted(bu_records.values(), key=lambda x: x["id"]):
-        buf_len = bu["buffer_slot_length"]
-        try:
-            buf_len = int(float(buf_len)) if buf_len is not None else 0
-        except Exception:
-            buf_len = 0
-
-        business_units.append(
-            {
-                "id": bu["id"],
-                "buffer_slot_count": 0,
-                "buffer_slot_length": buf_len,
-                "technician_ids": sorted(bu["technician_ids"]),
-            }
-        )
 
-    # Fill eligible_technicians from BU
-    bu_to_tech = {b["id"]: b["technician_ids"] for b in business_units}
-    for appt in appointments:
-        techs = bu_to_tech.get(appt["business_unit_id"], [])
-        appt["eligible_technicians"] = [{"id": tid, "score": 1} for tid in techs]
-
-    # Matrices
-    def convert_matrix_values_to_int(matrix_obj: Dict) -> Dict:
-        """
-        Distance matrisi: değerleri int'e çevirir, from/to anahtarlarını normalize eder.
-        """
-        result: Dict[str, Dict[str, int]] = {}
-        for from_id, inner in (matrix_obj or {}).items():
-            nf = normalize_lonlat_key(from_id) or from_id
-            if nf not in result:
-                result[nf] = {}
-            for to_id, val in (inner or {}).items():
-                nt = normalize_lonlat_key(to_id) or to_id
-                try:
-                    iv = int(float(val))
-                except Exception:
-                    iv = 0
-                # Çakışma olursa son değer kazanır (istersen max/min alacak şekilde değiştirilebilir)
-                result[nf][nt] = iv
-        return result
-
-
-    def convert_matrix_values_to_int_duration(matrix_obj: Dict) -> Dict:
-        """
-        Duration matrisi: değerleri int'e çevirir, from/to anahtarlarını normalize eder.
-        Diagonal dışı geçişlere alt sınır uygular (>= 300 sn).
-        """
-        result: Dict[str, Dict[str, int]] = {}
-        for from_id, inner in (matrix_obj or {}).items():
-            nf = normalize_lonlat_key(from_id) or from_id
-            if nf not in result:
-                result[nf] = {}
-            for to_id, val in (inner or {}).items():
-                nt = normalize_lonlat_key(to_id) or to_id
-                try:
-                    iv = int(float(val))
-                except Exception:
-                    iv = 0
-                if nf != nt:
-                    iv = max(iv, 300)  # diagonal olmayanlar için alt sınır
-                result[nf][nt] = iv
-        return result
-
-
-    raw_duration = remap_coord_keys_if_any(duration_obj.get("duration", {}))
-    raw_distance = remap_coord_keys_if_any(distance_obj.get("distance", {}))
-
-    matrix = {
-        "duration": convert_matrix_values_to_int_duration(raw_duration),
-        "distance": convert_matrix_values_to_int(raw_distance),
-    }
-
-    # Final payload
+    def _zones():
+        yield from stream.zones
+
+    def _business_units():
+        yield from stream.business_units
+
+    # Matrices (memory-mapped store; rows are converted while the payload is written)
+    def _matrix():
+        store = load_matrix_store(MATRIX_STORE)
+        if PRUNE_MATRIX:
+            total_locations = len(store)
+            board = CoordRegistry(depot_coordinates(technicians, options))
+            for c in stream.coordinates.keys:
+                board.add(c)
+            store, not_in_matrix = store.subset(board.keys)
+            print(f"✂️ Pruned {pruning_summary(len(store), total_locations)}")
+            if not_in_matrix:
+                print(f"⚠️ {len(not_in_matrix)} board coordinate(s) not in the matrix store: {not_in_matrix[:5]}")
+
+        if DURATION_SLOT:
+            store = SlotDurations().apply_to(store, DURATION_SLOT)
+            print(f"⏱️ Durations for slot {DURATION_SLOT}")
+
+        if MATRIX_MODE != "dense":
+            store = sparsify_store(
+                store,
+                radius_m=options["distance_limit_between_jobs"] if MATRIX_MODE == "radius" else None,
+                k=KNN_K if MATRIX_MODE == "knn" else None,
+                keep_full=depot_coordinates(technicians, options),
+            )
+            print(f"✂️ {sparsity_summary(store)}")
+
+        # 'cols' = column ids of the row values (sparse rows); None -> full row
+        def _distance_row(i: int, row: np.ndarray, cols: Optional[np.ndarray] = None) -> np.ndarray:
+            return np.trunc(np.nan_to_num(row, nan=0.0)).astype(np.int64)
+
+        def _duration_row(i: int, row: np.ndarray, cols: Optional[np.ndarray] = None) -> np.ndarray:
+            iv = np.trunc(np.nan_to_num(row, nan=0.0)).astype(np.int64)
+            on_diag = (np.arange(len(iv)) if cols is None else cols) == i
+            return np.where(on_diag, iv, np.maximum(iv, 300))  # diagonal olmayanlar için alt sınır
+
+        yield "duration", StreamedMapping(store.iter_rows("duration", _duration_row))
+        yield "distance", StreamedMapping(store.iter_rows("distance", _distance_row))
+
+    # Final payload (sections after "appointments" are generated once the appointments are written)
     payload: Dict = {
-        "appointments": appointments,
-        "zones": zones,
+        "appointments": stream.appointments(),
+        "zones": _zones(),
         "technicians": technicians,
         "options": options,
-        "matrix": matrix,
-        "business_units": business_units,
+        "matrix": StreamedMapping(_matrix()),
+        "business_units": _business_units(),
         "board_id": "",
     }
 
     # Write with '_fixed_arrivals' once
-    output_path = ensure_suffix_once(OUTPUT_JSON, "_fixed_arrivals")
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
-    Path(output_path).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    output_path = ensure_suffix_once(output_json, "_fixed_arrivals")
+    write_json(output_path, payload, compact=COMPACT_JSON)
+    # technician x BU eligibility for the reports (json_to_excel.py)
+    save_eligibility(eligibility_path(output_path),
+                     EligibilityIndex.from_business_units(stream.business_units, known_tech_ids))
+
+    if stream.dropped_count:
+        print("⚠️ Skipped rows:", stream.dropped_count)
+        for rid, reason in stream.dropped_sample:
+            print(f"  - {rid}: {reason}")
     print(
         f"✅ Wrote {output_path} with "
-        f"{len(appointments)} appointments, "
+        f"{stream.count} appointments, "
         f"{len(technicians)} technicians, "
-        f"{len(zones)} zones, "
-        f"{len(business_units)} business units."
+        f"{len(stream.zones)} zones, "
+        f"{len(stream.business_units)} business units."
     )
+    print(f"   Parse caches: {parse_cache_summary()}")
+    if PRESOLVE:
+        # reads the written board back: the appointments are streamed out, the check needs all of them
+        kept, rejected = presolve_file(output_path, prune_matrix=PRUNE_MATRIX, compact=COMPACT_JSON)
+        print(f"✂️ {rejection_summary(kept, rejected)} -> {report_path_for(output_path)}")
+    return output_path
+
+
+def _build_day_job(job: Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, date, str, Dict]) -> str:
+    return build_dataloader(*job)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Build dataloader JSON(s) from the RAPOR workbook.")
+    ap.add_argument("--all-days", action="store_true",
+                    help="build every RAPOR-DD_MM_YYYY sheet of the workbook (default: SHEET_RAPOR only)")
+    ap.add_argument("--workers", type=int, default=None, help="process pool size for --all-days (default: CPU count)")
+    ap.add_argument("--stream", action="store_true",
+                    help="read SHEET_RAPOR row by row and write appointments in batches (very large exports)")
+    ap.add_argument("--batch-rows", type=int, default=BATCH_ROWS, help="RAPOR rows per batch with --stream")
+    args = ap.parse_args()
+
+    if not args.all_days and day_of_sheet(SHEET_RAPOR) is None:
+        print(f"⚠️ SHEET_RAPOR {SHEET_RAPOR!r} is not a RAPOR-DD_MM_YYYY sheet with a valid date")
+        return
+
+    if args.stream:
+        # constant memory: RAPOR rows are read lazily, only the small sheets are loaded
+        sheets = read_sheets(INPUT_XLSX, [SHEET_TECH, SHEET_UGCTS], dtype=str)
+        build_dataloader(iter_sheet_batches(INPUT_XLSX, SHEET_RAPOR, args.batch_rows),
+                         sheets[SHEET_TECH], sheets[SHEET_UGCTS], day_of_sheet(SHEET_RAPOR), OUTPUT_JSON)
+        return
+
+    # --- Load Excel (once; parsed sheets come from sheet_cache.py when the workbook is unchanged) ---
+    if not args.all_days:
+        sheets = read_sheets(INPUT_XLSX, [SHEET_RAPOR, SHEET_TECH, SHEET_UGCTS], dtype=str)
+        build_dataloader(sheets[SHEET_RAPOR], sheets[SHEET_TECH], sheets[SHEET_UGCTS],
+                         day_of_sheet(SHEET_RAPOR), OUTPUT_JSON)
+        return
+
+    days = discover_day_sheets(sheet_names(INPUT_XLSX))
+    if not days:
+        print(f"⚠️ No RAPOR-DD_MM_YYYY sheets in {INPUT_XLSX}")
+        return
+    sheets = read_sheets(INPUT_XLSX, [n for n, _ in days] + [SHEET_TECH, SHEET_UGCTS], dtype=str)
+    tech, ugcts = sheets[SHEET_TECH], sheets[SHEET_UGCTS]
+    rules = rule_indexes(tech, ugcts)
+    print(f"Found {len(days)} day sheet(s): {', '.join(n for n, _ in days)}")
+
+    jobs = [(sheets[name], tech, ugcts, day, output_path_for(day), rules) for name, day in days]
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {pool.submit(_build_day_job, job): job[3] for job in jobs}
+        for fut in as_completed(futures):
+            fut.result()
+    print(f"✅ Built {len(jobs)} dataloaders.")
+
 
 if __name__ == "__main__":
     main()
@@ -4,13 +4,22 @@ Builds the requested dataloader JSON from the given Excel and existing
 distance/duration matrices.
 """
 
-import json
-import re
-from pathlib import Path
 from typing import Dict, Tuple, Optional, List
 
+import numpy as np
 import pandas as pd
-from dateutil import parser as dtparser
+
+from appointment_builder import JOB_TIMES_FROM_WINDOW, build_appointments, normalize_text, parse_cache_summary
+from board_matrix import board_coordinates, depot_coordinates, pruning_summary
+from business_units import build_business_units
+from coord_registry import canonical_coord
+from eligibility import EligibilityIndex, eligibility_path, save_eligibility
+from json_stream import StreamedMapping, write_json
+from matrix_store import load_matrix_store
+from sheet_cache import read_sheets
+from slot_matrix import SlotDurations
+from snapping import load_snap_mapping
+from sparse_matrix import sparsify_store, sparsity_summary
 
 sayi = 14
 # --------------------- CONFIG ---------------------
@@ -19,238 +28,27 @@ SHEET_RAPOR = f"RAPOR-{sayi}_03_2025"
 SHEET_TECH = "Teknisyen Yetkinlikleri"
 SHEET_UGCTS = "Ürün grubu çağrı tipi süre"
 
-DISTANCE_JSON = "distance.json"
-DURATION_JSON = "duration.json"
+MATRIX_STORE = "matrix_store"   # prefix of the binary store written by matrix_to_json.py
+COMPACT_JSON = True             # False -> indent=2
+PRUNE_MATRIX = True             # only office, technician homes and this board's appointment locations
+MATRIX_MODE = "dense"           # "dense" | "radius" (distance_limit_between_jobs) | "knn" (KNN_K nearest)
+KNN_K = 50                      # neighbours per location in "knn" mode
+DURATION_SLOT = None            # None (store durations) | "08:00-10:00" ... | "worst" (max over slots, time_slots.py factors)
+SNAP_MAPPING_CSV = None         # e.g. "coord_snap_map.csv" (snapping.py): near-duplicate locations -> representative
 #./scenarios/technician_capacity_120-driving_speed_60kmh/
 OUTPUT_JSON = f"./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/dataloader-{sayi}_03_2025.json"
 # --------------------------------------------------
 
-def normalize_text(s: Optional[str]) -> str:
-    """Trim and collapse internal whitespace; return '' for None."""
-    if s is None:
-        return ""
-    return " ".join(str(s).strip().split())
-
-def _to_z_no_ms(dt_like) -> str:
-    """Format datetime as 'YYYY-MM-DDTHH:MM:SSZ'."""
-    ts = pd.to_datetime(dt_like)
-    return ts.strftime("%Y-%m-%dT%H:%M:%SZ")
-
-def _to_z_ms(dt_like) -> str:
-    """Format datetime as 'YYYY-MM-DDTHH:MM:SS.000Z' (force .000)."""
-    ts = pd.to_datetime(dt_like)
-    return ts.strftime("%Y-%m-%dT%H:%M:%S") + ".000Z"
-
-def build_duration_lookups(ugcts: pd.DataFrame):
-    exact: Dict[Tuple[str, str], int] = {}
-    wildcard: Dict[str, int] = {}
-
-    if ugcts is None or ugcts.empty:
-        return exact, wildcard
-
-    ct_col = "Çağrı tipi"
-    pg_col = "Ürün grubu"
-    dur_col = "Süre"
-
-    # Wildcard rows: Ürün grubu contains '*'
-    wc_rows = ugcts[ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-    for _, row in wc_rows.iterrows():
-        a_ct = normalize_text(row.get(ct_col))
-        c_len = numeric_or_none(row.get(dur_col))
-        if c_len is None:
-            continue
-        try:
-            wildcard[a_ct] = int(float(c_len))
-        except Exception:
-            pass
-
-    # Exact rows: Ürün grubu does NOT contain '*'
-    ex_rows = ugcts[~ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-    for _, row in ex_rows.iterrows():
-        a_ct = normalize_text(row.get(ct_col))
-        b_pg = normalize_text(row.get(pg_col))
-        c_len = numeric_or_none(row.get(dur_col))
-        if c_len is None:
-            continue
-        try:
-            exact[(a_ct, b_pg)] = int(float(c_len))
-        except Exception:
-            pass
-
-    return exact, wildcard
-
-def get_appt_duration_minutes(call_type: str, product_group: str,
-                              exact: Dict[Tuple[str, str], int],
-                              wildcard: Dict[str, int]) -> Optional[int]:
-    ct = normalize_text(call_type)
-    pg = normalize_text(product_group)
-    if (ct, pg) in exact:
-        return exact[(ct, pg)]
-    return wildcard.get(ct, None)
-
-def parse_coord_latlon_to_lonlat_str(val: str) -> Optional[str]:
-    if not isinstance(val, str):
-        return None
-    s = val.strip()
-    if not s:
-        return None
-    if ";" in s:
-        lat_s, lon_s = [x.strip() for x in s.split(";", 1)]
-    elif "," in s:
-        lat_s, lon_s = [x.strip() for x in s.split(",", 1)]
-    else:
-        return None
-    try:
-        lat = float(lat_s.replace(",", "."))
-        lon = float(lon_s.replace(",", "."))
-        return f"{lon},{lat}"
-    except Exception:
-        return None
-
-# ---------- NEW: coordinate cleaners ----------
-_COORD_NUM_RE = re.compile(r"^[\+\-]?\d+(?:\.\d+)?$")
-
-def _strip_trailing_zeros(num_str: str) -> str:
-    """Remove trailing zeros (and trailing '.') from a decimal string."""
-    s = num_str.strip()
-    if "." in s:
-        s = s.rstrip("0").rstrip(".")
-    return s
-
-def _is_coord_string(s: str) -> bool:
-    """Rudimentary check if 's' looks like 'num[,; ]num'."""
-    if not isinstance(s, str):
-        return False
-    t = s.strip()
-    if "," in t:
-        part1, part2 = [p.strip() for p in t.split(",", 1)]
-    elif ";" in t:
-        part1, part2 = [p.strip() for p in t.split(";", 1)]
-    else:
-        return False
-    return bool(_COORD_NUM_RE.match(part1)) and bool(_COORD_NUM_RE.match(part2))
-
-def clean_coord_str(coord: Optional[str]) -> Optional[str]:
-    """Normalize 'lon, lat' text by trimming trailing zeros in each number."""
-    if not isinstance(coord, str):
-        return coord
-    s = coord.strip()
-    if not s:
-        return s
-    sep = "," if "," in s else (";" if ";" in s else None)
-    if not sep:
-        return s
-    a, b = [p.strip() for p in s.split(sep, 1)]
-    if not (_COORD_NUM_RE.match(a) and _COORD_NUM_RE.match(b)):
-        # not a plain numeric coord, return as-is
-        return s
-    a2 = _strip_trailing_zeros(a)
-    b2 = _strip_trailing_zeros(b)
-    return f"{a2}, {b2}"
-
-def remap_coord_keys_if_any(d: Dict[str, Dict[str, int]]) -> Dict[str, Dict[str, int]]:
-    """
-    For a nested dict-like matrix {from: {to: value}}, if keys look like
-    coordinate strings, normalize them with clean_coord_str().
-    """
-    out: Dict[str, Dict[str, int]] = {}
-    for from_k, inner in d.items():
-        new_from = clean_coord_str(from_k) if _is_coord_string(from_k) else from_k
-        out[new_from] = {}
-        for to_k, v in inner.items():
-            new_to = clean_coord_str(to_k) if _is_coord_string(to_k) else to_k
-            out[new_from][new_to] = v
-    return out
-# -------------------------------------------------
-
-# ---------- NEW: robust normalization + parser ----------
-def _normalize_aw(s: str) -> str:
-    """Normalize different dash types and spaces; keep content intact."""
-    if not isinstance(s, str):
-        return ""
-    s = (s.replace("\u2012", "-")
-           .replace("\u2013", "-")
-           .replace("\u2014", "-")
-           .replace("\u2212", "-"))
-    s = s.replace("\xa0", " ")
-    s = " ".join(s.split())
-    return s
-
-def parse_arrival_window(yy: str) -> Tuple[Optional[str], Optional[str]]:
-    """
-    Accept formats like:
-      - '11.03.2025 08:00-10:00'
-      - '11.03.2025 08:00:00-10:00:00'
-      - '11.03.2025 10:00:00–12:00:00' (en dash)
-      - '11.03.2025 15:00:0017:00:00' (no separator)
-    Returns (start_iso, end_iso) in 'YYYY-MM-DDTHH:MM:SS'
-    """
-    if not isinstance(yy, str):
-        return None, None
-    s = _normalize_aw(yy)
-
-    m_date = re.search(r"(\d{1,2}[./-]\d{1,2}[./-]\d{2,4})", s)
-    if not m_date:
-        return None, None
-    date_part = m_date.group(1)
-    try:
-        d = dtparser.parse(date_part, dayfirst=True).date()
-    except Exception:
-        return None, None
-
-    times = re.findall(r"\b(\d{1,2}:\d{2}(?::\d{2})?)\b", s)
-    if len(times) < 2:
-        packed = re.search(r"(\d{1,2}:\d{2}(?::\d{2})?)(\d{1,2}:\d{2}(?::\d{2})?)", s)
-        if packed:
-            times = [packed.group(1), packed.group(2)]
-        else:
-            return None, None
-
-    t_start, t_end = times[0], times[1]
-
-    def to_iso(time_str: str) -> Optional[str]:
-        try:
-            ts = dtparser.parse(time_str).time()
-            return f"{d.isoformat()}T{ts.strftime('%H:%M:%S')}"
-        except Exception:
-            return None
-
-    return to_iso(t_start), to_iso(t_end)
-# -------------------------------------------------------
-
-def build_business_unit_id(call_type: str, product_group: str, competency_group: str) -> str:
-    call_type = normalize_text(call_type)
-    product_group = normalize_text(product_group)
-    competency_group = normalize_text(competency_group)
-    return f"{call_type}|{product_group}|{competency_group}"
-
 def first_nonempty(series: pd.Series) -> Optional[str]:
     for v in series:
         if isinstance(v, str) and v.strip():
             return v.strip()
     return None
 
-def numeric_or_none(x) -> Optional[float]:
-    try:
-        v = float(str(x).replace(",", "."))
-        return v
-    except Exception:
-        return None
-
 def main():
-    # --- Load Excel ---
-    xls = pd.ExcelFile(INPUT_XLSX, engine="openpyxl")
-    rapor = pd.read_excel(xls, sheet_name=SHEET_RAPOR, dtype=str)
-    tech = pd.read_excel(xls, sheet_name=SHEET_TECH, dtype=str)
-    ugcts = pd.read_excel(xls, sheet_name=SHEET_UGCTS, dtype=str)
-
-    exact_dur, wildcard_dur = build_duration_lookups(ugcts)
-
-    # --- Load matrices ---
-    with open(DISTANCE_JSON, "r", encoding="utf-8") as f:
-        distance_obj = json.load(f)
-    with open(DURATION_JSON, "r", encoding="utf-8") as f:
-        duration_obj = json.load(f)
+    # --- Load Excel (parsed sheets are cached by workbook content, sheet_cache.py) ---
+    sheets = read_sheets(INPUT_XLSX, [SHEET_RAPOR, SHEET_TECH, SHEET_UGCTS], dtype=str)
+    rapor, tech, ugcts = sheets[SHEET_RAPOR], sheets[SHEET_TECH], sheets[SHEET_UGCTS]
 
     # ----------------- OPTIONS -----------------
     options = {
@@ -275,102 +73,34 @@ def main():
         "lunch_break": None,
     }
     # Normalize office coordinate
-    options["office"]["coordinate"] = clean_coord_str(options["office"]["coordinate"])
+    options["office"]["coordinate"] = canonical_coord(options["office"]["coordinate"])
     ph_start = options["planning_horizon"]["start"]
     ph_end = options["planning_horizon"]["end"]
     office_coord = options["office"]["coordinate"]
     office_zone = options["office"]["zone"]
 
-    # --- Appointments (diagnostic + tolerant) ---
-    appointments: List[Dict] = []
-    dropped = []  # collect reasons
-
+    # --- Appointments (column-oriented, appointment_builder.py) ---
     # knobs: choose behavior instead of skipping
     KEEP_IF_NO_DURATION = False          # if True -> default to 60 min when duration missing
     DEFAULT_DURATION_MIN = 60
     KEEP_IF_NO_WINDOW = False            # if True -> use planning horizon as arrival window when parsing fails
     USE_PH_AS_JOB_TIMES_IF_NO_WINDOW = False  # or also use PH as job start/end
 
-    for idx, r in rapor.iterrows():
-        row_id = str(r.get("Teyit No") or f"row{idx}")
-
-        # --- coordinate / zone ---
-        loc_coord = parse_coord_latlon_to_lonlat_str(r.get("Müşteri Koordinat"))
-        zone_id = normalize_text(r.get("Müşteri İlçe"))
-        if loc_coord:
-            loc_coord = clean_coord_str(loc_coord)  # NEW: trim trailing zeros
-
-        # --- arrival window ---
-        start_iso, end_iso = parse_arrival_window(r.get("Randevu Tarih saat"))
-        if (not start_iso or not end_iso):
-            if KEEP_IF_NO_WINDOW:
-                start_iso = options["planning_horizon"]["start"]
-                end_iso   = options["planning_horizon"]["end"]
-            else:
-                dropped.append((row_id, "no_arrival_window"))
-                continue
-
-        # --- duration ---
-        call_type = normalize_text(r.get("Çağrı Tipi"))
-        product_group = normalize_text(r.get("Ürün grubu adı"))
-        duration_min = get_appt_duration_minutes(call_type, product_group, exact_dur, wildcard_dur)
-
-        if duration_min is None:
-            if KEEP_IF_NO_DURATION:
-                duration_min = DEFAULT_DURATION_MIN
-            else:
-                dropped.append((row_id, "no_duration_mapping"))
-                continue
-
-        # --- build times (be robust) ---
-        try:
-            start_dt = pd.to_datetime(start_iso)
-            DURATION_DIVISOR = 1
-            adjusted_minutes = float(duration_min) / DURATION_DIVISOR
-            if not (adjusted_minutes > 0 and adjusted_minutes < 24 * 60 * 30):
-                raise ValueError(f"adjusted_minutes out of range: {adjusted_minutes}")
-
-            if USE_PH_AS_JOB_TIMES_IF_NO_WINDOW and not parse_arrival_window(r.get("Randevu Tarih saat"))[0]:
-                job_start_ref = _to_z_no_ms(pd.to_datetime(options["planning_horizon"]["start"]))
-                job_end_ref   = _to_z_no_ms(pd.to_datetime(options["planning_horizon"]["end"]))
-            else:
-                job_start_ref = _to_z_no_ms(start_dt)
-                job_end_ref   = _to_z_no_ms(start_dt + pd.to_timedelta(adjusted_minutes, unit="m"))
-
-            arrival_start_ref = _to_z_ms(start_dt)
-            arrival_end_ref   = _to_z_ms(pd.to_datetime(end_iso))
-        except Exception as e:
-            dropped.append((row_id, f"time_build_error:{e}"))
-            continue
-
-        appt_id = normalize_text(r.get("Teyit No")) or row_id
-        appt_name = normalize_text(r.get("Müşteri no"))
-        bu_id = build_business_unit_id(
-            r.get("Çağrı Tipi"),
-            r.get("Ürün grubu adı"),
-            r.get("Yetkinlik grubu"),
-        )
-
-        appointments.append(
-            {
-                "location": {"coordinate": loc_coord, "zone": zone_id or None},
-                "arrival_window": {"start": arrival_start_ref, "end": arrival_end_ref},
-                "eligible_technicians": [],
-                "id": appt_id,
-                "start": job_start_ref,
-                "end": job_end_ref,
-                "technician_ids": [],
-                "priority": 1,
-                "name": appt_name,
-                "business_unit_id": bu_id,
-                "optimize_for": "score",
-                "score_type": "average_revenue",
-            }
-        )
+    appointments, dropped = build_appointments(
+        rapor,
+        ugcts,
+        options["planning_horizon"],
+        job_times=JOB_TIMES_FROM_WINDOW,
+        keep_if_no_window=KEEP_IF_NO_WINDOW,
+        keep_if_no_duration=KEEP_IF_NO_DURATION,
+        default_duration_min=DEFAULT_DURATION_MIN,
+        ph_job_times_if_no_window=USE_PH_AS_JOB_TIMES_IF_NO_WINDOW,
+        coord_map=load_snap_mapping(SNAP_MAPPING_CSV) if SNAP_MAPPING_CSV else None,
+    )
 
-    if dropped:
+    if len(dropped):
         print("⚠️ Skipped rows:", len(dropped))
-        for rid, reason in dropped[:10]:
+        for rid, reason in dropped.head(10).itertuples(index=False):
             print(f"  - {rid}: {reason}")
 
     # --- Zones ---
@@ -403,93 +133,8 @@ def main():
             }
         )
 
-    # --- Business Units from RAPOR ---
-    bu_records = {}
-    for _, r in rapor.iterrows():
-        call_type = normalize_text(r.get("Çağrı Tipi"))
-        product_group = normalize_text(r.get("Ürün grubu adı"))
-        competency = normalize_text(r.get("Yetkinlik grubu"))
-        bu_id = build_business_unit_id(call_type, product_group, competency)
-        if bu_id not in bu_records:
-            bu_records[bu_id] = {
-                "id": bu_id,
-                "call_type": call_type,
-                "product_group": product_group,
-                "competency": competency,
-                "buffer_slot_count": 0,
-                "buffer_slot_length": None,
-                "technician_ids": set(),
-            }
-
-    # --- buffer_slot_length rules ---
-    if not ugcts.empty:
-        ct_col = "Çağrı tipi"
-        pg_col = "Ürün grubu"
-        dur_col = "Süre"
-
-        wildcard_rows = ugcts[ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-        exact_rows = ugcts[~ugcts[pg_col].astype(str).str.contains(r"\*", na=False)]
-
-        for _, row in wildcard_rows.iterrows():
-            a_ct = normalize_text(row.get(ct_col))
-            c_len = numeric_or_none(row.get(dur_col))
-            if c_len is None:
-                continue
-            for bu in bu_records.values():
-                if bu["call_type"] == a_ct and bu["buffer_slot_length"] is None:
-                    bu["buffer_slot_length"] = c_len
-
-        for _, row in exact_rows.iterrows():
-            a_ct = normalize_text(row.get(ct_col))
-            b_pg = normalize_text(row.get(pg_col))
-            c_len = numeric_or_none(row.get(dur_col))
-            if c_len is None:
-                continue
-            for bu in bu_records.values():
-                if bu["call_type"] == a_ct and bu["product_group"] == b_pg:
-                    bu["buffer_slot_length"] = c_len
-
-    # --- technician_ids rules (respect wildcards, normalize text) ---
-    t_id_col = "Teknisyen no"
-    t_pg_col = "Çağrı Tanım"        # CALL TYPE name
-    t_comp_col = "Yetkinlik tanım"  # competency/product family
-
-    if not tech.empty:
-        for _, row in tech.iterrows():
-            tid = normalize_text(row.get(t_id_col))
-            if not tid:
-                continue
-            c_calltype = normalize_text(row.get(t_pg_col))
-            d_comp = normalize_text(row.get(t_comp_col))
-
-            if "*" in d_comp:
-                # wildcard → all BUs with this call type
-                for bu in bu_records.values():
-                    if bu["call_type"] == c_calltype:
-                        bu["technician_ids"].add(tid)
-            else:
-                # exact match → call type + competency must both match
-                for bu in bu_records.values():
-                    if bu["call_type"] == c_calltype and bu["competency"] == d_comp:
-                        bu["technician_ids"].add(tid)
-
-    # Materialize business_units list
-    business_units = []
-    for bu in sorted(bu_records.values(), key=lambda x: x["id"]):
-        buf_len = bu["buffer_slot_length"]
-        try:
-            buf_len = int(float(buf_len)) if buf_len is not None else 0
-        except Exception:
-            buf_len = 0
-
-        business_units.append(
-            {
-                "id": bu["id"],
-                "buffer_slot_count": 0,
-                "buffer_slot_length": buf_len,
-                "technician_ids": sorted(bu["technician_ids"]),
-            }
-        )
+    # --- Business Units from RAPOR (+ buffer slot and technician rules, business_units.py) ---
+    business_units = build_business_units(rapor, tech, ugcts)
 
     # --- Fill eligible_technicians for each appointment from its BU ---
     bu_to_tech = {b["id"]: b["technician_ids"] for b in business_units}
@@ -497,41 +142,34 @@ def main():
         techs = bu_to_tech.get(appt["business_unit_id"], [])
         appt["eligible_technicians"] = [{"id": tid, "score": 1} for tid in techs]
 
-    # --- Matrix (convert all values to int) ---
-    def convert_matrix_values_to_int(matrix_obj: Dict) -> Dict:
-        result = {}
-        for from_id, inner in matrix_obj.items():
-            result[from_id] = {}
-            for to_id, val in inner.items():
-                try:
-                    result[from_id][to_id] = int(float(val))
-                except Exception:
-                    result[from_id][to_id] = 0
-        return result
-
-    def convert_matrix_values_to_int_duration(matrix_obj: Dict) -> Dict:
-        result = {}
-        for from_id, inner in matrix_obj.items():
-            result[from_id] = {}
-            for to_id, val in inner.items():
-                try:
-                    if (val == 0 or val is None) and from_id != to_id:
-                        result[from_id][to_id] = 0
-                    result[from_id][to_id] = int(float(val))
-                except Exception:
-                    result[from_id][to_id] = 0
-        return result
-
-    # --- NEW: normalize coord-looking keys in raw matrices BEFORE int conversion ---
-    raw_duration = duration_obj.get("duration", {})
-    raw_distance = distance_obj.get("distance", {})
+    # --- Matrix (memory-mapped store, values converted to int row by row) ---
+    store = load_matrix_store(MATRIX_STORE)
+    if PRUNE_MATRIX:
+        total_locations = len(store)
+        store, not_in_matrix = store.subset(board_coordinates(appointments, technicians, options))
+        print(f"✂️ Pruned {pruning_summary(len(store), total_locations)}")
+        if not_in_matrix:
+            print(f"⚠️ {len(not_in_matrix)} board coordinate(s) not in the matrix store: {not_in_matrix[:5]}")
+
+    if DURATION_SLOT:
+        store = SlotDurations().apply_to(store, DURATION_SLOT)
+        print(f"⏱️ Durations for slot {DURATION_SLOT}")
+
+    if MATRIX_MODE != "dense":
+        store = sparsify_store(
+            store,
+            radius_m=options["distance_limit_between_jobs"] if MATRIX_MODE == "radius" else None,
+            k=KNN_K if MATRIX_MODE == "knn" else None,
+            keep_full=depot_coordinates(technicians, options),
+        )
+        print(f"✂️ {sparsity_summary(store)}")
 
-    raw_duration = remap_coord_keys_if_any(raw_duration)
-    raw_distance = remap_coord_keys_if_any(raw_distance)
+    def _int_row(i: int, row: np.ndarray, cols: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.trunc(np.nan_to_num(row, nan=0.0)).astype(np.int64)
 
     matrix = {
-        "duration": convert_matrix_values_to_int_duration(raw_duration),
-        "distance": convert_matrix_values_to_int(raw_distance),
+        "duration": StreamedMapping(store.iter_rows("duration", _int_row)),
+        "distance": StreamedMapping(store.iter_rows("distance", _int_row)),
     }
 
     # --- Final payload ---
@@ -545,7 +183,9 @@ def main():
         "board_id": "",
     }
 
-    Path(OUTPUT_JSON).write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    write_json(OUTPUT_JSON, payload, compact=COMPACT_JSON)
+    save_eligibility(eligibility_path(OUTPUT_JSON),
+                     EligibilityIndex.from_business_units(business_units, [t["id"] for t in technicians]))
     print(
         f"✅ Wrote {OUTPUT_JSON} with "
         f"{len(appointments)} appointments, "
@@ -553,6 +193,7 @@ def main():
         f"{len(zones)} zones, "
         f"{len(business_units)} business units."
     )
+    print(f"   Parse caches: {parse_cache_summary()}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Technician x business-unit eligibility index.
+
+A boolean matrix (technicians x BUs) with the id -> row / column maps, built
+once from the business units' technician_ids (data_parser.py) or from the
+appointments' eligible_technicians (reports, when no index file exists).
+Queries are array operations instead of list scans:
+
+  - columns(bu_ids)          -> BU column per appointment (-1 = unknown BU),
+  - appointment_masks(...)   -> (appointments x technicians) eligibility rows,
+  - counts()                 -> eligible technicians per BU,
+  - shared(bu_a, bu_b)       -> technicians eligible for both.
+
+Saved next to the dataloader as <dataloader>.eligibility.npz (np.packbits,
+one bit per technician/BU pair):
+
+  technicians (T,), business_units (B,), bits (T x ceil(B/8)) uint8
+"""
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+
+def eligibility_path(dataloader_json: str) -> Path:
+    p = Path(dataloader_json)
+    return p.with_name(p.stem + ".eligibility.npz")
+
+
+class EligibilityIndex:
+    """Technicians x BUs boolean matrix with id maps."""
+
+    def __init__(self, technician_ids: Sequence[str], bu_ids: Sequence[str], matrix: np.ndarray):
+        self.technician_ids = [str(t) for t in technician_ids]
+        self.bu_ids = [str(b) for b in bu_ids]
+        matrix = np.asarray(matrix, dtype=bool)
+        if matrix.shape != (len(self.technician_ids), len(self.bu_ids)):
+            raise ValueError(f"Eligibility matrix shape {matrix.shape} does not match "
+                             f"{len(self.technician_ids)} technicians x {len(self.bu_ids)} BUs")
+        self.matrix = matrix
+        self.tech_pos: Dict[str, int] = {t: i for i, t in enumerate(self.technician_ids)}
+        self.bu_pos: Dict[str, int] = {b: j for j, b in enumerate(self.bu_ids)}
+
+    @classmethod
+    def from_pairs(cls, pairs: Dict[str, Iterable[str]],
+                   technician_ids: Optional[Iterable[str]] = None) -> "EligibilityIndex":
+        """{bu_id: technician ids}; technicians missing from 'technician_ids' are appended."""
+        techs: Dict[str, int] = {}
+        for t in technician_ids or []:
+            techs.setdefault(str(t), len(techs))
+        rows: List[int] = []
+        cols: List[int] = []
+        for j, ids in enumerate(pairs.values()):
+            for t in ids:
+                rows.append(techs.setdefault(str(t), len(techs)))
+                cols.append(j)
+        matrix = np.zeros((len(techs), len(pairs)), dtype=bool)
+        matrix[rows, cols] = True
+        return cls(list(techs), list(pairs), matrix)
+
+    @classmethod
+    def from_business_units(cls, business_units: Iterable[Dict],
+                            technician_ids: Optional[Iterable[str]] = None) -> "EligibilityIndex":
+        return cls.from_pairs({str(b["id"]): b.get("technician_ids") or [] for b in business_units},
+                              technician_ids)
+
+    @classmethod
+    def from_appointments(cls, appointments: Iterable[Dict]) -> "EligibilityIndex":
+        """Union of the appointments' eligible_technicians per business_unit_id."""
+        pairs: Dict[str, set] = {}
+        for ap in appointments:
+            ids = pairs.setdefault(str(ap.get("business_unit_id") or ""), set())
+            ids.update(str(x.get("id")) for x in (ap.get("eligible_technicians") or []) if x.get("id") is not None)
+        return cls.from_pairs({b: sorted(ids) for b, ids in pairs.items()})
+
+    # --- queries ---
+    def columns(self, bu_ids: Iterable[str]) -> np.ndarray:
+        return np.fromiter((self.bu_pos.get(str(b), -1) for b in bu_ids), dtype=np.int64)
+
+    def appointment_masks(self, bu_ids: Iterable[str]) -> np.ndarray:
+        """(len(bu_ids) x technicians) bool; all False for unknown BUs."""
+        cols = self.columns(bu_ids)
+        out = np.zeros((len(cols), len(self.technician_ids)), dtype=bool)
+        ok = cols >= 0
+        out[ok] = self.matrix[:, cols[ok]].T
+        return out
+
+    def counts(self) -> np.ndarray:
+        """Eligible technicians per BU (column order of bu_ids)."""
+        return self.matrix.sum(axis=0)
+
+    def technicians_of(self, bu_id: str) -> List[str]:
+        j = self.bu_pos.get(str(bu_id))
+        if j is None:
+            return []
+        return [self.technician_ids[i] for i in np.flatnonzero(self.matrix[:, j])]
+
+    def shared(self, bu_a: str, bu_b: str) -> List[str]:
+        cols = self.columns([bu_a, bu_b])
+        if (cols < 0).any():
+            return []
+        both = self.matrix[:, cols[0]] & self.matrix[:, cols[1]]
+        return [self.technician_ids[i] for i in np.flatnonzero(both)]
+
+
+def save_eligibility(path: Path, index: EligibilityIndex) -> None:
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    np.savez_compressed(path,
+                        technicians=np.array(index.technician_ids, dtype=str),
+                        business_units=np.array(index.bu_ids, dtype=str),
+                        bits=np.packbits(index.matrix, axis=1))
+
+
+def load_eligibility(path: Path) -> EligibilityIndex:
+    with np.load(path) as z:
+        techs = z["technicians"].tolist()
+        bus = z["business_units"].tolist()
+        matrix = np.unpackbits(z["bits"], axis=1, count=len(bus)).astype(bool)
+    return EligibilityIndex(techs, bus, matrix)
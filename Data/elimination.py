@@ -15,9 +15,14 @@ import json
 from pathlib import Path
 from typing import Any, Dict, List
 
+from board_matrix import board_coordinates, prune_nested_matrix, pruning_summary
+from json_stream import write_json
+
 # -------------------- CONFIG (paths kod içinde) --------------------
 INPUT_DATALOADER  = Path("./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/dataloader-10_03_2025.json")
 OUTPUT_DATALOADER = INPUT_DATALOADER.with_name(INPUT_DATALOADER.stem + "_pruned.json")
+COMPACT_JSON = True   # False -> indent=2
+PRUNE_MATRIX = True   # kalan randevuların, ofisin ve teknisyen evlerinin dışındaki matris satırlarını at
 # ------------------------------------------------------------------
 
 # Zorunlu silinecek teyit numaraları:
@@ -78,7 +83,11 @@ def main():
 
     # Yaz
     data["appointments"] = kept_appts
-    OUTPUT_DATALOADER.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+    if PRUNE_MATRIX and data.get("matrix"):
+        coords = board_coordinates(kept_appts, data.get("technicians") or [], data.get("options"))
+        data["matrix"], kept_locs, total_locs = prune_nested_matrix(data["matrix"], coords)
+        print(f"✂️ Pruned {pruning_summary(kept_locs, total_locs)}")
+    write_json(OUTPUT_DATALOADER, data, compact=COMPACT_JSON)
 
     # Log
     print("✅ Pruning complete")
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Offline distance/duration matrix generator (no routing service).
+
+  distance = great-circle (haversine) distance * ROAD_FACTOR      [m]
+  duration = distance / speed                                     [s]
+
+The speed comes from a configurable profile:
+  - SPEED_BANDS_KMH: speed by trip length (short urban hops are slower than
+    intercity trips); this is the "driving_speed_dynamic" model,
+  - TIME_OF_DAY_FACTORS: speed multiplier per 2-hour slot (time_slots.py),
+    DEPARTURE_SLOT picks one (None -> 1.0); slot_matrix.py applies them to a store.
+
+Everything is computed as NumPy arrays in row chunks, so a 5000-location
+matrix takes seconds. The result is written in the matrix store format
+(matrix_store.py); geo_block_source() plugs the same model into
+extend_matrix_store() for incremental updates.
+
+Coordinates come from appointments.txt (the routing tool's input), or are
+drawn uniformly from SYNTHETIC_BBOX when SYNTHETIC_N is set (stress tests).
+"""
+
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from coord_registry import CoordRegistry
+from matrix_store import STORE_DTYPE, BlockFn, save_matrix_store
+from time_slots import SLOT_SPEED_FACTORS
+
+# --- CONFIG ---
+INPUT_COORDS_TXT = "appointments.txt"   # "lonvlat"<TAB>lon<TAB>lat per line
+STORE_PREFIX = "matrix_store_geo"
+
+SYNTHETIC_N: Optional[int] = None       # e.g. 5000 -> random points instead of INPUT_COORDS_TXT
+SYNTHETIC_BBOX = (27.0, 38.4, 28.3, 39.2)   # lon_min, lat_min, lon_max, lat_max (Manisa)
+SYNTHETIC_SEED = 42
+
+ROAD_FACTOR = 1.3                        # road distance / great-circle distance
+SPEED_BANDS_KMH: List[Tuple[float, float]] = [
+    (2_000, 25.0),                       # trip length up to 2 km -> 25 km/h
+    (10_000, 40.0),
+    (30_000, 60.0),
+    (math.inf, 80.0),
+]
+TIME_OF_DAY_FACTORS: Dict[str, float] = dict(SLOT_SPEED_FACTORS)   # speed multipliers per slot
+DEPARTURE_SLOT: Optional[str] = None    # one of TIME_OF_DAY_FACTORS, None -> factor 1.0
+CHUNK_ROWS = 1024
+# ---------------
+
+EARTH_RADIUS_M = 6_371_008.8
+
+
+def haversine_m(lonlat_a: np.ndarray, lonlat_b: np.ndarray) -> np.ndarray:
+    """(len(a) x len(b)) great-circle distances in meters; inputs are (n, 2) [lon, lat] degrees."""
+    a = np.radians(np.asarray(lonlat_a, dtype=np.float64))
+    b = np.radians(np.asarray(lonlat_b, dtype=np.float64))
+    dlon = b[None, :, 0] - a[:, None, 0]
+    dlat = b[None, :, 1] - a[:, None, 1]
+    h = np.sin(dlat / 2.0) ** 2 + np.cos(a[:, None, 1]) * np.cos(b[None, :, 1]) * np.sin(dlon / 2.0) ** 2
+    return 2.0 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def speed_mps(distance_m: np.ndarray,
+              bands: Sequence[Tuple[float, float]] = SPEED_BANDS_KMH,
+              factor: float = 1.0) -> np.ndarray:
+    """Speed (m/s) for each trip length according to the band profile."""
+    limits = np.array([b[0] for b in bands], dtype=np.float64)
+    speeds = np.array([b[1] for b in bands], dtype=np.float64) / 3.6 * factor
+    idx = np.searchsorted(limits, distance_m, side="left")
+    return speeds[np.minimum(idx, len(speeds) - 1)]
+
+
+def slot_factor(slot: Optional[str]) -> float:
+    if slot is None:
+        return 1.0
+    if slot not in TIME_OF_DAY_FACTORS:
+        raise ValueError(f"Unknown slot {slot!r}; expected one of {list(TIME_OF_DAY_FACTORS)}")
+    return TIME_OF_DAY_FACTORS[slot]
+
+
+def geo_block(lonlat_a: np.ndarray, lonlat_b: np.ndarray,
+              road_factor: float = ROAD_FACTOR,
+              bands: Sequence[Tuple[float, float]] = SPEED_BANDS_KMH,
+              factor: float = 1.0) -> Tuple[np.ndarray, np.ndarray]:
+    """(distance m, duration s) for all pairs of a x b."""
+    dist = haversine_m(lonlat_a, lonlat_b) * road_factor
+    dur = dist / speed_mps(dist, bands, factor)
+    return dist, dur
+
+
+def geo_matrices(lonlat: np.ndarray, slot: Optional[str] = DEPARTURE_SLOT,
+                 chunk_rows: int = CHUNK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+    """Full (N x N) float32 distance/duration matrices, computed in row chunks."""
+    n = len(lonlat)
+    factor = slot_factor(slot)
+    distance = np.empty((n, n), dtype=STORE_DTYPE)
+    duration = np.empty((n, n), dtype=STORE_DTYPE)
+    for s in range(0, n, chunk_rows):
+        e = min(n, s + chunk_rows)
+        distance[s:e], duration[s:e] = geo_block(lonlat[s:e], lonlat, factor=factor)
+    np.fill_diagonal(distance, 0.0)
+    np.fill_diagonal(duration, 0.0)
+    return distance, duration
+
+
+def geo_block_source(slot: Optional[str] = DEPARTURE_SLOT) -> BlockFn:
+    """compute_block() for extend_matrix_store() using the same model."""
+    factor = slot_factor(slot)
+
+    def compute_block(origins: List[str], destinations: List[str]):
+        a = CoordRegistry(origins).lonlat()
+        b = CoordRegistry(destinations).lonlat()
+        return geo_block(a, b, factor=factor)
+
+    return compute_block
+
+
+def read_coords_txt(path: str) -> List[str]:
+    """Canonical keys from an appointments.txt-style file (first column "lonvlat")."""
+    reg = CoordRegistry()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                reg.add(line.split("\t", 1)[0])
+    return list(reg.keys)
+
+
+def synthetic_coords(n: int, bbox=SYNTHETIC_BBOX, seed: int = SYNTHETIC_SEED) -> List[str]:
+    rng = np.random.default_rng(seed)
+    lon = rng.uniform(bbox[0], bbox[2], n)
+    lat = rng.uniform(bbox[1], bbox[3], n)
+    reg = CoordRegistry(f"{x:.6f},{y:.6f}" for x, y in zip(lon, lat))
+    return list(reg.keys)
+
+
+def main():
+    keys = synthetic_coords(SYNTHETIC_N) if SYNTHETIC_N else read_coords_txt(INPUT_COORDS_TXT)
+    reg = CoordRegistry(keys)
+    distance, duration = geo_matrices(reg.lonlat())
+    save_matrix_store(STORE_PREFIX, reg.keys, distance, duration)
+    print(f"✅ Wrote {STORE_PREFIX}.*.npy ({len(reg)} locations, slot={DEPARTURE_SLOT or 'all-day'})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming JSON writer for dataloader payloads.
+
+json.dumps(payload, indent=2) builds the whole document as one string before it
+is written; for payloads with a full matrix that is several times the payload
+size in memory. write_json() encodes the top levels of the document piece by
+piece straight into the file handle instead:
+
+  - dicts and lists down to 'stream_depth' are written item by item,
+  - anything deeper (one appointment, one matrix row, ...) is encoded in one go,
+  - StreamedMapping / generators are consumed lazily, so callers can produce
+    matrix rows or appointments on the fly without holding them all.
+
+compact=True  -> no indentation, (",", ":") separators (smallest body for the WebApi)
+compact=False -> same text as json.dumps(obj, ensure_ascii=False, indent=2)
+
+file_sha256() is the content hash used to pin files (overlay bases, sheet cache keys).
+"""
+
+import hashlib
+import io
+import json
+import os
+from pathlib import Path
+from types import GeneratorType
+from typing import Any, Dict, Iterable, Iterator, TextIO, Tuple
+
+DEFAULT_STREAM_DEPTH = 3   # payload -> "matrix" -> "duration" -> rows
+HASH_CHUNK = 1 << 20
+_DIGESTS: Dict[tuple, str] = {}   # (path, size, mtime_ns) -> digest, per process
+
+
+class StreamedMapping:
+    """A JSON object whose (key, value) pairs are produced lazily by an iterable."""
+
+    def __init__(self, items: Iterable[Tuple[str, Any]]):
+        self._items = items
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        return iter(self._items)
+
+
+class JsonStreamWriter:
+    def __init__(self, f: TextIO, compact: bool = True, indent: int = 2,
+                 stream_depth: int = DEFAULT_STREAM_DEPTH):
+        self.f = f
+        self.compact = compact
+        self.indent = None if compact else indent
+        self.stream_depth = stream_depth
+        self._key_sep = ":" if compact else ": "
+
+    def _dumps(self, obj: Any) -> str:
+        return json.dumps(
+            obj,
+            ensure_ascii=False,
+            indent=self.indent,
+            separators=(",", self._key_sep),
+        )
+
+    def _newline(self, level: int) -> str:
+        return "" if self.compact else "\n" + " " * (self.indent * level)
+
+    def _write_leaf(self, obj: Any, level: int) -> None:
+        text = self._dumps(obj)
+        if not self.compact and "\n" in text:
+            text = text.replace("\n", self._newline(level))
+        self.f.write(text)
+
+    def write(self, obj: Any, level: int = 0) -> None:
+        is_mapping = isinstance(obj, (dict, StreamedMapping))
+        is_sequence = isinstance(obj, (list, tuple, GeneratorType))
+        if level >= self.stream_depth or not (is_mapping or is_sequence):
+            if isinstance(obj, GeneratorType):
+                obj = list(obj)
+            self._write_leaf(obj, level)
+            return
+
+        open_ch, close_ch = ("{", "}") if is_mapping else ("[", "]")
+        items = obj.items() if is_mapping else obj
+        self.f.write(open_ch)
+        first = True
+        for item in items:
+            if not first:
+                self.f.write(",")
+            self.f.write(self._newline(level + 1))
+            if is_mapping:
+                key, value = item
+                self.f.write(json.dumps(str(key), ensure_ascii=False) + self._key_sep)
+            else:
+                value = item
+            self.write(value, level + 1)
+            first = False
+        if not first:
+            self.f.write(self._newline(level))
+        self.f.write(close_ch)
+
+
+def write_json(path: str, obj: Any, compact: bool = True, indent: int = 2,
+               stream_depth: int = DEFAULT_STREAM_DEPTH) -> None:
+    """Stream 'obj' into 'path' (UTF-8), creating parent folders as needed."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    with open(p, "w", encoding="utf-8") as f:
+        JsonStreamWriter(f, compact=compact, indent=indent, stream_depth=stream_depth).write(obj)
+
+
+def file_sha256(path: str) -> str:
+    """sha256 of the file contents (hashed once per process per file version)."""
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if memo_key not in _DIGESTS:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        _DIGESTS[memo_key] = h.hexdigest()
+    return _DIGESTS[memo_key]
+
+
+def dumps_json(obj: Any, compact: bool = True, indent: int = 2,
+               stream_depth: int = DEFAULT_STREAM_DEPTH) -> str:
+    """Same text as write_json(), as a string (request bodies)."""
+    buf = io.StringIO()
+    JsonStreamWriter(buf, compact=compact, indent=indent, stream_depth=stream_depth).write(obj)
+    return buf.getvalue()
@@ -18,8 +18,15 @@ from datetime import datetime, timezone
 from pathlib import Path
 from typing import Any, Dict, List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
 from openpyxl.styles import Font
+
+from coord_registry import CoordRegistry
+from eligibility import EligibilityIndex, eligibility_path, load_eligibility
+from matrix_store import MatrixStore, load_matrix_store
+from scenario_overlay import load_scenario
+from time_slots import SLOT_DEFS, SLOT_LABELS
 import math
 from typing import Optional
  
@@ -29,30 +36,21 @@ import argparse
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--input_result", required=True, help="Path to result JSON")
-parser.add_argument("--input_dataloader", required=True, help="Path to dataloader JSON")
+parser.add_argument("--input_dataloader", required=True, help="Path to dataloader JSON (or <name>.overlay.json, scenario_overlay.py)")
 parser.add_argument("--output_xlsx", required=False, help="Path to output XLSX (optional)")
+parser.add_argument("--matrix_store", required=False,
+                    help="Prefix of a binary matrix store (matrix_store.py); used instead of the dataloader matrix")
 args = parser.parse_args()
 
 INPUT_RESULT_JSON = args.input_result
 INPUT_DATALOADER  = args.input_dataloader
 OUTPUT_XLSX       = args.output_xlsx or Path(INPUT_RESULT_JSON).with_suffix(".xlsx")
+MATRIX_STORE      = args.matrix_store
 
 SLOT_CAPACITY_MIN  = 120  # 2 hours per slot
 # ------------------------
 
 
-SLOT_DEFS: List[Tuple[str, int, int]] = [
-    ("08:00-10:00", 8, 10),
-    ("10:00-12:00", 10, 12),
-    ("13:00-15:00", 13, 15),
-    ("15:00-17:00", 15, 17),
-    ("17:00-19:00", 17, 19),
-    ("19:00-21:00", 19, 21),
-    ("21:00-23:00", 21, 23),
-]
-SLOT_LABELS = [s[0] for s in SLOT_DEFS]
-
-
 # ----------------- Common helpers -----------------
 def _to_list(v):
     return v if isinstance(v, list) else ([] if v is None else [v])
@@ -96,78 +94,33 @@ def overlap_minutes(a_start: datetime, a_end: datetime, b_start: datetime, b_end
     return max(0, int(round(delta)))
 
 
-# ----------------- Matrix helpers (NEW) -----------------
-def _norm_coord_str(coord: Optional[str]) -> Optional[str]:
-    """Normalize 'lon,lat'/'lon;lat' → 'lon,lat' trimmed; return None if invalid/missing."""
-    if not isinstance(coord, str):
-        return None
-    s = coord.strip().replace(";", ",")
-    if "," not in s:
-        return None
-    return s
-
-
-def _reformat_coord_str(coord: Optional[str], nd: int = 6) -> Optional[str]:
-    """Try to parse and reformat to fixed decimals to improve matrix key matching."""
-    s = _norm_coord_str(coord)
-    if s is None:
-        return None
-    try:
-        a, b = [p.strip() for p in s.split(",", 1)]
-        lon = float(a)
-        lat = float(b)
-        return f"{lon:.{nd}f},{lat:.{nd}f}"
-    except Exception:
-        return s  # fall back to original normalized
-
-
-def _matrix_distance_m(matrix_distance: Dict[str, Dict[str, Any]],
-                       origin_coord: Optional[str],
-                       dest_coord: Optional[str]) -> int:
+# ----------------- Matrix helpers -----------------
+def distance_array_from_dataloader(matrix_distance: Dict[str, Dict[str, Any]]) -> Tuple[CoordRegistry, np.ndarray]:
     """
-    Lookup distance in meters from matrix_distance[origin][dest].
-    Tries exact normalized key, then a 6-decimal reformatted key.
-    Returns 0 if any key missing.
+    Build a dense distance array (row/column = CoordRegistry id) from the
+    dataloader's {from: {to: meters}} matrix, once. Missing cells are 0.
     """
-    if not matrix_distance:
-        return 0
-    o1 = _norm_coord_str(origin_coord)
-    d1 = _norm_coord_str(dest_coord)
-    if not o1 or not d1:
-        return 0
-
-    # direct
-    row = matrix_distance.get(o1)
-    if isinstance(row, dict) and d1 in row:
-        try:
-            return int(row[d1])
-        except Exception:
-            return 0
-
-    # try reformatted keys (common when sources have different float precision)
-    o2 = _reformat_coord_str(o1)
-    d2 = _reformat_coord_str(d1)
-    row2 = matrix_distance.get(o2) if o2 else None
-    if isinstance(row2, dict) and d2 in row2:
-        try:
-            return int(row2[d2])
-        except Exception:
-            return 0
-
-    # last attempt: from original row to reformatted dest (or vice versa)
-    if isinstance(row, dict) and d2 and d2 in row:
-        try:
-            return int(row[d2])
-        except Exception:
-            return 0
-    if o2 and isinstance(matrix_distance.get(o2), dict) and d1 in matrix_distance[o2]:
-        try:
-            return int(matrix_distance[o2][d1])
-        except Exception:
-            return 0
-
-    # not found
-    return 0
+    reg = CoordRegistry(matrix_distance.keys())
+    arr = np.zeros((len(reg), len(reg)), dtype=np.float64)
+    for from_k, inner in matrix_distance.items():
+        i = reg.get(from_k)
+        if i is None or not isinstance(inner, dict) or not inner:
+            continue
+        cols = reg.ids_of(inner.keys())
+        vals = pd.to_numeric(pd.Series(list(inner.values()), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+        ok = cols >= 0
+        arr[i, cols[ok]] = vals[ok]
+    return reg, np.nan_to_num(arr, nan=0.0)
+
+
+def hop_distances_m(dist_arr: np.ndarray, prev_ids: np.ndarray, curr_ids: np.ndarray) -> np.ndarray:
+    """Vectorized dist_arr[prev, curr]; 0 where either id is unknown (-1)."""
+    out = np.zeros(len(curr_ids), dtype=np.int64)
+    ok = (prev_ids >= 0) & (curr_ids >= 0)
+    if ok.any():
+        vals = np.asarray(dist_arr[prev_ids[ok], curr_ids[ok]], dtype=np.float64)
+        out[ok] = np.nan_to_num(vals, nan=0.0).astype(np.int64)
+    return out
 
 
 # ----------------- Flatten result JSON -----------------
@@ -384,7 +337,12 @@ def appt_assigned_overlap_by_tech(assignments_df: pd.DataFrame) -> Dict[Tuple[st
 # ------------- appt_eligibility_by_slot sheet -----------------
 def build_appt_eligibility_by_slot(appts: List[dict],
                                    tech_used_map: Dict[str, Dict[Tuple[str, str], int]],
-                                   appt_overlap_map: Dict[Tuple[str, str, str, str], int]) -> pd.DataFrame:
+                                   appt_overlap_map: Dict[Tuple[str, str, str, str], int],
+                                   eligibility: Optional[EligibilityIndex] = None) -> pd.DataFrame:
+    """
+    'eligibility' = technician x BU index (eligibility.py); built from the appointments'
+    eligible_technicians when not given. Free technicians are counted as vector operations.
+    """
     rows = []
     # precompute appointment durations & arrival labels
     appt_duration: Dict[str, int] = {}
@@ -408,11 +366,30 @@ def build_appt_eligibility_by_slot(appts: List[dict],
         except Exception:
             appt_date_key[apid] = None
 
-    for ap in appts:
+    index = eligibility or EligibilityIndex.from_appointments(appts)
+    elig_masks = index.appointment_masks([ap.get("business_unit_id") or "" for ap in appts])
+    tech_ids = index.technician_ids
+
+    # used minutes per (date, slot) as one vector over the index technicians
+    used_by_slot: Dict[Tuple[str, str], np.ndarray] = {}
+
+    def _used(key: Tuple[str, str]) -> np.ndarray:
+        if key not in used_by_slot:
+            used_by_slot[key] = np.array([tech_used_map.get(t, {}).get(key, 0) for t in tech_ids], dtype=np.int64)
+        return used_by_slot[key]
+
+    # this appointment's own minutes per (date, slot): [(tech position, minutes)]
+    own_minutes: Dict[Tuple[str, str, str], List[Tuple[int, int]]] = {}
+    for (apid, tid, date_key, label), mins in appt_overlap_map.items():
+        pos = index.tech_pos.get(tid)
+        if pos is not None:
+            own_minutes.setdefault((apid, date_key, label), []).append((pos, mins))
+
+    for k, ap in enumerate(appts):
         apid = str(ap.get("id", ""))
         bu   = ap.get("business_unit_id") or ""
-        elig = [str(x.get("id")) for x in (ap.get("eligible_technicians") or []) if x.get("id") is not None]
-        total_eligible = len(elig)
+        elig = elig_masks[k]
+        total_eligible = int(elig.sum())
         dur_t = appt_duration.get(apid, 0)
         date_key = appt_date_key.get(apid)
         if not date_key:
@@ -428,14 +405,14 @@ def build_appt_eligibility_by_slot(appts: List[dict],
 
         for sdt, edt, label in slot_bounds_for_date(aw_s):
             free_count = 0
-            for tid in elig:
-                used = tech_used_map.get(tid, {}).get((date_key, label), 0)
-                # subtract this appointment's own overlap minutes for this tech in that slot (simulate "not assigned")
-                used_minus_this = used - appt_overlap_map.get((apid, tid, date_key, label), 0)
+            if dur_t > 0 and total_eligible:
+                used_minus_this = _used((date_key, label)).copy()
+                # subtract this appointment's own overlap minutes per tech in that slot (simulate "not assigned")
+                for pos, mins in own_minutes.get((apid, date_key, label), ()):
+                    used_minus_this[pos] -= mins
                 # available minutes
-                avail = SLOT_CAPACITY_MIN - max(0, used_minus_this)
-                if avail >= dur_t and dur_t > 0:
-                    free_count += 1
+                avail = SLOT_CAPACITY_MIN - np.maximum(0, used_minus_this)
+                free_count = int((elig & (avail >= dur_t)).sum())
 
             rows.append({
                 "slot": label,
@@ -460,10 +437,12 @@ def build_appt_eligibility_by_slot(appts: List[dict],
 
 
 # ----------------- NEW: Build Assignments per-tech with hop distances (from MATRIX) -----------------
-def build_assignments_with_dist(assignments_df: pd.DataFrame, dl_obj: Dict[str, Any]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+def build_assignments_with_dist(assignments_df: pd.DataFrame, dl_obj: Dict[str, Any],
+                                store: Optional[MatrixStore] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
     """
     Returns:
-      - per-tech assignments dataframe with 'dist_from_prev_m' (from matrix.distance)
+      - per-tech assignments dataframe with 'dist_from_prev_m' (from matrix.distance,
+        or from the memory-mapped 'store' when one is given)
       - per-tech total distance dataframe
     Includes UNASSIGNED (status='outlier' or empty technician_ids) rows in the output sheet,
     with blank tech_id and no hop distance.
@@ -512,20 +491,28 @@ def build_assignments_with_dist(assignments_df: pd.DataFrame, dl_obj: Dict[str,
     techs_col = raw.get("technician_ids")
     mask_outlier = (status_col.astype(str).str.lower() == "outlier") | techs_col.apply(lambda v: not bool(v))
 
-    # ---------- Matrix & coords ----------
-    appt_coord_map: Dict[str, Optional[str]] = {}
+    # ---------- Matrix & coords (coordinates resolved to registry ids once) ----------
+    if store is not None:
+        registry, dist_arr = store.registry, store.distance
+    else:
+        matrix_distance: Dict[str, Dict[str, Any]] = (dl_obj.get("matrix") or {}).get("distance") or {}
+        registry, dist_arr = distance_array_from_dataloader(matrix_distance)
+
+    def _coord_id(loc: Optional[dict]) -> int:
+        i = registry.get((loc or {}).get("coordinate"))
+        return -1 if i is None else i
+
+    appt_coord_id: Dict[str, int] = {}
     for ap in dl_obj.get("appointments", []):
-        appt_coord_map[str(ap.get("id"))] = _norm_coord_str((ap.get("location") or {}).get("coordinate"))
+        appt_coord_id[str(ap.get("id"))] = _coord_id(ap.get("location"))
 
     options = dl_obj.get("options", {}) or {}
     start_at_office = bool(options.get("start_day_at_office", False))
-    office_coord_str = _norm_coord_str((options.get("office") or {}).get("coordinate"))
+    office_id = _coord_id(options.get("office"))
 
-    tech_home_map: Dict[str, Optional[str]] = {}
+    tech_home_id: Dict[str, int] = {}
     for t in dl_obj.get("technicians", []):
-        tech_home_map[str(t.get("id"))] = _norm_coord_str((t.get("home") or {}).get("coordinate"))
-
-    matrix_distance: Dict[str, Dict[str, Any]] = (dl_obj.get("matrix") or {}).get("distance") or {}
+        tech_home_id[str(t.get("id"))] = _coord_id(t.get("home"))
 
     # ---------- Assigned rows: explode & compute distances ----------
     assigned_raw = raw.loc[~mask_outlier].copy()
@@ -538,21 +525,18 @@ def build_assignments_with_dist(assignments_df: pd.DataFrame, dl_obj: Dict[str,
     else:
         df["start_dt"] = pd.to_datetime(df["start"], errors="coerce", utc=True)
         df["date"] = df["start_dt"].dt.date.astype(str)
-        df["appt_coord_str"] = df["appointment_id"].map(lambda x: appt_coord_map.get(str(x)))
+        df["appt_coord_id"] = df["appointment_id"].map(lambda x: appt_coord_id.get(str(x), -1)).astype(np.int64)
 
         def compute_group(g: pd.DataFrame) -> pd.DataFrame:
             key = g.name if isinstance(g.name, tuple) else (g.name, None)
             tid = str(key[0]); date_key = key[1]
             g = g.sort_values("start_dt").copy()
-            start_coord = office_coord_str if start_at_office else tech_home_map.get(tid, office_coord_str)
-            prev_coords = g["appt_coord_str"].shift().to_numpy(dtype=object)
+            start_id = office_id if start_at_office else tech_home_id.get(tid, office_id)
+            curr_ids = g["appt_coord_id"].to_numpy(dtype=np.int64)
+            prev_ids = np.roll(curr_ids, 1)
             if len(g) > 0:
-                prev_coords[0] = start_coord
-            curr_coords = g["appt_coord_str"].to_numpy(dtype=object)
-            g["dist_from_prev_m"] = [
-                _matrix_distance_m(matrix_distance, p, c)
-                for p, c in zip(prev_coords, curr_coords)
-            ]
+                prev_ids[0] = start_id
+            g["dist_from_prev_m"] = hop_distances_m(dist_arr, prev_ids, curr_ids)
             g["tech_id"] = tid
             g["date"] = date_key
             return g
@@ -622,7 +606,7 @@ def build_assignments_with_dist(assignments_df: pd.DataFrame, dl_obj: Dict[str,
 def main():
     # Load JSONs
     result_obj = json.loads(Path(INPUT_RESULT_JSON).read_text(encoding="utf-8"))
-    dl_obj     = json.loads(Path(INPUT_DATALOADER).read_text(encoding="utf-8"))
+    dl_obj     = load_scenario(INPUT_DATALOADER)   # overlays: base + patches
 
     assignments_df = flatten_assignments(result_obj.get("assignments"))
     # add any explicit outliers if provided separately
@@ -635,7 +619,8 @@ def main():
     sugg_dfs       = flatten_suggestions(result_obj.get("suggestions"))
 
     # NEW: assignments exploded per tech with hop distances (from MATRIX) + totals
-    assignments_with_dist_df, tech_total_distance_df = build_assignments_with_dist(assignments_df, dl_obj)
+    store = load_matrix_store(MATRIX_STORE) if MATRIX_STORE else None
+    assignments_with_dist_df, tech_total_distance_df = build_assignments_with_dist(assignments_df, dl_obj, store)
 
     # Meta
     meta_df = pd.DataFrame({
@@ -653,7 +638,11 @@ def main():
     tech_used_map    = tech_slot_used_minutes_map(assignments_df)
     appt_overlap_map = appt_assigned_overlap_by_tech(assignments_df)
     appts            = dl_obj.get("appointments", [])
-    appt_elig_df     = build_appt_eligibility_by_slot(appts, tech_used_map, appt_overlap_map)
+    elig_file        = eligibility_path(INPUT_DATALOADER)
+    eligibility      = None
+    if elig_file.exists() and elig_file.stat().st_mtime >= Path(INPUT_DATALOADER).stat().st_mtime:
+        eligibility = load_eligibility(elig_file)   # written by the parser with this dataloader
+    appt_elig_df     = build_appt_eligibility_by_slot(appts, tech_used_map, appt_overlap_map, eligibility)
 
     # Write all sheets in ONE file
     with pd.ExcelWriter(OUTPUT_XLSX, engine="openpyxl") as writer:
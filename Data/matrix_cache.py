@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental matrix cache for newly arriving appointment coordinates.
+
+Instead of regenerating the whole dist_matrix.txt when a few customers are
+added (data_parser_new_appointments.py), this script:
+  1. collects the canonical coordinates of the RAPOR sheet(s) + office,
+  2. finds the ones that are not in the matrix store yet,
+  3. if BLOCK_TSV exists, appends only their rows/columns to the store
+     (extend_matrix_store), otherwise writes them to NEW_COORDS_TXT
+     (appointments.txt format) for the routing tool and stops.
+
+BLOCK_TSV has the same layout as dist_matrix.txt but may be rectangular; it
+must contain new x all and all x new distances (any extra cells are ignored).
+Cost grows with (#new x #all), not with (#all)^2.
+
+SOURCE = "geo" skips the routing tool and fills the new cells from the
+haversine + speed profile model of geo_matrix.py.
+"""
+
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from coord_registry import CoordRegistry, latlon_to_key
+from geo_matrix import geo_block_source
+from matrix_store import BlockFn, extend_matrix_store, load_matrix_store, missing_coordinates
+from matrix_to_json import DURATION_FACTOR, MISSING_VALUE, read_matrix_block
+from sheet_cache import read_sheets
+
+# --- CONFIG ---
+INPUT_XLSX = "28002357 Yiğit Klima 10-14 Mart 2025_SON Veri_Düzeltilmiştir.xlsx"
+SHEETS = ["RAPOR"]                    # sheets whose 'Müşteri Koordinat' must be in the matrix
+OFFICE_COORD = "27.436587,38.626512"  # lon,lat
+STORE_PREFIX = "matrix_store"
+NEW_COORDS_TXT = "appointments_new.txt"   # input for the routing tool (new locations only)
+BLOCK_TSV = "dist_matrix_new.txt"         # routing tool output for the new locations
+SOURCE = "tsv"                            # "tsv" (routing tool, BLOCK_TSV) | "geo" (geo_matrix.py model)
+# ---------------
+
+
+def collect_coordinates(xlsx: str, sheets: List[str], extra: Optional[List[str]] = None) -> List[str]:
+    """Canonical 'lon,lat' keys of all customer coordinates in 'sheets' (+ 'extra', already lon,lat)."""
+    reg = CoordRegistry(extra or [])
+    frames = read_sheets(xlsx, sheets, dtype=str, usecols=["Müşteri Koordinat"])
+    for sheet in sheets:
+        col = frames[sheet]["Müşteri Koordinat"]
+        for val in col.dropna().unique():
+            key = latlon_to_key(val)
+            if key:
+                reg.add(key)
+    return list(reg.keys)
+
+
+def tsv_block_source(path: str,
+                     duration_factor: float = DURATION_FACTOR,
+                     missing_value: float = MISSING_VALUE) -> BlockFn:
+    """compute_block() that reads cells from a routing-tool TSV (rows = origins, columns = destinations)."""
+    row_ids, col_ids, raw = read_matrix_block(path)
+    rows = CoordRegistry(row_ids)
+    cols = CoordRegistry(col_ids)
+
+    def compute_block(origins: List[str], destinations: List[str]):
+        ri = rows.ids_of(origins)
+        ci = cols.ids_of(destinations)
+        out = np.full((len(origins), len(destinations)), np.nan, dtype=np.float64)
+        ok_r = np.flatnonzero(ri >= 0)
+        ok_c = np.flatnonzero(ci >= 0)
+        if len(ok_r) and len(ok_c):
+            out[np.ix_(ok_r, ok_c)] = raw[np.ix_(ri[ok_r], ci[ok_c])]
+
+        # same location -> 0, whatever the tool says
+        dest_pos = {d: j for j, d in enumerate(destinations)}
+        for i, o in enumerate(origins):
+            j = dest_pos.get(o)
+            if j is not None:
+                out[i, j] = 0.0
+
+        missing = ~np.isfinite(out)
+        if missing.any():
+            print(f"⚠️ {int(missing.sum())} cells missing in {path}, set to {missing_value}")
+        distance = np.where(missing, missing_value, out)
+        duration = np.where(missing, missing_value, out * duration_factor)
+        return distance, duration
+
+    return compute_block
+
+
+def write_coords_txt(path: str, keys: List[str]) -> None:
+    """Same layout as appointments.txt: "lonvlat"<TAB>lon<TAB>lat."""
+    with open(path, "w") as f:
+        f.write("\n".join(f"\"{k.replace(',', 'v')}\"\t{k.split(',')[0]}\t{k.split(',')[1]}" for k in keys))
+
+
+def main():
+    coords = collect_coordinates(INPUT_XLSX, SHEETS, extra=[OFFICE_COORD])
+    store = load_matrix_store(STORE_PREFIX)
+    new_keys = missing_coordinates(store, coords)
+    print(f"Store: {len(store)} locations, requested: {len(coords)}, new: {len(new_keys)}")
+    store = None
+
+    if not new_keys:
+        print("✅ Matrix store already covers all coordinates.")
+        return
+
+    if SOURCE == "geo":
+        block_source = geo_block_source()
+    elif SOURCE == "tsv":
+        if not Path(BLOCK_TSV).exists():
+            write_coords_txt(NEW_COORDS_TXT, new_keys)
+            print(f"⚠️ {BLOCK_TSV} not found. Wrote {len(new_keys)} new locations to {NEW_COORDS_TXT}; "
+                  f"run the routing tool for new x all and all x new, save it as {BLOCK_TSV} and rerun.")
+            return
+        block_source = tsv_block_source(BLOCK_TSV)
+    else:
+        raise ValueError(f"Unknown SOURCE {SOURCE!r} (expected 'tsv' or 'geo')")
+
+    store, added = extend_matrix_store(STORE_PREFIX, new_keys, block_source)
+    print(f"✅ Added {len(added)} locations to {STORE_PREFIX} (now {len(store)}).")
+
+
+if __name__ == "__main__":
+    main()
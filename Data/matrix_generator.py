@@ -1,33 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Writes appointments.txt (input of the routing tool / geo_matrix.py): the unique
+customer coordinates of the RAPOR sheet + the office.
+
+The coordinate column is handled as a whole:
+  - 'lat;lon' / 'lat,lon' parsed once per distinct value and mapped onto the
+    column, lon/lat checked as arrays,
+  - rows outside SERVICE_BBOX (or unparseable) are rejected,
+  - CORRECTIONS_XLSX (rows keyed by 'Teyit No', e.g. 'Vestel - Hatalı Enlem
+    Boylam Bilgileri.xlsx') is joined on the id: a CORRECTED_COLUMN value
+    replaces the coordinate, otherwise a row that still has the listed wrong
+    coordinate is rejected,
+  - keys come from coord_registry.latlon_to_key, the same normalization as the
+    parsers, so they match the matrix keys exactly.
+Rejected rows go to REJECTED_CSV.
+"""
+
+from typing import Optional, Tuple
+
 import pandas as pd
 
+from coord_registry import CoordRegistry, canonical_coord, latlon_to_key
+from sheet_cache import read_sheet
+
 # --- CONFIG ---
 input_excel = "28002357 Yiğit Klima 10-14 Mart 2025_SON Veri_Düzeltilmiştir.xlsx"   # your Excel file
 output_txt = "appointments.txt"     # desired output file
 sheet_name = "RAPOR"                # sheet to read
+office_coord = "27.436587,38.626512"  # lon,lat
+ID_COLUMN = "Teyit No"              # column D
+COORD_COLUMN = "Müşteri Koordinat"  # column L ('lat;lon')
+SERVICE_BBOX = (26.0, 37.5, 30.0, 40.0)   # lon_min, lat_min, lon_max, lat_max (Manisa ve çevresi)
+CORRECTIONS_XLSX: Optional[str] = "Vestel - Hatalı Enlem Boylam Bilgileri.xlsx"   # None -> no corrections
+CORRECTED_COLUMN = "Düzeltilmiş Koordinat"   # 'lat;lon' in the corrections workbook (optional column)
+REJECTED_CSV = "appointments_rejected_coords.csv"
+# ---------------
+
+
+def key_columns(keys: pd.Series) -> pd.DataFrame:
+    """Canonical 'lon,lat' keys -> float columns lon, lat (NaN where the key is missing)."""
+    parts = keys.str.split(",", n=1, expand=True).reindex(columns=[0, 1])
+    return pd.DataFrame({"lon": pd.to_numeric(parts[0], errors="coerce"),
+                         "lat": pd.to_numeric(parts[1], errors="coerce")}, index=keys.index)
+
+
+def load_corrections(path: Optional[str]) -> pd.DataFrame:
+    """Corrections indexed by id: wrong_key (listed coordinate), fixed_key (corrected one or None)."""
+    if not path:
+        return pd.DataFrame(columns=["wrong_key", "fixed_key"])
+    corr = read_sheet(path, 0, dtype=str)
+    ids = corr[ID_COLUMN].fillna("").astype(str).str.strip()
+    fixed = corr[CORRECTED_COLUMN] if CORRECTED_COLUMN in corr.columns else pd.Series(None, index=corr.index)
+    out = pd.DataFrame({
+        "wrong_key": corr.get(COORD_COLUMN, pd.Series(None, index=corr.index)).map(latlon_to_key),
+        "fixed_key": fixed.map(latlon_to_key),
+    })
+    out.index = ids.to_numpy()
+    out = out[out.index != ""]
+    return out[~out.index.duplicated(keep="last")]   # last listed row wins
+
+
+def extract_coordinates(rapor: pd.DataFrame, corrections: pd.DataFrame,
+                        bbox: Tuple[float, float, float, float] = SERVICE_BBOX) -> Tuple[pd.Series, pd.DataFrame]:
+    """(canonical 'lon,lat' key per accepted row, rejected rows with reason)."""
+    ids = rapor[ID_COLUMN].fillna("").astype(str).str.strip() if ID_COLUMN in rapor.columns \
+        else pd.Series("", index=rapor.index)
+    raw = rapor[COORD_COLUMN] if COORD_COLUMN in rapor.columns else pd.Series(None, index=rapor.index, dtype=object)
+
+    # parse every distinct spelling once (same normalization as the parsers), then map the column
+    uniq = pd.unique(raw.dropna())
+    keys = raw.map(dict(zip(uniq, (latlon_to_key(v) for v in uniq))))
+
+    # corrections: indexed join on the id
+    joined = corrections.reindex(ids.to_numpy())
+    joined.index = rapor.index
+    has_fix = joined["fixed_key"].notna()
+    keys = keys.where(~has_fix, joined["fixed_key"])
+    known_bad = ~has_fix & joined["wrong_key"].notna() & (keys == joined["wrong_key"])
+
+    ll = key_columns(keys.astype(object))
+    lon, lat = ll["lon"], ll["lat"]
+    lon_min, lat_min, lon_max, lat_max = bbox
+    in_bbox = lon.between(lon_min, lon_max) & lat.between(lat_min, lat_max)
+
+    reason = pd.Series(None, index=rapor.index, dtype=object)
+    reason[raw.notna() & keys.isna()] = "unparseable"
+    reason[keys.notna() & ~in_bbox] = "outside_service_bbox"
+    reason[known_bad] = "listed_as_wrong"
+    accepted = keys.notna() & reason.isna()
+
+    rejected = pd.DataFrame({
+        "excel_row": rapor.index[reason.notna()] + 2,   # 1-based, after the header row
+        ID_COLUMN: ids[reason.notna()],
+        COORD_COLUMN: raw[reason.notna()],
+        "reason": reason[reason.notna()],
+    })
+    return keys[accepted], rejected
+
 
-# Load the Excel file
-df = pd.read_excel(input_excel, sheet_name=sheet_name, header=None)
+def main():
+    rapor = read_sheet(input_excel, sheet_name, dtype=str)   # cached by workbook content (sheet_cache.py)
+    keys, rejected = extract_coordinates(rapor, load_corrections(CORRECTIONS_XLSX))
 
-# Collect unique coordinates
-unique_coords = set()
+    office_key = canonical_coord(office_coord)
+    unique_coords = sorted(CoordRegistry(keys).keys)   # sorted for stable output
+    unique_coords = [k for k in unique_coords if k != office_key]
 
-for _, row in df.iterrows():
-    identifier = str(row[3]).strip()   # Column D (index 3)
-    coords = str(row[11]).strip()      # Column L (index 11)
+    # Write unique coordinates + office once (last line, no trailing newline)
+    lines = [f"\"{k.replace(',', 'v')}\"\t{k.split(',')[0]}\t{k.split(',')[1]}" for k in unique_coords + [office_key]]
+    with open(output_txt, "w") as f:
+        f.write("\n".join(lines))
 
-    if ";" in coords or "," in coords:
-        try:
-            lat, lon = coords.split(";")
-        except Exception:
-            lat, lon = coords.split(",")
-        lat = lat.strip()
-        lon = lon.strip()
-        unique_coords.add((lon, lat))  # store as tuple (lon, lat)
+    rejected.to_csv(REJECTED_CSV, index=False, encoding="utf-8-sig")
+    print(f"✅ Wrote {output_txt} ({len(unique_coords)} locations + office)")
+    if len(rejected):
+        print(f"⚠️ {len(rejected)} row(s) rejected -> {REJECTED_CSV}: "
+              + ", ".join(f"{r}={c}" for r, c in rejected["reason"].value_counts().items()))
 
-# Write unique coordinates to file
-with open(output_txt, "w") as f:
-    for lon, lat in sorted(unique_coords):  # sorted for stable output
-        f.write(f"\"{lon}v{lat}\"\t{lon}\t{lat}\n")
 
-    # Add office coordinate once
-    f.write("\"27.436587v38.626512\"\t27.436587\t38.626512")
+if __name__ == "__main__":
+    main()
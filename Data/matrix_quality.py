@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Matrix quality stage: find and repair broken cells of a distance/duration matrix.
+
+Checks (all on the distance matrix, as whole-array operations):
+  - missing:    NaN / unparseable off-diagonal cells,
+  - zero:       0 m between two different coordinates,
+  - asymmetric: d[i,j] vs d[j,i] differ by more than ASYM_RATIO (and ASYM_MIN_M),
+  - triangle:   d[i,j] is much longer than the detour d[i,p] + d[p,j] over a
+                set of TRIANGLE_PIVOTS pivot locations (an N^2 x P test instead
+                of the full N^3 one, so only violations via the pivots are seen),
+  - bad rows:   coordinates whose row or column is mostly missing / zero /
+                DEFAULT_VALUES (typically a location the routing tool could
+                not snap to a road).
+
+Repairs (each can be switched off):
+  - bad rows          -> great-circle estimate (geo_matrix.py model),
+  - missing / zero    -> d[j,i] if that one is fine, else geo, else the pivot detour,
+  - asymmetric        -> ASYM_REPAIR applied to both directions,
+  - triangle          -> pivot detour (cells not fixed above).
+Repaired durations are distance * the matrix's own median seconds-per-meter.
+Geo estimates are computed only for the cells being repaired (geo_cells), not
+for the whole matrix.
+
+validate_matrix() returns the repaired arrays and a per-coordinate report;
+matrix_to_json.py runs it on every import, main() runs it on an existing store.
+"""
+
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from geo_matrix import geo_block
+from matrix_store import STORE_DTYPE, load_matrix_store, save_matrix_store
+
+# --- CONFIG ---
+STORE_PREFIX = "matrix_store"
+OUTPUT_PREFIX = "matrix_store"             # same as STORE_PREFIX -> overwrite in place
+REPORT_CSV = "matrix_quality_report.csv"
+
+DEFAULT_VALUES: Tuple[float, ...] = (0.0, 2400.0)   # filler values of the routing tool
+ROW_DEFAULT_SHARE = 0.5                    # row/column with more default cells than this is "bad"
+ASYM_RATIO = 2.0                           # max(d_ij, d_ji) / min(...) above this ...
+ASYM_MIN_M = 2000.0                        # ... and differing by more than this is asymmetric
+TRIANGLE_PIVOTS = 16
+TRIANGLE_TOL = 0.25                        # d_ij > (1 + tol) * detour ...
+TRIANGLE_MIN_M = 1000.0                    # ... and by more than this is a violation
+PIVOT_SEED = 0
+
+REPAIR_BAD_ROWS = True
+REPAIR_MISSING = True                      # missing and zero cells
+REPAIR_TRIANGLE = True
+ASYM_REPAIR: Optional[str] = "min"         # "min" | "max" | "mean" | None (report only)
+# ---------------
+
+CHUNK_ROWS = 512
+
+
+def _offdiag(n: int) -> np.ndarray:
+    return ~np.eye(n, dtype=bool)
+
+
+def pivot_detour(d: np.ndarray, pivots: np.ndarray, chunk_rows: int = CHUNK_ROWS) -> np.ndarray:
+    """min over pivots p of d[i,p] + d[p,j]; NaN cells of 'd' are ignored (NaN if no pivot works)."""
+    n = len(d)
+    out = np.full((n, n), np.nan, dtype=STORE_DTYPE)
+    to_p = d[:, pivots]                      # n x P
+    from_p = d[pivots, :]                    # P x n
+    for s in range(0, n, chunk_rows):
+        e = min(n, s + chunk_rows)
+        block = out[s:e]
+        for k in range(len(pivots)):
+            np.fmin(block, to_p[s:e, k, None] + from_p[None, k, :], out=block)
+    return out
+
+
+def choose_pivots(ok_rows: np.ndarray, count: int, seed: int = PIVOT_SEED) -> np.ndarray:
+    """Random sample of coordinates whose rows are usable as detour points."""
+    candidates = np.flatnonzero(ok_rows)
+    if len(candidates) <= count:
+        return candidates
+    return np.sort(np.random.default_rng(seed).choice(candidates, size=count, replace=False))
+
+
+def geo_cells(lonlat: np.ndarray, rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+    """Great-circle distance estimate of the cells (rows[k], cols[k]); one geo_block per distinct row."""
+    out = np.empty(len(rows), dtype=STORE_DTYPE)
+    order = np.argsort(rows, kind="stable")
+    r = rows[order]
+    starts = np.flatnonzero(np.r_[True, r[1:] != r[:-1]]) if len(r) else np.empty(0, dtype=np.int64)
+    for s, e in zip(starts, np.r_[starts[1:], len(r)].astype(np.int64)):
+        idx = order[s:e]
+        out[idx] = geo_block(lonlat[r[s]:r[s] + 1], lonlat[cols[idx]])[0][0]
+    return out
+
+
+def validate_matrix(distance: np.ndarray,
+                    duration: np.ndarray,
+                    coordinates: Sequence[str],
+                    lonlat: Optional[np.ndarray] = None,
+                    default_values: Sequence[float] = DEFAULT_VALUES,
+                    row_default_share: float = ROW_DEFAULT_SHARE,
+                    asym_ratio: float = ASYM_RATIO,
+                    asym_min_m: float = ASYM_MIN_M,
+                    triangle_pivots: int = TRIANGLE_PIVOTS,
+                    triangle_tol: float = TRIANGLE_TOL,
+                    triangle_min_m: float = TRIANGLE_MIN_M,
+                    repair_bad_rows: bool = REPAIR_BAD_ROWS,
+                    repair_missing: bool = REPAIR_MISSING,
+                    repair_triangle: bool = REPAIR_TRIANGLE,
+                    asym_repair: Optional[str] = ASYM_REPAIR,
+                    ) -> Tuple[np.ndarray, np.ndarray, pd.DataFrame, Dict[str, int]]:
+    """
+    Returns (repaired distance, repaired duration, per-coordinate report, summary counts).
+    'lonlat' ((N, 2) [lon, lat]) is needed for the geo repairs; without it they are skipped.
+    """
+    n = len(coordinates)
+    # copies (inputs stay untouched); float64 input stays float64 so untouched cells are unchanged
+    d = np.array(distance, dtype=np.promote_types(np.asarray(distance).dtype, STORE_DTYPE))
+    t = np.array(duration, dtype=np.promote_types(np.asarray(duration).dtype, STORE_DTYPE))
+    off = _offdiag(n)
+
+    # --- detection ---
+    missing = ~np.isfinite(d) & off
+    zero = (d == 0) & off
+    is_default = (missing | zero | np.isin(d, np.asarray(default_values, dtype=d.dtype))) & off
+    denom = max(n - 1, 1)
+    share_out = is_default.sum(axis=1) / denom
+    share_in = is_default.sum(axis=0) / denom
+    bad_row = (share_out > row_default_share) | (share_in > row_default_share)
+
+    clean = np.where(missing | zero, np.nan, d).astype(STORE_DTYPE)
+    clean[bad_row, :] = np.nan
+    clean[:, bad_row] = np.nan
+    np.fill_diagonal(clean, 0.0)
+
+    dt = clean.T
+    lo = np.fmin(clean, dt)
+    hi = np.fmax(clean, dt)
+    asym = (hi > asym_ratio * lo) & (hi - lo > asym_min_m) & off
+    del lo, hi
+
+    pivots = choose_pivots(~bad_row, triangle_pivots)
+    detour = pivot_detour(clean, pivots) if len(pivots) else np.full((n, n), np.nan, dtype=STORE_DTYPE)
+    triangle = (clean > (1 + triangle_tol) * detour) & (clean - detour > triangle_min_m) & off
+
+    # --- repairs ---
+    valid = np.isfinite(d) & np.isfinite(t) & (d > 0) & (t > 0) & off & ~asym & ~triangle
+    sec_per_m = float(np.median(t[valid] / d[valid])) if valid.any() else 0.0
+    repaired = np.zeros((n, n), dtype=bool)
+
+    def _set(mask: np.ndarray, values: np.ndarray) -> None:
+        mask = mask & np.isfinite(values)
+        d[mask] = values[mask]
+        repaired[mask] = True
+
+    def _set_geo(mask: np.ndarray) -> None:
+        rows, cols = np.nonzero(mask)
+        if len(rows):
+            d[rows, cols] = geo_cells(lonlat, rows, cols)
+            repaired[rows, cols] = True
+
+    if repair_bad_rows and lonlat is not None and bad_row.any():
+        _set_geo((bad_row[:, None] | bad_row[None, :]) & off)
+    if repair_missing:
+        hole = (missing | zero) & ~repaired
+        _set(hole, dt)
+        if lonlat is not None:
+            _set_geo(hole & ~repaired)
+        _set(hole & ~repaired, detour)
+    if asym_repair:
+        funcs = {"min": np.fmin, "max": np.fmax, "mean": lambda a, b: (a + b) / 2}
+        if asym_repair not in funcs:
+            raise ValueError(f"Unknown ASYM_REPAIR {asym_repair!r} (expected min, max, mean or None)")
+        _set(asym & ~repaired, funcs[asym_repair](d, d.T))
+    if repair_triangle:
+        _set(triangle & ~repaired, detour)
+
+    t[repaired] = d[repaired] * sec_per_m
+    np.fill_diagonal(d, 0.0)
+    np.fill_diagonal(t, 0.0)
+
+    # --- report ---
+    def _both(mask: np.ndarray) -> np.ndarray:
+        return mask.sum(axis=1) + mask.sum(axis=0)
+
+    report = pd.DataFrame({
+        "coordinate": list(coordinates),
+        "missing": _both(missing),
+        "zero": _both(zero),
+        "asymmetric": _both(asym),
+        "triangle": _both(triangle),
+        "default_share_out": np.round(share_out, 3),
+        "default_share_in": np.round(share_in, 3),
+        "bad_row": bad_row,
+        "repaired": _both(repaired),
+    })
+    issues = report[["missing", "zero", "asymmetric", "triangle"]].sum(axis=1) + report["bad_row"].astype(int)
+    report = report[issues > 0].assign(_issues=issues[issues > 0])
+    report = report.sort_values("_issues", ascending=False).drop(columns="_issues").reset_index(drop=True)
+
+    summary = {
+        "missing": int(missing.sum()),
+        "zero": int(zero.sum()),
+        "asymmetric": int(asym.sum()),
+        "triangle": int(triangle.sum()),
+        "bad_rows": int(bad_row.sum()),
+        "repaired": int(repaired.sum()),
+        "left_missing": int((~np.isfinite(d)).sum()),
+    }
+    return d, t, report, summary
+
+
+def quality_summary(summary: Dict[str, int]) -> str:
+    return ", ".join(f"{k}={v:,}" for k, v in summary.items())
+
+
+def main():
+    store = load_matrix_store(STORE_PREFIX, mmap=False)
+    distance, duration, report, summary = validate_matrix(
+        store.distance, store.duration, store.coordinates, store.registry.lonlat()
+    )
+    keys = list(store.coordinates)
+    store = None
+    report.to_csv(REPORT_CSV, index=False, encoding="utf-8-sig")
+    print(f"Matrix quality: {quality_summary(summary)}")
+    print(f"✅ Wrote {REPORT_CSV} ({len(report)} coordinates with issues)")
+    save_matrix_store(OUTPUT_PREFIX, keys, distance, duration)
+    print(f"✅ Wrote {OUTPUT_PREFIX}.*.npy")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+Binary distance/duration matrix store.
+
+A store is a set of files sharing one path prefix:
+  <prefix>.distance.npy  - (N x N) float32 array, row = from, column = to
+  <prefix>.duration.npy  - (N x N) float32 array, same order
+  <prefix>.index.json    - {"coordinates": [...]}: coordinate key of each row/column
+
+The .npy files are opened with np.load(mmap_mode="r"), so nothing is parsed or
+copied until a cell is actually read. Row/column order is the id order of a
+CoordRegistry, so keys are canonical 'lon,lat' strings (see coord_registry.py).
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from coord_registry import CoordRegistry, canonical_coord
+
+MATRIX_KINDS = ("distance", "duration")
+STORE_DTYPE = np.float32
+
+# compute_block(origins, destinations) -> (distance, duration), each len(origins) x len(destinations)
+BlockFn = Callable[[List[str], List[str]], Tuple[np.ndarray, np.ndarray]]
+
+
+def store_paths(prefix: str) -> Dict[str, Path]:
+    p = Path(prefix)
+    return {
+        "distance": p.with_name(p.name + ".distance.npy"),
+        "duration": p.with_name(p.name + ".duration.npy"),
+        "index": p.with_name(p.name + ".index.json"),
+    }
+
+
+class MatrixStore:
+    """Square distance/duration arrays plus a coordinate -> row index."""
+
+    def __init__(self, coordinates: Sequence[str], distance: np.ndarray, duration: np.ndarray):
+        self.registry = CoordRegistry(coordinates)
+        n = len(self.registry)
+        if n != len(coordinates):
+            raise ValueError("Duplicate or invalid coordinate keys in matrix store index")
+        if distance.shape != (n, n) or duration.shape != (n, n):
+            raise ValueError(
+                f"Matrix shape mismatch: {n} coordinates, "
+                f"distance {distance.shape}, duration {duration.shape}"
+            )
+        self.distance = distance
+        self.duration = duration
+
+    @property
+    def coordinates(self) -> List[str]:
+        return self.registry.keys
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    def row_of(self, coord: Optional[str]) -> Optional[int]:
+        """Row/column of a coordinate string in any of the accepted spellings."""
+        return self.registry.get(coord)
+
+    def rows_of(self, coords: Iterable[Optional[str]]) -> np.ndarray:
+        """Vector of rows for the given coordinates; -1 where unknown."""
+        return self.registry.ids_of(coords)
+
+    def value(self, kind: str, origin: Optional[str], dest: Optional[str]) -> Optional[float]:
+        i = self.row_of(origin)
+        j = self.row_of(dest)
+        if i is None or j is None:
+            return None
+        return float(getattr(self, kind)[i, j])
+
+    def subset(self, coords: Iterable[Optional[str]]) -> Tuple["MatrixStore", List[str]]:
+        """
+        In-memory sub-store over 'coords' (canonical, deduplicated, input order).
+        Only the selected rows/columns are read from the memory-mapped files.
+        Also returns the coordinates that the store does not have.
+        """
+        wanted = CoordRegistry(coords)
+        ids = self.registry.ids_of(wanted.keys)
+        missing = [k for k, i in zip(wanted.keys, ids) if i < 0]
+        found = ids[ids >= 0]
+        keys = [self.registry.key_of(i) for i in found]
+        sel = np.ix_(found, found)
+        return MatrixStore(keys, np.asarray(self.distance[sel]), np.asarray(self.duration[sel])), missing
+
+    def iter_rows(self, kind: str,
+                  transform: Optional[Callable[[int, np.ndarray], np.ndarray]] = None
+                  ) -> Iterator[Tuple[str, Dict[str, float]]]:
+        """Yield (from, {to: value}) one row at a time; 'transform(i, row)' may rewrite each row."""
+        arr = getattr(self, kind)
+        keys = self.coordinates
+        for i, k in enumerate(keys):
+            row = np.asarray(arr[i])
+            if transform is not None:
+                row = transform(i, row)
+            yield k, dict(zip(keys, row.tolist()))
+
+    def to_nested_dict(self, kind: str, values: Optional[np.ndarray] = None) -> Dict[str, Dict[str, float]]:
+        """{from: {to: value}} as expected by the solver's 'matrix' section."""
+        if values is None:
+            return dict(self.iter_rows(kind))
+        keys = self.coordinates
+        return {k: dict(zip(keys, values[i].tolist())) for i, k in enumerate(keys)}
+
+
+def _write_index(path: Path, coordinates: Sequence[str]) -> None:
+    """Index written to a temp file and renamed, so readers never see a half-written one."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"coordinates": list(coordinates)}, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def save_matrix_store(prefix: str,
+                      coordinates: Sequence[str],
+                      distance: np.ndarray,
+                      duration: np.ndarray) -> Dict[str, Path]:
+    """Write distance/duration arrays and the coordinate index under 'prefix'."""
+    store = MatrixStore(coordinates, np.asarray(distance), np.asarray(duration))
+
+    paths = store_paths(prefix)
+    paths["index"].parent.mkdir(parents=True, exist_ok=True)
+    np.save(paths["distance"], np.ascontiguousarray(store.distance, dtype=STORE_DTYPE))
+    np.save(paths["duration"], np.ascontiguousarray(store.duration, dtype=STORE_DTYPE))
+    _write_index(paths["index"], store.coordinates)
+    return paths
+
+
+def load_matrix_store(prefix: str, mmap: bool = True) -> MatrixStore:
+    """Open a store written by save_matrix_store (memory-mapped, read-only by default)."""
+    paths = store_paths(prefix)
+    coords = json.loads(paths["index"].read_text(encoding="utf-8"))["coordinates"]
+    mode = "r" if mmap else None
+    distance = np.load(paths["distance"], mmap_mode=mode)
+    duration = np.load(paths["duration"], mmap_mode=mode)
+    if len(coords) != distance.shape[0]:
+        raise ValueError(f"{paths['index']} lists {len(coords)} coordinates but {paths['distance'].name} "
+                         f"has {distance.shape[0]} rows (interrupted write?); rebuild the store")
+    return MatrixStore(coords, distance, duration)
+
+
+def missing_coordinates(store: MatrixStore, coords: Iterable[Optional[str]]) -> List[str]:
+    """Canonical keys of 'coords' that have no row in 'store' (deduplicated, input order)."""
+    out: Dict[str, None] = {}
+    for c in coords:
+        key = canonical_coord(c)
+        if key is not None and key not in store.registry and key not in out:
+            out[key] = None
+    return list(out)
+
+
+def extend_matrix_store(prefix: str,
+                        coords: Iterable[Optional[str]],
+                        compute_block: BlockFn,
+                        chunk_rows: int = 1024) -> Tuple[MatrixStore, List[str]]:
+    """
+    Append rows/columns for the coordinates in 'coords' that the store does not know yet.
+
+    Only new x all and old x new cells are computed (k*(2N+k) cells for k new
+    locations instead of (N+k)^2). Existing cells are copied block-wise into
+    the grown arrays, which then replace the old files. Returns the reopened
+    store and the list of keys that were added.
+    """
+    store = load_matrix_store(prefix)
+    new_keys = missing_coordinates(store, coords)
+    if not new_keys:
+        return store, []
+
+    old_keys = list(store.coordinates)
+    n, k = len(old_keys), len(new_keys)
+    all_keys = old_keys + new_keys
+
+    rows_dist, rows_dur = compute_block(new_keys, all_keys)       # k x (n+k)
+    if n:
+        cols_dist, cols_dur = compute_block(old_keys, new_keys)   # n x k
+    else:
+        cols_dist = cols_dur = np.empty((0, k), dtype=STORE_DTYPE)
+    blocks = {"distance": (rows_dist, cols_dist), "duration": (rows_dur, cols_dur)}
+
+    paths = store_paths(prefix)
+    tmp_paths = {kind: paths[kind].with_name(paths[kind].name + ".tmp") for kind in MATRIX_KINDS}
+    for kind in MATRIX_KINDS:
+        old = getattr(store, kind)
+        new_rows, new_cols = blocks[kind]
+        out = np.lib.format.open_memmap(tmp_paths[kind], mode="w+", dtype=STORE_DTYPE, shape=(n + k, n + k))
+        for s in range(0, n, chunk_rows):
+            e = min(n, s + chunk_rows)
+            out[s:e, :n] = old[s:e]
+            out[s:e, n:] = new_cols[s:e]
+        out[n:, :] = new_rows
+        out.flush()
+        del out, old
+
+    # The old files are memory-mapped by 'store'; drop it before replacing them.
+    store = None
+    for kind in MATRIX_KINDS:
+        os.replace(tmp_paths[kind], paths[kind])
+    _write_index(paths["index"], all_keys)
+    return load_matrix_store(prefix), new_keys
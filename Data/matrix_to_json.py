@@ -1,93 +1,118 @@
-import pandas as pd
-import json
-
-# --- CONFIG ---
-INPUT_FILE = "dist_matrix.txt"     # your txt/tsv matrix file
-OUTPUT_FILE = "duration.json" # output json
-# ---------------
-
-# Load as dataframe (first row = column ids, first col = row ids)
-df = pd.read_csv(INPUT_FILE, sep="\t", header=None, dtype=str)
-df = df.replace("v", ",", regex=True)
-
-col_ids = df.iloc[0, 1:].tolist()
-row_ids = df.iloc[1:, 0].tolist()
-
-# Assign headers
-df = df.iloc[1:, 1:]
-df.columns = col_ids
-df.index = row_ids
-
-# Convert to numbers
-df = df.apply(pd.to_numeric, errors="coerce").fillna(0)
-
-# Build nested JSON
-distance = {}
-for r in df.index:
-    inner = {}
-    for c, val in df.loc[r].items():   # now val is guaranteed scalar
-        try:
-            val = float(val) * 0.06 
-            # val = 2400
-            if val.is_integer():
-                val = int(val) 
-        except Exception:
-            val = 2400
-        inner[str(c)] = val  # convert to minutes
-    distance[str(r)] = inner
-
-result = {"duration": distance}
-
-# Write JSON
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(result, f, ensure_ascii=False, indent=2)
-
-print(f"✅ Wrote {OUTPUT_FILE}")
+# -*- coding: utf-8 -*-
+"""
+Converts the routing tool's TSV matrix (dist_matrix.txt) into distance and
+duration matrices in one pass.
+
+  - The file is parsed once into a float array (first row = column ids,
+    first column = row ids, ids look like "lonvlat").
+  - Duration = distance * DURATION_FACTOR (60 km/h -> 0.06 s per meter).
+  - Unparseable / empty cells get MISSING_VALUE in both matrices, or, with
+    VALIDATE_MATRIX, are repaired by matrix_quality.py together with the other
+    broken cells (a per-coordinate report goes to QUALITY_REPORT_CSV).
+  - Writes the binary matrix store (see matrix_store.py) and, optionally,
+    the nested {from: {to: value}} JSON files.
+
+convert_matrix() / write_matrix_json() can be imported and used on their own.
+"""
 
+import json
+from typing import List, Tuple
 
-###################################################################################
+import numpy as np
+import pandas as pd
 
+from coord_registry import CoordRegistry
+from matrix_quality import quality_summary, validate_matrix
+from matrix_store import save_matrix_store
 
 # --- CONFIG ---
-INPUT_FILE = "dist_matrix.txt"     # your txt/tsv matrix file
-OUTPUT_FILE = "distance.json" # output json
+INPUT_FILE = "dist_matrix.txt"        # your txt/tsv matrix file
+STORE_PREFIX = "matrix_store"         # -> matrix_store.distance.npy / .duration.npy / .index.json
+DISTANCE_JSON = "distance.json"
+DURATION_JSON = "duration.json"
+WRITE_JSON = True                     # False -> only the binary store
+
+DURATION_FACTOR = 0.06                # meters -> seconds
+MISSING_VALUE = 0.0                   # value used for unparseable cells (eski davranış: fillna(0))
+VALIDATE_MATRIX = True                # run the quality checks / repairs before writing
+QUALITY_REPORT_CSV = "matrix_quality_report.csv"
 # ---------------
 
-# Load as dataframe (first row = column ids, first col = row ids)
-df = pd.read_csv(INPUT_FILE, sep="\t", header=None, dtype=str)
-df = df.replace("v", ",", regex=True)
-
-col_ids = df.iloc[0, 1:].tolist()
-row_ids = df.iloc[1:, 0].tolist()
-
-# Assign headers
-df = df.iloc[1:, 1:]
-df.columns = col_ids
-df.index = row_ids
-
-# Convert to numbers
-df = df.apply(pd.to_numeric, errors="coerce").fillna(0)
-
-# Build nested JSON
-distance = {}
-for r in df.index:
-    inner = {}
-    for c, val in df.loc[r].items():   # now val is guaranteed scalar
-        try:
-            val = float(val)
-            # val = 2400
-            if val.is_integer():
-                val = int(val) 
-        except Exception:
-            val = 2400
-        inner[str(c)] = val  # convert to minutes
-    distance[str(r)] = inner
-
-result = {"distance": distance}
-
-# Write JSON
-with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-    json.dump(result, f, ensure_ascii=False, indent=2)
-
-print(f"✅ Wrote {OUTPUT_FILE}")
 
+def read_matrix_block(path: str) -> Tuple[List[str], List[str], np.ndarray]:
+    """Parse a (possibly rectangular) TSV once. Returns (row ids, column ids, float64 array, NaN for bad cells)."""
+    # The C parser converts numeric columns directly; only columns that contain
+    # unparseable cells come back as object and need a second (column-wise) pass.
+    df = pd.read_csv(path, sep="\t", index_col=0, header=0, engine="c", low_memory=False)
+    row_ids = [str(r).replace("v", ",") for r in df.index]
+    col_ids = [str(c).replace("v", ",") for c in df.columns]
+
+    bad_cols = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c])]
+    for c in bad_cols:
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    return row_ids, col_ids, df.to_numpy(dtype=np.float64)
+
+
+def read_matrix_tsv(path: str) -> Tuple[List[str], np.ndarray]:
+    """Parse the square TSV once. Returns (row/column ids as 'lon,lat', float64 array with NaN for bad cells)."""
+    row_ids, col_ids, values = read_matrix_block(path)
+    if row_ids != col_ids:
+        raise ValueError(f"{path}: row and column ids differ; cannot build a square matrix")
+    return row_ids, values
+
+
+def convert_matrix(path: str,
+                   duration_factor: float = DURATION_FACTOR,
+                   missing_value: float = MISSING_VALUE) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """Returns (coordinate ids, distance, duration) with the missing-value policy applied."""
+    ids, raw = read_matrix_tsv(path)
+    missing = ~np.isfinite(raw)
+    distance = np.where(missing, missing_value, raw)
+    duration = np.where(missing, missing_value, raw * duration_factor)
+    if missing.any():
+        print(f"⚠️ {int(missing.sum())} unparseable matrix cells set to {missing_value}")
+    return ids, distance, duration
+
+
+def _json_row(row: np.ndarray) -> list:
+    """Row values as JSON-ready list: integral floats become ints (9048.0 -> 9048)."""
+    out = row.astype(object)
+    is_int = row == np.floor(row)
+    out[is_int] = row[is_int].astype(np.int64).astype(object)
+    return out.tolist()
+
+
+def write_matrix_json(path: str, kind: str, ids: List[str], values: np.ndarray) -> None:
+    """Write {kind: {from: {to: value}}}, one row at a time."""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{" + json.dumps(kind) + ":{")
+        for i, rid in enumerate(ids):
+            if i:
+                f.write(",")
+            f.write(json.dumps(rid, ensure_ascii=False) + ":")
+            f.write(json.dumps(dict(zip(ids, _json_row(values[i]))), ensure_ascii=False, separators=(",", ":")))
+        f.write("}}")
+
+
+def main():
+    ids, distance, duration = convert_matrix(INPUT_FILE, missing_value=np.nan if VALIDATE_MATRIX else MISSING_VALUE)
+
+    if VALIDATE_MATRIX:
+        distance, duration, report, summary = validate_matrix(distance, duration, ids, CoordRegistry(ids).lonlat())
+        report.to_csv(QUALITY_REPORT_CSV, index=False, encoding="utf-8-sig")
+        print(f"Matrix quality: {quality_summary(summary)} -> {QUALITY_REPORT_CSV}")
+        distance = np.nan_to_num(distance, nan=MISSING_VALUE)
+        duration = np.nan_to_num(duration, nan=MISSING_VALUE)
+
+    save_matrix_store(STORE_PREFIX, ids, distance, duration)
+    print(f"✅ Wrote {STORE_PREFIX}.*.npy ({len(ids)} locations)")
+
+    if WRITE_JSON:
+        write_matrix_json(DURATION_JSON, "duration", ids, duration)
+        print(f"✅ Wrote {DURATION_JSON}")
+        write_matrix_json(DISTANCE_JSON, "distance", ids, distance)
+        print(f"✅ Wrote {DISTANCE_JSON}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Pre-solve feasibility filter for a dataloader.
+
+Appointments the solver can never place only burn run_time_limit in the ALNS
+before they come back as 'outlier'. This stage finds them with whole-array
+checks (appointments x technicians) and moves them out of the payload into a
+pre-rejected report:
+
+  unreachable_location      coordinate missing from the matrix, or no travel
+                            time from any eligible technician's start point
+  window_outside_horizon    arrival window does not overlap planning_horizon
+  no_eligible_technician    BU has no technician of this board (eligibility.py)
+  does_not_fit_work_time    no eligible technician can reach the location and
+                            start inside the arrival window and finish the job
+                            before the end of their work_time
+
+Appointments with fixed technician_ids are only checked for what no
+assignment can fix: a location missing from the matrix and a window outside
+the planning horizon. Non-availabilities and the trip home are not taken into
+account, so every rejected appointment is certainly infeasible, not the other
+way round. Matrix keys are matched as canonical coordinates (CoordRegistry),
+so 'lon, lat' spellings of older / hand-edited payloads are found as well.
+
+data_parser.py runs this stage on the written board with PRESOLVE = True
+(presolve_file()); main() runs it on an existing dataloader.
+"""
+
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from board_matrix import board_coordinates, prune_nested_matrix, pruning_summary
+from coord_registry import CoordRegistry
+from eligibility import EligibilityIndex
+from json_stream import write_json
+
+# --- CONFIG ---
+INPUT_DATALOADER = Path("./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/dataloader-14_03_2025_fixed_arrivals.json")
+OUTPUT_DATALOADER = INPUT_DATALOADER.with_name(INPUT_DATALOADER.stem + "_presolved.json")
+REPORT_CSV = INPUT_DATALOADER.with_name(INPUT_DATALOADER.stem + "_prerejected.csv")   # report_path_for()
+COMPACT_JSON = True
+PRUNE_MATRIX = True   # drop matrix rows/columns of the rejected appointments' locations
+# ---------------
+
+REASONS = ["unreachable_location", "window_outside_horizon", "no_eligible_technician", "does_not_fit_work_time"]
+
+
+def _times(values: List[Any]) -> np.ndarray:
+    """ISO strings ('Z' or naive, both read as UTC wall clock) -> datetime64[s]; NaT where missing."""
+    ts = pd.to_datetime(pd.Series(values, dtype=object), errors="coerce", utc=True)
+    return ts.dt.tz_localize(None).to_numpy(dtype="datetime64[s]")
+
+
+def start_points(technicians: List[Dict], options: Dict) -> List[str]:
+    """Where each technician's day starts (office when start_day_at_office or no home)."""
+    office = ((options or {}).get("office") or {}).get("coordinate")
+    at_office = bool((options or {}).get("start_day_at_office"))
+    return [office if at_office or not (t.get("home") or {}).get("coordinate") else t["home"]["coordinate"]
+            for t in technicians]
+
+
+def drive_seconds(duration: Dict[str, Dict[str, Any]], origins: List[str], destinations: List[str],
+                  reg: Optional[CoordRegistry] = None) -> np.ndarray:
+    """
+    (len(origins) x len(destinations)) seconds from the nested matrix; NaN where the pair is missing.
+    Keys are matched through 'reg' (default: CoordRegistry of the matrix rows).
+    """
+    reg = CoordRegistry(duration.keys()) if reg is None else reg
+    if not origins:
+        return np.zeros((0, len(destinations)))
+    by_id = {reg.get(k): inner for k, inner in duration.items()}
+    dest = reg.ids_of(destinations)
+    rows = {}
+    for o in dict.fromkeys(origins):
+        full = np.full(len(reg), np.nan, dtype=np.float64)
+        inner = by_id.get(reg.get(o))
+        if isinstance(inner, dict) and inner:
+            cols = reg.ids_of(inner.keys())
+            vals = pd.to_numeric(pd.Series(list(inner.values()), dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+            ok = cols >= 0
+            full[cols[ok]] = vals[ok]
+        rows[o] = np.where(dest >= 0, full[np.maximum(dest, 0)], np.nan)
+    return np.vstack([rows[o] for o in origins])
+
+
+def classify(payload: Dict[str, Any]) -> pd.DataFrame:
+    """One row per appointment: id, business_unit_id, eligible, reason (None = keep)."""
+    appts = payload.get("appointments") or []
+    techs = payload.get("technicians") or []
+    options = payload.get("options") or {}
+    duration = ((payload.get("matrix") or {}).get("duration")) or {}
+    n = len(appts)
+
+    ids = [str(a.get("id")) for a in appts]
+    bus = [str(a.get("business_unit_id") or "") for a in appts]
+    coords = [((a.get("location") or {}).get("coordinate")) for a in appts]
+    fixed = np.array([bool(a.get("technician_ids")) for a in appts], dtype=bool)
+
+    # --- eligibility (appointments x board technicians) ---
+    tech_ids = [str(t.get("id")) for t in techs]
+    business_units = payload.get("business_units")
+    index = (EligibilityIndex.from_business_units(business_units, tech_ids) if business_units
+             else EligibilityIndex.from_appointments(appts))
+    board = np.array([index.tech_pos.get(t, -1) for t in tech_ids], dtype=np.int64)
+    elig = np.zeros((n, len(techs)), dtype=bool)
+    if len(techs):
+        masks = index.appointment_masks(bus)
+        ok = board >= 0
+        elig[:, ok] = masks[:, board[ok]]
+    # the appointment's own list wins where it is narrower than its BU
+    for k, a in enumerate(appts):
+        own = {str(x.get("id")) for x in (a.get("eligible_technicians") or []) if x.get("id") is not None}
+        if own:
+            elig[k] &= np.array([t in own for t in tech_ids], dtype=bool)
+
+    # --- time arrays ---
+    ph = options.get("planning_horizon") or {}
+    ph_start, ph_end = _times([ph.get("start"), ph.get("end")])
+    aw = [a.get("arrival_window") or {} for a in appts]
+    aw_start = _times([w.get("start") for w in aw])
+    aw_end = _times([w.get("end") for w in aw])
+    no_window = np.isnat(aw_start) | np.isnat(aw_end)
+    aw_start = np.where(no_window, ph_start, aw_start)
+    aw_end = np.where(no_window, ph_end, aw_end)
+    job = (_times([a.get("end") for a in appts]) - _times([a.get("start") for a in appts])).astype(np.float64)
+    job = np.nan_to_num(job, nan=0.0)                                   # seconds
+
+    wt = [t.get("work_time") or {} for t in techs]
+    wt_start = _times([w.get("start") for w in wt])
+    wt_end = _times([w.get("end") for w in wt])
+    wt_start = np.where(np.isnat(wt_start), ph_start, wt_start)
+    wt_end = np.where(np.isnat(wt_end), ph_end, wt_end)
+
+    # --- travel from each technician's start point (technicians x appointments -> transposed) ---
+    reg = CoordRegistry(duration.keys())
+    drive = drive_seconds(duration, start_points(techs, options), coords, reg).T   # n x T
+    in_matrix = reg.ids_of(coords) >= 0
+    reachable = np.isfinite(drive) & elig
+
+    # --- fits: start = max(window start, work start + drive) inside the window, end before work end ---
+    earliest = np.maximum(aw_start[:, None], wt_start[None, :] + np.nan_to_num(drive, nan=0.0).astype("timedelta64[s]"))
+    fits = (reachable
+            & (earliest <= aw_end[:, None])
+            & (earliest + job.astype("timedelta64[s]")[:, None] <= wt_end[None, :]))
+
+    # --- reasons (first match wins) ---
+    outside = (aw_end <= ph_start) | (aw_start >= ph_end)
+    no_elig = ~elig.any(axis=1)
+    unreachable = ~in_matrix | (~no_elig & ~reachable.any(axis=1))
+    reason = np.select([unreachable, outside, no_elig, ~fits.any(axis=1)], REASONS, default="")
+    # fixed technician_ids: only what no assignment can fix
+    reason = np.where(fixed, np.select([~in_matrix, outside], REASONS[:2], default=""), reason)
+
+    return pd.DataFrame({
+        "id": ids,
+        "business_unit_id": bus,
+        "coordinate": coords,
+        "arrival_window_start": [w.get("start") for w in aw],
+        "arrival_window_end": [w.get("end") for w in aw],
+        "duration_min": (job / 60).round(1),
+        "eligible_technicians": elig.sum(axis=1),
+        "feasible_technicians": fits.sum(axis=1),
+        "reason": pd.Series(reason, dtype=object).replace("", None),
+    })
+
+
+def presolve(payload: Dict[str, Any], prune_matrix: bool = PRUNE_MATRIX) -> Tuple[Dict[str, Any], pd.DataFrame]:
+    """(payload without the pre-rejected appointments, report of the rejected ones)."""
+    report = classify(payload)
+    rejected = report["reason"].notna().to_numpy()
+    out = dict(payload)
+    out["appointments"] = [a for a, r in zip(payload.get("appointments") or [], rejected) if not r]
+    if prune_matrix and rejected.any() and payload.get("matrix"):
+        coords = board_coordinates(out["appointments"], out.get("technicians") or [], out.get("options"))
+        out["matrix"], kept, total = prune_nested_matrix(payload["matrix"], coords)
+        print(f"✂️ Pruned {pruning_summary(kept, total)}")
+    return out, report[rejected].reset_index(drop=True)
+
+
+def report_path_for(dataloader: Path) -> Path:
+    """dataloader-x.json -> dataloader-x_prerejected.csv"""
+    p = Path(dataloader)
+    return p.with_name(p.stem + "_prerejected.csv")
+
+
+def presolve_file(input_path: Path, output_path: Optional[Path] = None, report_csv: Optional[Path] = None,
+                  prune_matrix: bool = PRUNE_MATRIX, compact: bool = COMPACT_JSON) -> Tuple[int, pd.DataFrame]:
+    """
+    Pre-solves a dataloader file (in place when output_path is None) and writes the
+    report next to the output. Returns (appointments kept, rejected report).
+    """
+    output_path = Path(output_path or input_path)
+    payload = json.loads(Path(input_path).read_text(encoding="utf-8"))
+    kept, rejected = presolve(payload, prune_matrix)
+    rejected.to_csv(report_csv or report_path_for(output_path), index=False, encoding="utf-8-sig")
+    write_json(output_path, kept, compact=compact)
+    return len(kept["appointments"]), rejected
+
+
+def rejection_summary(kept: int, rejected: pd.DataFrame) -> str:
+    counts = ", ".join(f"{r}={c}" for r, c in rejected["reason"].value_counts().items())
+    return f"Pre-rejected {len(rejected)}/{kept + len(rejected)} appointments" + (f" ({counts})" if counts else "")
+
+
+def main():
+    kept, rejected = presolve_file(INPUT_DATALOADER, OUTPUT_DATALOADER, REPORT_CSV)
+    print(rejection_summary(kept, rejected))
+    print(f"✅ Wrote {OUTPUT_DATALOADER} ({kept} appointments) and {REPORT_CSV}")
+
+
+if __name__ == "__main__":
+    main()
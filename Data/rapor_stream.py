@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Constant-memory RAPOR ingestion for very large exports.
+
+pd.read_excel(dtype=str) materializes the whole sheet and the parser then
+holds every appointment dict until the JSON is written. In streaming mode
+instead:
+
+  openpyxl read-only iter_rows  ->  DataFrame batches of BATCH_ROWS rows
+  (same text values as read_excel(dtype=str))
+      ->  appointment_builder.build_appointments() per batch
+      ->  AppointmentStream.appointments(), a generator that json_stream.write_json
+          consumes item by item
+
+While appointments are produced, AppointmentStream collects what the rest of
+the payload needs (zones, business units, board coordinates, drop counts);
+those are small (bounded by distinct values, not by rows), so memory stays
+bounded by the batch size.
+"""
+
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import openpyxl
+import pandas as pd
+
+from appointment_builder import build_appointments, normalize_column
+from business_units import build_business_units, rule_indexes
+from coord_registry import CoordRegistry
+
+# --- CONFIG ---
+BATCH_ROWS = 5000
+# ---------------
+
+DROPPED_SAMPLE = 10   # dropped rows kept for the summary printout
+
+
+EXCEL_ERRORS = {"#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"}
+
+
+def cell_text(v: Any) -> Optional[str]:
+    """A cell value as pd.read_excel(dtype=str) shows it; None for empty and error cells."""
+    if v is None or v == "" or (isinstance(v, str) and v in EXCEL_ERRORS):
+        return None
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)   # datetime / time -> 'YYYY-MM-DD HH:MM:SS' / 'HH:MM:SS', as pandas does
+
+
+def header_names(row: Iterable[Any]) -> List[str]:
+    """
+    Column names like pandas: trailing empty cells dropped, 'Unnamed: i' for other
+    empty cells, '.1', '.2' ... for duplicates.
+    """
+    row = list(row)
+    while row and cell_text(row[-1]) is None:
+        row.pop()
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for i, v in enumerate(row):
+        name = cell_text(v) or f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def iter_sheet_batches(xlsx: str, sheet: str, batch_rows: int = BATCH_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    The sheet as DataFrame batches (header = first row, index = running row number,
+    all values text or NaN), reading the workbook lazily. Fully empty rows are skipped.
+    """
+    wb = openpyxl.load_workbook(xlsx, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = header_names(header)
+        buf: List[List[Optional[str]]] = []
+        start = 0
+        for raw in rows:
+            vals = [cell_text(v) for v in raw]
+            while vals and vals[-1] is None:
+                vals.pop()
+            if not vals:
+                continue
+            if len(vals) > len(columns):   # data right of the header -> 'Unnamed: i' columns
+                columns = columns + [f"Unnamed: {i}" for i in range(len(columns), len(vals))]
+            buf.append(vals)
+            if len(buf) >= batch_rows:
+                yield _batch_frame(buf, columns, start)
+                start += len(buf)
+                buf = []
+        if buf:
+            yield _batch_frame(buf, columns, start)
+    finally:
+        wb.close()
+
+
+def _batch_frame(rows: List[List[Optional[str]]], columns: List[str], start: int) -> pd.DataFrame:
+    width = len(columns)
+    rows = [r + [None] * (width - len(r)) for r in rows]
+    df = pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows)), dtype=object)
+    return df.astype("str").where(df.notna())
+
+
+def peek_columns(batches: Iterable[pd.DataFrame]):
+    """(columns of the first batch, the same batches) without losing the first one."""
+    it = iter(batches)
+    first = next(it, None)
+    if first is None:
+        return pd.Index([]), iter(())
+    return first.columns, chain([first], it)
+
+
+class AppointmentStream:
+    """
+    Appointments of a sequence of RAPOR batches, built one batch at a time.
+    After appointments() is exhausted: zones, business_units, coordinates,
+    count, dropped_count and dropped_sample describe the whole sheet.
+    """
+
+    def __init__(self, batches: Iterable[pd.DataFrame], tech: pd.DataFrame, ugcts: pd.DataFrame,
+                 planning_horizon: Dict[str, str], rules: Optional[Dict] = None, **build_kwargs):
+        self.batches = batches
+        self.tech = tech
+        self.ugcts = ugcts
+        self.planning_horizon = planning_horizon
+        self.rules = rules or rule_indexes(tech, ugcts)
+        self.build_kwargs = build_kwargs
+
+        self._zones = set()
+        self._business_units: Dict[str, Dict] = {}
+        self.coordinates = CoordRegistry()
+        self.count = 0
+        self.dropped_count = 0
+        self.dropped_sample: List[tuple] = []
+
+    def appointments(self) -> Iterator[Dict]:
+        for batch in self.batches:
+            appts, dropped = build_appointments(batch, self.ugcts, self.planning_horizon, **self.build_kwargs)
+            if "Müşteri İlçe" in batch.columns:
+                self._zones.update(z for z in normalize_column(batch["Müşteri İlçe"]) if z)
+            for bu in build_business_units(batch, self.tech, self.ugcts, rules=self.rules):
+                self._business_units.setdefault(bu["id"], bu)
+            self.dropped_count += len(dropped)
+            room = DROPPED_SAMPLE - len(self.dropped_sample)
+            if room > 0:
+                self.dropped_sample.extend(dropped.head(room).itertuples(index=False))
+
+            for appt in appts:
+                techs = self._business_units.get(appt["business_unit_id"], {}).get("technician_ids", [])
+                appt["eligible_technicians"] = [{"id": tid, "score": 1} for tid in techs]
+                self.coordinates.add(appt["location"]["coordinate"])
+                self.count += 1
+                yield appt
+
+    @property
+    def zones(self) -> List[Dict]:
+        return [{"id": z, "can_go_with": []} for z in sorted(self._zones)]
+
+    @property
+    def business_units(self) -> List[Dict]:
+        return [self._business_units[k] for k in sorted(self._business_units)]
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of solver results.
+
+A resubmitted dataloader (regenerated scenario folder, batch rerun after a
+crash) costs a full run_time_limit. solver_client.py looks every request up
+here first; entries are keyed by
+
+    sha256(SOLVER_VERSION + canonical request JSON)
+
+where the canonical form is json.dumps(sort_keys=True, separators=(",", ":")),
+so key order, indentation and compact/pretty files hash the same. Bump
+SOLVER_VERSION (or pass --solver-version) when the solver changes, so old
+results are not served for the new build.
+
+The solver is stochastic; a cache hit returns the earlier run's result. Use
+solver_client.py --refresh for a fresh run (the new result replaces the entry)
+or --no-cache to bypass the cache completely.
+
+Entries are touched on every hit and the least recently used ones are
+deleted once the cache is larger than MAX_CACHE_MB.
+
+  python result_cache.py            # list entries
+  python result_cache.py --clear    # delete all entries
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, List, Optional, Union
+
+# --- CONFIG ---
+CACHE_DIR = str(Path(__file__).resolve().parent / ".result_cache")   # next to this file, not the cwd
+MAX_CACHE_MB = 2048
+SOLVER_VERSION = "alns-1"   # bump when the solver build changes
+# ---------------
+
+
+def canonical_json(payload: Any) -> bytes:
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def request_key(request: Union[bytes, str, dict], solver_version: str = SOLVER_VERSION) -> str:
+    """Cache key of a request body (bytes / str) or an already parsed payload."""
+    payload = json.loads(request) if isinstance(request, (bytes, str)) else request
+    h = hashlib.sha256(solver_version.encode("utf-8") + b"\0")
+    h.update(canonical_json(payload))
+    return h.hexdigest()
+
+
+def entry_path(key: str, cache_dir: str = CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{key}.json"
+
+
+def cache_entries(cache_dir: str = CACHE_DIR) -> List[Path]:
+    d = Path(cache_dir)
+    return [p for p in d.glob("*.json") if p.is_file()] if d.exists() else []
+
+
+def lookup(key: str, cache_dir: str = CACHE_DIR) -> Optional[Path]:
+    """Cached result file for 'key' (touched as recently used), or None."""
+    p = entry_path(key, cache_dir)
+    try:
+        os.utime(p)
+    except FileNotFoundError:
+        return None
+    return p
+
+
+def fetch(key: str, output_path: Path, cache_dir: str = CACHE_DIR) -> bool:
+    """Copy a cached result to output_path; False on a miss."""
+    src = lookup(key, cache_dir)
+    if src is None:
+        return False
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = output_path.with_name(output_path.name + ".part")
+    try:
+        shutil.copyfile(src, tmp)
+    except FileNotFoundError:   # evicted between lookup and copy
+        return False
+    os.replace(tmp, output_path)
+    return True
+
+
+def store(key: str, result_path: Path, cache_dir: str = CACHE_DIR, max_mb: float = MAX_CACHE_MB) -> Path:
+    """Copy a finished result file into the cache (atomic), then evict down to max_mb."""
+    d = Path(cache_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    dst = entry_path(key, cache_dir)
+    tmp = dst.with_name(f"{dst.name}.{os.getpid()}.part")
+    shutil.copyfile(result_path, tmp)
+    os.replace(tmp, dst)
+    evict(cache_dir, max_mb)
+    return dst
+
+
+def evict(cache_dir: str = CACHE_DIR, max_mb: float = MAX_CACHE_MB) -> int:
+    """Delete least recently used entries until the cache fits in max_mb; returns #deleted."""
+    stats = []
+    for p in cache_entries(cache_dir):
+        try:
+            st = p.stat()
+        except FileNotFoundError:   # evicted by another worker meanwhile
+            continue
+        stats.append((st.st_mtime, st.st_size, p))
+    stats.sort(key=lambda t: t[0])
+    total = sum(size for _, size, _ in stats)
+    limit = max_mb * 1e6
+    deleted = 0
+    for _, size, p in stats:
+        if total <= limit:
+            break
+        total -= size
+        p.unlink(missing_ok=True)
+        deleted += 1
+    return deleted
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or clear the solver result cache.")
+    ap.add_argument("--clear", action="store_true", help="delete all cache entries")
+    args = ap.parse_args()
+
+    entries = cache_entries()
+    if args.clear:
+        for p in entries:
+            p.unlink(missing_ok=True)
+        print(f"✅ Deleted {len(entries)} entries from {CACHE_DIR}")
+        return
+    total = sum(p.stat().st_size for p in entries)
+    print(f"{CACHE_DIR}: {len(entries)} results, {total / 1e6:.1f} MB of {MAX_CACHE_MB} MB (solver {SOLVER_VERSION})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+Overlay scenarios: one base dataloader + small JSON patches.
+
+A variant (another arrival window, another option value, ...) usually differs
+from its dataloader in a handful of fields. Instead of a full copy (matrix
+included) it is stored as <name>.overlay.json:
+
+  {
+    "overlay_version": 1,
+    "base": "../dataloader-14_03_2025_pruned.json",   # relative to the overlay file
+    "base_sha256": "...",                              # optional, checked when present
+    "patches": [
+      {"appointment": "9098841329", "path": "arrival_window",
+       "value": {"start": "2025-03-14T08:00:00.000Z", "end": "2025-03-14T10:00:00.000Z"}},
+      {"technician": "1234", "path": "work_time.end", "value": "..."},
+      {"option": "run_time_limit", "value": 60},
+      {"path": "options.capacity_weight", "value": 2},
+      {"appointment": "9098841330", "path": "technician_ids", "op": "remove"}
+    ]
+  }
+
+Patch addressing:
+  - "appointment" / "technician": element of that list with this id, 'path'
+    inside it ("" = the whole element),
+  - "option": path inside payload["options"],
+  - neither: 'path' from the payload root.
+'path' is dotted ("work_time.end"); "op" is "set" (default) or "remove".
+
+load_scenario() reads a plain dataloader or an overlay. Overlays are applied
+copy-on-write: only the dicts/lists along the patched paths are copied, the
+rest (matrix, other appointments) is shared with the cached base payload, so
+the result must be treated as read-only.
+"""
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from json_stream import file_sha256, write_json
+
+# --- CONFIG ---
+OVERLAY_SUFFIX = ".overlay.json"
+OVERLAY_VERSION = 1
+BASE_CACHE_SIZE = 4          # parsed base dataloaders kept in memory
+ID_TARGETS = {"appointment": "appointments", "technician": "technicians"}
+# ---------------
+
+_BASES: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()        # (path, size, mtime_ns) -> payload
+_ID_INDEX: "OrderedDict[int, tuple]" = OrderedDict()                  # id(list) -> (list, {id: position})
+
+
+def is_overlay(path) -> bool:
+    return str(path).endswith(OVERLAY_SUFFIX)
+
+
+def scenario_name(path) -> str:
+    """File name with '.overlay' dropped: dataloader-x.overlay.json -> dataloader-x.json."""
+    name = Path(path).name
+    return name[: -len(OVERLAY_SUFFIX)] + ".json" if is_overlay(name) else name
+
+
+def overlay_path_for(path) -> Path:
+    p = Path(path)
+    return p.with_name(p.name[:-len(".json")] + OVERLAY_SUFFIX if p.name.endswith(".json") else p.name + OVERLAY_SUFFIX)
+
+
+def load_base(path) -> Dict[str, Any]:
+    """Parsed dataloader, cached per file version (shared, do not mutate)."""
+    p = Path(path).resolve()
+    st = p.stat()
+    key = (str(p), st.st_size, st.st_mtime_ns)
+    if key in _BASES:
+        _BASES.move_to_end(key)
+        return _BASES[key]
+    payload = json.loads(p.read_text(encoding="utf-8"))
+    _BASES[key] = payload
+    while len(_BASES) > BASE_CACHE_SIZE:
+        _BASES.popitem(last=False)
+    return payload
+
+
+def id_index(items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """{str(id): position} of a list of dicts, built once per list object."""
+    hit = _ID_INDEX.get(id(items))
+    if hit is not None and hit[0] is items:
+        _ID_INDEX.move_to_end(id(items))
+        return hit[1]
+    idx = {str(x.get("id")): i for i, x in enumerate(items)}
+    _ID_INDEX[id(items)] = (items, idx)
+    while len(_ID_INDEX) > 2 * BASE_CACHE_SIZE:
+        _ID_INDEX.popitem(last=False)
+    return idx
+
+
+def _split(path: Optional[str]) -> List[str]:
+    return [p for p in str(path or "").split(".") if p]
+
+
+def _steps(base: Dict[str, Any], patch: Dict[str, Any]) -> List[Any]:
+    """Full key path of a patch from the payload root."""
+    target = next((t for t in ID_TARGETS if t in patch), None)
+    if target:
+        list_name = ID_TARGETS[target]
+        pos = id_index(base.get(list_name) or []).get(str(patch[target]))
+        if pos is None:
+            raise KeyError(f"{target} {patch[target]} not found in the base dataloader")
+        return [list_name, pos] + _split(patch.get("path"))
+    if "option" in patch:
+        return ["options"] + _split(patch["option"]) + _split(patch.get("path"))
+    steps = _split(patch.get("path"))
+    if not steps:
+        raise ValueError(f"Patch without a target: {patch}")
+    return steps
+
+
+def apply_patches(base: Dict[str, Any], patches: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Copy-on-write application of 'patches' to 'base' (base itself is not modified)."""
+    out = dict(base)
+    copied = {()}
+    for patch in patches:
+        op = patch.get("op", "set")
+        if op not in ("set", "remove"):
+            raise ValueError(f"Unknown patch op '{op}'")
+        steps = _steps(base, patch)
+        node: Any = out
+        for i, step in enumerate(steps[:-1]):
+            prefix = tuple(steps[:i + 1])
+            if prefix not in copied:
+                child = node.get(step, {}) if isinstance(node, dict) else node[step]
+                if isinstance(child, dict):
+                    child = dict(child)
+                elif isinstance(child, list):
+                    child = list(child)
+                else:
+                    raise TypeError(f"Cannot patch inside {type(child).__name__} at {'.'.join(map(str, prefix))}")
+                node[step] = child
+                copied.add(prefix)
+            node = node[step]
+        last = steps[-1]
+        if op == "set":
+            node[last] = patch.get("value")
+        elif isinstance(node, list):
+            raise ValueError("Removing list elements is not supported; patch their fields instead")
+        else:
+            node.pop(last, None)
+    return out
+
+
+def read_overlay(path) -> Dict[str, Any]:
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    if spec.get("overlay_version") != OVERLAY_VERSION:
+        raise ValueError(f"{path}: unsupported overlay_version {spec.get('overlay_version')}")
+    return spec
+
+
+def base_of(path) -> Path:
+    """Base dataloader of an overlay (the file itself for a plain dataloader)."""
+    if not is_overlay(path):
+        return Path(path)
+    return (Path(path).parent / read_overlay(path)["base"]).resolve()
+
+
+def load_scenario(path) -> Dict[str, Any]:
+    """Plain dataloader -> parsed JSON; overlay -> base with the patches applied."""
+    if not is_overlay(path):
+        return json.loads(Path(path).read_text(encoding="utf-8"))
+    spec = read_overlay(path)
+    base = (Path(path).parent / spec["base"]).resolve()
+    expected = spec.get("base_sha256")
+    if expected and file_sha256(str(base)) != expected:
+        raise ValueError(f"{path}: base {base.name} changed since the overlay was written")
+    return apply_patches(load_base(base), spec.get("patches") or [])
+
+
+def write_overlay(path, base_path, patches: List[Dict[str, Any]], pin_base: bool = True) -> Path:
+    """Write an overlay next to (or anywhere relative to) its base; returns the path."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    base = Path(base_path).resolve()
+    rel = Path(os.path.relpath(base, p.parent.resolve()))
+    spec: Dict[str, Any] = {"overlay_version": OVERLAY_VERSION, "base": rel.as_posix()}
+    if pin_base:
+        spec["base_sha256"] = file_sha256(str(base))
+    spec["patches"] = patches
+    p.write_text(json.dumps(spec, ensure_ascii=False, indent=2), encoding="utf-8")
+    return p
+
+
+def diff_scenario(base: Dict[str, Any], variant: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Patches turning 'base' into 'variant' (for converting existing full copies):
+    appointments/technicians by id and top-level field, options by key, other
+    top-level keys whole. Added or removed list elements are not expressible.
+    """
+    patches: List[Dict[str, Any]] = []
+    for target, list_name in ID_TARGETS.items():
+        old = {str(x.get("id")): x for x in base.get(list_name) or []}
+        new = {str(x.get("id")): x for x in variant.get(list_name) or []}
+        if old.keys() != new.keys():
+            raise ValueError(f"{list_name} differ in ids; not expressible as an overlay")
+        for item_id, b in old.items():
+            v = new[item_id]
+            if b == v:
+                continue
+            for k in list(b) + [k for k in v if k not in b]:
+                if k not in v:
+                    patches.append({target: item_id, "path": k, "op": "remove"})
+                elif b.get(k) != v[k] or k not in b:
+                    patches.append({target: item_id, "path": k, "value": v[k]})
+    b_opt, v_opt = base.get("options") or {}, variant.get("options") or {}
+    for k in list(b_opt) + [k for k in v_opt if k not in b_opt]:
+        if k not in v_opt:
+            patches.append({"option": k, "op": "remove"})
+        elif b_opt.get(k) != v_opt[k] or k not in b_opt:
+            patches.append({"option": k, "value": v_opt[k]})
+    for k in list(base) + [k for k in variant if k not in base]:
+        if k in ("options",) or k in ID_TARGETS.values():
+            continue
+        if k not in variant:
+            patches.append({"path": k, "op": "remove"})
+        elif base.get(k) != variant[k] or k not in base:
+            patches.append({"path": k, "value": variant[k]})
+    return patches
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Materialize or create overlay scenarios.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("materialize", help="overlay -> full dataloader JSON")
+    m.add_argument("overlay")
+    m.add_argument("output")
+    m.add_argument("--pretty", action="store_true")
+    d = sub.add_parser("diff", help="full variant dataloader -> overlay against a base")
+    d.add_argument("base")
+    d.add_argument("variant")
+    d.add_argument("--output", help=f"default: <variant>{OVERLAY_SUFFIX}")
+    args = ap.parse_args()
+
+    if args.cmd == "materialize":
+        write_json(args.output, load_scenario(args.overlay), compact=not args.pretty)
+        print(f"✅ Wrote {args.output}")
+    else:
+        patches = diff_scenario(load_base(args.base), json.loads(Path(args.variant).read_text(encoding="utf-8")))
+        out = write_overlay(args.output or overlay_path_for(args.variant), args.base, patches)
+        print(f"✅ Wrote {out} ({len(patches)} patch(es), {out.stat().st_size} bytes)")
+
+
+if __name__ == "__main__":
+    main()
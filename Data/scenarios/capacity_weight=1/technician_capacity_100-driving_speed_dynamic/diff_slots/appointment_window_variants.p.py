@@ -1,13 +1,19 @@
 # -*- coding: utf-8 -*-
-import json
+import sys
 from pathlib import Path
-from copy import deepcopy
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[4]))  # Data/
+from scenario_overlay import load_base
+from window_variants import iter_variants, select_appointments, write_variants
 
 day = 14
 # -------- CONFIG --------
 INPUT_RESULT_JSON  = Path(__file__).parent /f"dataloader-{day}_03_2025_pruned.json"   # input JSON dosyası
 OUTPUT_RESULT_JSON_DIR = Path(__file__).parent /f"window_variants-{day}/" # output JSON dosyalarının kaydedileceği klasör
-APPOINTMENT_ID = "9098841329"        # değiştirmek istediğin appointment ID
+APPOINTMENT_IDS = ["9098841329"]     # değiştirmek istediğin appointment ID'leri
+BUSINESS_UNITS = None                # ör. ["2541"] -> bu BU'ların tüm appointment'ları (APPOINTMENT_IDS yerine)
+COMPACT_JSON = True                  # False -> indent=2
+WRITE_OVERLAYS = True                # True -> <name>.overlay.json (base + patch, ~1 KB), False -> full copies
 # ------------------------
 
 # Yeni arrival windowlar
@@ -20,43 +26,12 @@ NEW_WINDOWS = [
     ("19:00:00", "21:00:00"),
 ]
 
-# Ensure output directory exists
-Path(OUTPUT_RESULT_JSON_DIR).mkdir(parents=True, exist_ok=True)
-
-# Load input JSON
-data = json.loads(Path(INPUT_RESULT_JSON).read_text(encoding="utf-8"))
-
-
-# Find the appointment to modify
-appt_index = None
-for i, appt in enumerate(data.get("appointments", [])):
-    if str(appt.get("id")) == str(APPOINTMENT_ID):
-        appt_index = i
-        break
-
-if appt_index is None:
-    raise ValueError(f"Appointment ID {APPOINTMENT_ID} not found in input JSON.")
-
-# Create 6 new JSONs with updated arrival windows
-for start_time, end_time in NEW_WINDOWS:
-    new_data = deepcopy(data)
-    appt = new_data["appointments"][appt_index]
-
-    # Extract date from original start (assume ISO format)
-    orig_start = appt["arrival_window"]["start"]
-    date_str = orig_start.split("T")[0]
-
-    # Set new arrival window
-    appt["arrival_window"]["start"] = f"{date_str}T{start_time}.000Z"
-    appt["arrival_window"]["end"] = f"{date_str}T{end_time}.000Z"
-    start_hh = start_time.split(":")[0]
-    end_hh   = end_time.split(":")[0]
-
-    # Create output filename
-    output_file = Path(OUTPUT_RESULT_JSON_DIR) / f"dataloader-{day}_03_2025_pruned_{APPOINTMENT_ID}_{start_hh}-{end_hh}.json"
-
-    # Write new JSON
-    with open(output_file, "w", encoding="utf-8") as f_out:
-        json.dump(new_data, f_out, indent=2, ensure_ascii=False)
+# Load input JSON (appointments indexed by id once)
+data = load_base(INPUT_RESULT_JSON)
+ids = select_appointments(data, ids=None if BUSINESS_UNITS else APPOINTMENT_IDS, business_units=BUSINESS_UNITS)
 
+# Variants are generated lazily and written one by one (duplicates skipped)
+variants = iter_variants(data, ids, NEW_WINDOWS)
+for output_file in write_variants(INPUT_RESULT_JSON, variants, OUTPUT_RESULT_JSON_DIR,
+                                  overlay=WRITE_OVERLAYS, compact=COMPACT_JSON):
     print(f"✅ Created: {output_file}")
@@ -1,34 +1,30 @@
 # -*- coding: utf-8 -*-
-import subprocess
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[4]))  # Data/
+from solver_client import SOLVER_URL, collect_jobs, run_batch
+
 # -------- CONFIG --------
 #window_variants-{day}
 day = 13
 DATA_DIR = Path(rf".\scenarios\capacity_weight=1\technician_capacity_100-driving_speed_dynamic\diff_slots\mevcut_durum")
+CONCURRENCY = 4        # aynı anda solver'a giden istek sayısı (sunucu çekirdek sayısına göre)
+REFRESH = False        # True -> cache'teki sonuçları kullanma, solver'ı yeniden çalıştır (result_cache.py)
 # ------------------------
 
-# klasördeki tüm dataloader jsonlarını al
-json_files = sorted(DATA_DIR.glob("*.json"))
-
-for input_file in json_files:
-    print("a")
-    # output dosya adı: result-<same as input>.json
-    output_file = DATA_DIR / input_file.name.replace("dataloader", "result")
-
-    # curl komutu
-    cmd = [
-        "curl",
-        "-s",
-        "-X", "POST",
-        "http://localhost:8080/dispatch_optimizer",
-        "-H", "accept: text/plain",
-        "-H", "Content-Type: application/json",
-        "--data-binary", f"@{input_file}",
-        "-o", f"{output_file}"
-    ]
+# klasördeki tüm dataloader jsonlarını al (overlay'ler dahil: <name>.overlay.json)
+# output dosya adı: result-<same as input>.json ('.overlay' düşer)
+jobs = collect_jobs(DATA_DIR, "dataloader-*.json")   # result-*.json dosyaları tekrar gönderilmez
 
-    print(f"Çalıştırılıyor: {input_file.name} -> {output_file.name}")
-    subprocess.run(cmd, check=True)
+failed = 0
+for r in run_batch(jobs, CONCURRENCY, SOLVER_URL, refresh=REFRESH):
+    if r.cached:
+        print(f"Cache: {r.input_path.name} -> {r.output_path.name}")
+    elif r.ok:
+        print(f"Tamamlandı: {r.input_path.name} -> {r.output_path.name} ({r.seconds:.0f}s)")
+    else:
+        failed += 1
+        print(f"⚠️ {r.input_path.name}: {r.error} ({r.attempts} deneme)")
 
-print("✅ Tüm dosyalar işlendi.")
+print("✅ Tüm dosyalar işlendi." if not failed else f"⚠️ {failed}/{len(jobs)} dosya başarısız.")
@@ -2,10 +2,15 @@
 """
 Batch process: Run json_to_excel.py for all result/dataloader JSON pairs in a folder.
 Only files where the suffix (after 'result-'/'dataloader-') matches are processed.
+Overlay dataloaders (<name>.overlay.json, scenario_overlay.py) match as <name>.json.
 """
 
 from pathlib import Path
 import subprocess
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[4]))  # Data/
+from scenario_overlay import scenario_name
 
 # ---------------- CONFIG ----------------
 JSON_TO_EXCEL_SCRIPT = Path(r"json_to_excel.py")
@@ -23,7 +28,7 @@ def main():
     # result/dataloader eşleştirmesi
     for result_file in result_files:
         result_suffix = result_file.name.replace("result-", "")
-        matching_dataloader = [f for f in dataloader_files if f.name.replace("dataloader-", "") == result_suffix]
+        matching_dataloader = [f for f in dataloader_files if scenario_name(f).replace("dataloader-", "") == result_suffix]
         if not matching_dataloader:
             print(f"⚠️ No matching dataloader for {result_file.name}, skipping.")
             continue
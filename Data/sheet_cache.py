@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed Excel sheets.
+
+pd.read_excel(engine="openpyxl") re-parses the whole workbook XML on every
+run. read_sheets() keeps every parsed sheet in CACHE_DIR instead, keyed by
+
+    sha256(workbook bytes) + sheet name + read_excel arguments
+
+so an edited / replaced workbook never hits a stale entry (no mtime tricks),
+and the same sheet read with different arguments (dtype=str vs header=None)
+gets its own entry. Frames are stored as Parquet when pyarrow is installed
+(string column names only), otherwise as pickle; both load in milliseconds.
+
+Entries are touched on every hit and the least recently used ones are
+deleted once the cache is larger than MAX_CACHE_MB.
+
+  python sheet_cache.py            # list entries
+  python sheet_cache.py --clear    # delete all entries
+"""
+
+import argparse
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from json_stream import file_sha256
+
+try:
+    import pyarrow  # noqa: F401  (only needed for Parquet)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# --- CONFIG ---
+CACHE_DIR = str(Path(__file__).resolve().parent / ".sheet_cache")   # next to this file, not the cwd
+MAX_CACHE_MB = 512
+# ---------------
+
+def entry_key(digest: str, sheet: str, read_kwargs: Dict) -> str:
+    args = json.dumps(read_kwargs, sort_keys=True, default=repr)
+    return hashlib.sha256(f"{digest}\0{sheet}\0{args}".encode("utf-8")).hexdigest()[:32]
+
+
+def _parquet_ok(df: pd.DataFrame) -> bool:
+    return HAS_PARQUET and all(isinstance(c, str) for c in df.columns)
+
+
+def _find_entry(cache_dir: Path, key: str) -> Optional[Path]:
+    for suffix in (".parquet", ".pkl"):
+        p = cache_dir / f"{key}{suffix}"
+        if p.exists():
+            return p
+    return None
+
+
+def _load_entry(path: Path) -> pd.DataFrame:
+    os.utime(path)   # LRU: last use = mtime
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
+
+
+def _store_entry(cache_dir: Path, key: str, df: pd.DataFrame) -> Path:
+    suffix = ".parquet" if _parquet_ok(df) else ".pkl"
+    path = cache_dir / f"{key}{suffix}"
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    if suffix == ".parquet":
+        df.to_parquet(tmp, index=True)
+    else:
+        df.to_pickle(tmp)
+    os.replace(tmp, path)   # atomic: parallel runs never see half-written entries
+    return path
+
+
+def cache_entries(cache_dir: str = CACHE_DIR) -> List[Path]:
+    d = Path(cache_dir)
+    if not d.is_dir():
+        return []
+    return [p for p in d.iterdir() if p.suffix in (".parquet", ".pkl", ".json")]
+
+
+def evict(cache_dir: str = CACHE_DIR, max_mb: float = MAX_CACHE_MB) -> int:
+    """Delete least recently used entries until the cache fits in max_mb; returns #deleted."""
+    entries = sorted(cache_entries(cache_dir), key=lambda p: p.stat().st_mtime)
+    total = sum(p.stat().st_size for p in entries)
+    limit = max_mb * 1e6
+    deleted = 0
+    for p in entries:
+        if total <= limit:
+            break
+        total -= p.stat().st_size
+        p.unlink(missing_ok=True)
+        deleted += 1
+    return deleted
+
+
+def read_sheets(xlsx: str, sheets: List[str], cache_dir: str = CACHE_DIR, **read_kwargs) -> Dict[str, pd.DataFrame]:
+    """
+    {sheet: DataFrame} like pd.read_excel(xlsx, sheet_name=sheets, **read_kwargs);
+    only the sheets missing from the cache are parsed (one workbook open for all of them).
+    """
+    d = Path(cache_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    digest = file_sha256(xlsx)
+    keys = {s: entry_key(digest, s, read_kwargs) for s in sheets}
+
+    out: Dict[str, pd.DataFrame] = {}
+    misses = []
+    for s in sheets:
+        p = _find_entry(d, keys[s])
+        if p is not None:
+            out[s] = _load_entry(p)
+        else:
+            misses.append(s)
+
+    if misses:
+        parsed = pd.read_excel(xlsx, sheet_name=misses, engine="openpyxl", **read_kwargs)
+        for s in misses:
+            _store_entry(d, keys[s], parsed[s])
+            out[s] = parsed[s]
+        evict(cache_dir)
+    return {s: out[s] for s in sheets}
+
+
+def read_sheet(xlsx: str, sheet: str, cache_dir: str = CACHE_DIR, **read_kwargs) -> pd.DataFrame:
+    return read_sheets(xlsx, [sheet], cache_dir=cache_dir, **read_kwargs)[sheet]
+
+
+def sheet_names(xlsx: str, cache_dir: str = CACHE_DIR) -> List[str]:
+    """Sheet names of the workbook (cached under the same content hash)."""
+    d = Path(cache_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    p = d / f"{entry_key(file_sha256(xlsx), '', {'sheet_names': True})}.json"
+    if p.exists():
+        os.utime(p)
+        return json.loads(p.read_text(encoding="utf-8"))
+    names = pd.ExcelFile(xlsx, engine="openpyxl").sheet_names
+    p.write_text(json.dumps(names, ensure_ascii=False), encoding="utf-8")
+    return names
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect or clear the parsed-sheet cache.")
+    ap.add_argument("--clear", action="store_true", help="delete all cache entries")
+    args = ap.parse_args()
+
+    entries = cache_entries()
+    if args.clear:
+        for p in entries:
+            p.unlink(missing_ok=True)
+        print(f"✅ Deleted {len(entries)} entries from {CACHE_DIR}")
+        return
+    total = sum(p.stat().st_size for p in entries)
+    fmt = "parquet" if HAS_PARQUET else "pickle"
+    print(f"{CACHE_DIR}: {len(entries)} entries, {total / 1e6:.1f} MB of {MAX_CACHE_MB} MB ({fmt})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Time-dependent duration matrices: one duration matrix per 2-hour slot.
+
+A slot's matrix is the store's duration matrix divided by the slot's speed
+factor (time_slots.SLOT_SPEED_FACTORS, the same per-slot speed model as
+geo_matrix.py):
+
+  duration[s] = duration / SLOT_SPEED_FACTORS[s]
+
+Nothing is precomputed or saved: the matrix is derived for whatever (pruned)
+store a payload builder works on, so it is valid for every store, including
+one extended by matrix_store.extend_matrix_store / matrix_cache.py.
+
+A payload builder (DURATION_SLOT in data_parser.py) can emit
+  - one slot's matrix (e.g. the board's first slot), or
+  - "worst": the element-wise maximum over all slots (a safe plan for any
+    hour), i.e. the duration divided by the smallest factor.
+
+main() prints the median trip duration of the store per slot.
+"""
+
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+from matrix_store import STORE_DTYPE, MatrixStore, load_matrix_store
+from time_slots import SLOT_LABELS, SLOT_SPEED_FACTORS
+
+# --- CONFIG ---
+STORE_PREFIX = "matrix_store"
+# ---------------
+
+WORST_CASE = "worst"
+
+
+class SlotDurations:
+    """Slot labels + speed factors; slot matrices are derived from a store's durations."""
+
+    def __init__(self, labels: Sequence[str] = SLOT_LABELS, factors: Optional[Dict[str, float]] = None):
+        factors = SLOT_SPEED_FACTORS if factors is None else factors
+        missing = [s for s in labels if s not in factors]
+        if missing:
+            raise ValueError(f"No speed factor for slot(s) {missing}")
+        self.labels = list(labels)
+        self.factors = np.array([factors[s] for s in self.labels], dtype=STORE_DTYPE)
+        if (self.factors <= 0).any():
+            raise ValueError(f"Speed factors must be positive: {self.factors.tolist()}")
+
+    def factor(self, which: str) -> np.float32:
+        """Speed factor of slot 'which'; WORST_CASE -> the slowest slot's."""
+        if which == WORST_CASE:
+            return self.factors.min()
+        if which in self.labels:
+            return self.factors[self.labels.index(which)]
+        raise ValueError(f"Unknown slot {which!r}; expected one of {self.labels + [WORST_CASE]}")
+
+    def matrix(self, duration: np.ndarray, which: str) -> np.ndarray:
+        """Duration matrix of slot 'which' (or WORST_CASE) for the store's 'duration' matrix."""
+        return np.asarray(duration, dtype=STORE_DTYPE) / self.factor(which)
+
+    def apply_to(self, store: MatrixStore, which: str) -> MatrixStore:
+        """Copy of 'store' whose duration matrix is the slot's (or worst-case) one."""
+        return MatrixStore(store.coordinates, store.distance, self.matrix(store.duration, which))
+
+
+def main():
+    store = load_matrix_store(STORE_PREFIX)
+    slots = SlotDurations()
+    off = ~np.eye(len(store), dtype=bool)
+    base = float(np.median(np.asarray(store.duration)[off])) if len(store) > 1 else 0.0
+    print(f"{STORE_PREFIX}: {len(store)} locations, median trip {base / 60:.1f} min")
+    for which in slots.labels + [WORST_CASE]:
+        f = float(slots.factor(which))
+        print(f"  {which:<12} x{1 / f:.2f}  median {base / f / 60:.1f} min")
+
+
+if __name__ == "__main__":
+    main()
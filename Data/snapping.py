@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Coordinate snapping: collapse near-duplicate customer locations.
+
+The same address often shows up with slightly different coordinates (5th/6th
+decimal, or full double precision next to 6-decimal points). Each spelling is
+its own matrix row and column, so the matrix grows quadratically with noise.
+
+snap_coordinates() clusters the points with the grid index of sparse_matrix.py:
+  1. all pairs within SNAP_RADIUS_M (GridIndex.query_radius, ~N x neighbours),
+  2. greedy leaders: protected points (office, homes) first, then the most
+     used coordinates; every leader absorbs its not yet assigned neighbours.
+Every point ends up within the radius of its representative (no chaining),
+and representatives are existing coordinates, so they stay valid matrix keys.
+
+main() snaps appointments.txt (matrix_generator.py output), weighted by the
+number of appointments per coordinate in WEIGHTS_SHEET (same coordinate
+extraction and corrections as matrix_generator.py), and writes
+  - MAPPING_CSV       coordinate, representative, distance_m (all points),
+  - OUTPUT_COORDS_TXT representatives only, appointments.txt format
+                      (input for the routing tool / geo_matrix.py).
+data_parser.py applies the mapping to the appointments with SNAP_MAPPING_CSV.
+"""
+
+import csv
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from coord_registry import CoordRegistry, canonical_coord, key_to_lonlat
+from geo_matrix import haversine_m, read_coords_txt
+from matrix_generator import CORRECTIONS_XLSX, extract_coordinates, load_corrections
+from sheet_cache import read_sheet
+from sparse_matrix import GridIndex, pairs_to_csr
+
+# --- CONFIG ---
+INPUT_COORDS_TXT = "appointments.txt"
+OUTPUT_COORDS_TXT = "appointments_snapped.txt"
+MAPPING_CSV = "coord_snap_map.csv"
+SNAP_RADIUS_M = 25.0
+OFFICE_COORD = "27.436587,38.626512"   # lon,lat; never moved
+WEIGHTS_XLSX: Optional[str] = "28002357 Yiğit Klima 10-14 Mart 2025_SON Veri_Düzeltilmiştir.xlsx"   # None -> unweighted
+WEIGHTS_SHEET = "RAPOR"                # appointments per coordinate pick the cluster representative
+# ---------------
+
+
+def snap_coordinates(keys: Iterable[str],
+                     radius_m: float = SNAP_RADIUS_M,
+                     weights: Optional[Dict[str, int]] = None,
+                     protected: Iterable[str] = ()) -> Dict[str, str]:
+    """
+    {coordinate: representative} for every canonical key in 'keys'.
+    'weights' (e.g. appointment counts) decide which spelling represents a cluster;
+    'protected' keys are always their own representative.
+    """
+    reg = CoordRegistry(keys)
+    n = len(reg)
+    if n == 0:
+        return {}
+    if radius_m <= 0:
+        return {k: k for k in reg.keys}
+    lonlat = reg.lonlat()
+    rows, cols = GridIndex(lonlat, radius_m).query_radius(radius_m)
+    indptr, indices = pairs_to_csr(n, rows, cols)
+
+    w = np.array([(weights or {}).get(k, 0) for k in reg.keys], dtype=np.float64)
+    prot = np.zeros(n, dtype=bool)
+    prot_ids = reg.ids_of([canonical_coord(p) or "" for p in protected])
+    prot[prot_ids[prot_ids >= 0]] = True
+    # protected first, then heavier, then key order (stable)
+    order = np.lexsort((np.arange(n), -w, ~prot))
+
+    rep = np.full(n, -1, dtype=np.int64)
+    for i in order:
+        if rep[i] >= 0:
+            continue
+        rep[i] = i
+        nb = indices[indptr[i]:indptr[i + 1]]
+        free = nb[(rep[nb] < 0) & ~prot[nb]]
+        rep[free] = i
+    keys_list = reg.keys
+    return {keys_list[i]: keys_list[r] for i, r in enumerate(rep)}
+
+
+def appointment_weights(xlsx: str, sheet: str, corrections_xlsx: Optional[str] = CORRECTIONS_XLSX) -> Dict[str, int]:
+    """{canonical key: number of appointments} of a RAPOR sheet (rejected coordinates left out)."""
+    rapor = read_sheet(xlsx, sheet, dtype=str)
+    keys, _ = extract_coordinates(rapor, load_corrections(corrections_xlsx))
+    return {k: int(c) for k, c in keys.value_counts().items()}
+
+
+def snap_summary(mapping: Dict[str, str]) -> str:
+    before = len(mapping)
+    after = len(set(mapping.values()))
+    saved = 100.0 * (1 - (after * after) / (before * before)) if before else 0.0
+    return f"{before} -> {after} locations ({before - after} snapped, {saved:.1f}% fewer matrix cells)"
+
+
+def save_snap_mapping(path: str, mapping: Dict[str, str]) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        wr = csv.writer(f)
+        wr.writerow(["coordinate", "representative", "distance_m"])
+        for k, r in mapping.items():
+            d = haversine_m([key_to_lonlat(k)], [key_to_lonlat(r)])[0, 0] if k != r else 0.0
+            wr.writerow([k, r, f"{d:.1f}"])
+
+
+def load_snap_mapping(path: str) -> Dict[str, str]:
+    """{coordinate: representative}, both canonical keys."""
+    out: Dict[str, str] = {}
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            k, r = canonical_coord(row["coordinate"]), canonical_coord(row["representative"])
+            if k and r:
+                out[k] = r
+    return out
+
+
+def write_coords_txt(path: str, keys: List[str]) -> None:
+    """appointments.txt format: "lonvlat" <TAB> lon <TAB> lat, one line per key."""
+    with open(path, "w") as f:
+        f.write("\n".join(f"\"{k.replace(',', 'v')}\"\t{k.split(',')[0]}\t{k.split(',')[1]}" for k in keys))
+
+
+def main():
+    keys = read_coords_txt(INPUT_COORDS_TXT)
+    weights = appointment_weights(WEIGHTS_XLSX, WEIGHTS_SHEET) if WEIGHTS_XLSX else None
+    if weights:
+        print(f"Weights: {sum(weights.values())} appointments on {len(weights)} coordinates ({WEIGHTS_SHEET})")
+    mapping = snap_coordinates(keys, SNAP_RADIUS_M, weights=weights, protected=[OFFICE_COORD])
+    save_snap_mapping(MAPPING_CSV, mapping)
+    reps = list(dict.fromkeys(mapping.values()))
+    write_coords_txt(OUTPUT_COORDS_TXT, reps)
+    print(f"Snapping within {SNAP_RADIUS_M:g} m: {snap_summary(mapping)}")
+    print(f"✅ Wrote {MAPPING_CSV} and {OUTPUT_COORDS_TXT}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+Batch client for the WebApi (POST /dispatch_optimizer), pure Python.
+
+  - up to CONCURRENCY requests in flight (thread pool; the solver itself is
+    single-request-per-core, so this is the knob for a multi-core server),
+  - one keep-alive http.client connection per worker thread, reused across
+    requests and reopened after errors,
+  - per-request timeout from the payload's options.run_time_limit
+    (x TIMEOUT_FACTOR + TIMEOUT_MARGIN_S; the solver default is 420 s),
+  - retries with exponential backoff + jitter on connect errors (refused,
+    connect timeout), dropped / reset connections and 5xx. 4xx is not
+    retried, and neither is a read timeout: the solver is still busy with
+    the request, so resending it would only queue a second full run
+    (RETRY_READ_TIMEOUTS / --retry-timeouts to retry them anyway),
+  - the response body is streamed to <output>.part and renamed when complete,
+    so an interrupted run never leaves a truncated result behind.
+
+Overlay dataloaders (<name>.overlay.json, scenario_overlay.py) are materialized
+in memory and sent as the request body.
+
+Results are cached by request content + solver version (result_cache.py): a
+byte-identical (or key-order / whitespace-different) request is answered from
+the cache without calling the solver. --refresh forces a fresh run (and
+updates the entry), --no-cache leaves the cache out entirely.
+
+    python solver_client.py <dir> [--pattern "dataloader-*.json"] [--concurrency 4] [--refresh]
+"""
+
+import argparse
+import http.client
+import os
+import random
+import re
+import socket
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import result_cache
+from json_stream import dumps_json
+from scenario_overlay import is_overlay, load_scenario, scenario_name
+
+# --- CONFIG ---
+SOLVER_URL = "http://localhost:8080/dispatch_optimizer"
+CONCURRENCY = 4
+DEFAULT_RUN_TIME_LIMIT = 420      # s, solver default when options.run_time_limit is missing
+TIMEOUT_FACTOR = 1.5
+TIMEOUT_MARGIN_S = 60
+MAX_RETRIES = 3
+BACKOFF_S = 2.0                   # 2, 4, 8, ... (+ jitter)
+RETRY_READ_TIMEOUTS = False       # True -> a request the solver did not answer in time is sent again
+CHUNK_BYTES = 1 << 16
+# ---------------
+
+_RUN_TIME_LIMIT_RE = re.compile(rb'"run_time_limit"\s*:\s*([0-9.]+)')
+_local = threading.local()
+
+
+class ConnectFailed(ConnectionError):
+    """The solver host could not be reached (refused, unreachable, connect timeout)."""
+
+
+class ReadTimeout(Exception):
+    """The request was sent but no (complete) response arrived within the timeout."""
+
+
+@dataclass
+class RunResult:
+    input_path: Path
+    output_path: Path
+    ok: bool
+    status: Optional[int]
+    attempts: int
+    seconds: float
+    error: Optional[str] = None
+    cached: bool = False
+
+
+def result_path_for(input_path: Path, output_dir: Optional[Path] = None) -> Path:
+    """dataloader-x.json / dataloader-x.overlay.json -> result-x.json (next to the input by default)."""
+    name = scenario_name(input_path).replace("dataloader", "result")
+    return (Path(output_dir) if output_dir else Path(input_path).parent) / name
+
+
+def request_body(input_path: Path) -> Tuple[bytes, float]:
+    """(body bytes, run_time_limit in s) of a dataloader or overlay file."""
+    if is_overlay(input_path):
+        payload = load_scenario(input_path)
+        limit = (payload.get("options") or {}).get("run_time_limit")
+        return dumps_json(payload).encode("utf-8"), float(limit or DEFAULT_RUN_TIME_LIMIT)
+    body = Path(input_path).read_bytes()
+    m = _RUN_TIME_LIMIT_RE.search(body)
+    return body, float(m.group(1)) if m else float(DEFAULT_RUN_TIME_LIMIT)
+
+
+def request_timeout(run_time_limit: float) -> float:
+    return run_time_limit * TIMEOUT_FACTOR + TIMEOUT_MARGIN_S
+
+
+def _conns() -> dict:
+    if not hasattr(_local, "conns"):
+        _local.conns = {}
+    return _local.conns
+
+
+def _connection(url: str, timeout: float) -> http.client.HTTPConnection:
+    """This thread's keep-alive connection to the solver host."""
+    parts = urlsplit(url)
+    key = (parts.scheme, parts.netloc)
+    conn = _conns().get(key)
+    if conn is None:
+        cls = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        conn = _conns()[key] = cls(parts.netloc, timeout=timeout)
+    conn.timeout = timeout
+    if conn.sock is not None:
+        conn.sock.settimeout(timeout)
+    return conn
+
+
+def _drop_connection(url: str) -> None:
+    parts = urlsplit(url)
+    conn = _conns().pop((parts.scheme, parts.netloc), None)
+    if conn is not None:
+        conn.close()
+
+
+def post_to_file(url: str, body: bytes, output_path: Path, timeout: float) -> int:
+    """
+    One POST; streams a 2xx body to output_path. Returns the HTTP status.
+    Raises ConnectFailed when the host cannot be reached and ReadTimeout when
+    the response does not arrive in time; a dropped connection surfaces as
+    ConnectionError (reset / aborted / RemoteDisconnected).
+    """
+    parts = urlsplit(url)
+    conn = _connection(url, timeout)
+    if conn.sock is None:
+        try:
+            conn.connect()
+        except OSError as e:
+            raise ConnectFailed(f"{type(e).__name__}: {e}") from e
+    conn.request("POST", parts.path or "/", body=body, headers={
+        "accept": "text/plain",
+        "Content-Type": "application/json",
+        "Connection": "keep-alive",
+    })
+    try:
+        resp = conn.getresponse()
+        if not 200 <= resp.status < 300:
+            resp.read()   # drain, so the connection can be reused
+            return resp.status
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = output_path.with_name(output_path.name + ".part")
+        with open(tmp, "wb") as f:
+            for chunk in iter(lambda: resp.read(CHUNK_BYTES), b""):
+                f.write(chunk)
+    except socket.timeout as e:
+        raise ReadTimeout(f"no response within {timeout:.0f}s") from e
+    os.replace(tmp, output_path)
+    if resp.will_close:
+        _drop_connection(url)
+    return resp.status
+
+
+def run_one(input_path: Path, output_path: Path, url: str = SOLVER_URL,
+            max_retries: int = MAX_RETRIES, backoff_s: float = BACKOFF_S,
+            cache_dir: Optional[str] = result_cache.CACHE_DIR,
+            solver_version: str = result_cache.SOLVER_VERSION,
+            refresh: bool = False,
+            retry_read_timeouts: bool = RETRY_READ_TIMEOUTS) -> RunResult:
+    """
+    One dataloader -> result file. cache_dir=None disables the result cache;
+    refresh=True skips the lookup but still stores the new result. Connect
+    errors, dropped connections and 5xx are retried; read timeouts only with
+    retry_read_timeouts=True, other errors never.
+    """
+    t0 = time.perf_counter()
+    try:
+        body, limit = request_body(input_path)
+        key = result_cache.request_key(body, solver_version) if cache_dir else None
+    except Exception as e:   # unreadable file / broken overlay: nothing to retry
+        return RunResult(input_path, output_path, False, None, 0, time.perf_counter() - t0, f"{type(e).__name__}: {e}")
+    if key and not refresh and result_cache.fetch(key, output_path, cache_dir):
+        return RunResult(input_path, output_path, True, None, 0, time.perf_counter() - t0, cached=True)
+    timeout = request_timeout(limit)
+
+    status, error = None, None
+    for attempt in range(1, max_retries + 2):
+        try:
+            status = post_to_file(url, body, output_path, timeout)
+            error = None if 200 <= status < 300 else f"HTTP {status}"
+            if error is None and key:
+                result_cache.store(key, output_path, cache_dir)
+            if error is None or status < 500:
+                return RunResult(input_path, output_path, error is None, status, attempt,
+                                 time.perf_counter() - t0, error)
+        except (OSError, http.client.HTTPException, ReadTimeout) as e:
+            _drop_connection(url)
+            output_path.with_name(output_path.name + ".part").unlink(missing_ok=True)
+            status, error = None, f"{type(e).__name__}: {e}"
+            retryable = isinstance(e, ConnectionError) or (retry_read_timeouts and isinstance(e, ReadTimeout))
+            if not retryable:   # read timeout (solver still busy), bad status line, disk error
+                return RunResult(input_path, output_path, False, None, attempt, time.perf_counter() - t0, error)
+        if attempt <= max_retries:
+            time.sleep(backoff_s * 2 ** (attempt - 1) * (1 + random.random() * 0.25))
+    return RunResult(input_path, output_path, False, status, max_retries + 1, time.perf_counter() - t0, error)
+
+
+def run_batch(jobs: Iterable[Tuple[Path, Path]], concurrency: int = CONCURRENCY,
+              url: str = SOLVER_URL, max_retries: int = MAX_RETRIES,
+              cache_dir: Optional[str] = result_cache.CACHE_DIR,
+              solver_version: str = result_cache.SOLVER_VERSION,
+              refresh: bool = False,
+              retry_read_timeouts: bool = RETRY_READ_TIMEOUTS) -> Iterator[RunResult]:
+    """
+    Runs (input, output) jobs with at most 'concurrency' in flight; yields the
+    results in completion order. Jobs are pulled lazily, so bodies of queued
+    files are not held in memory.
+    """
+    jobs = iter(jobs)
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="solver") as pool:
+        pending = set()
+        for inp, out in jobs:
+            pending.add(pool.submit(run_one, Path(inp), Path(out), url, max_retries, BACKOFF_S,
+                                    cache_dir, solver_version, refresh, retry_read_timeouts))
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield fut.result()
+        for fut in as_completed(pending):
+            yield fut.result()
+
+
+def collect_jobs(data_dir: Path, pattern: str = "dataloader-*.json", output_dir: Optional[Path] = None,
+                 skip_existing: bool = False) -> List[Tuple[Path, Path]]:
+    """
+    (input, result) pairs for 'pattern' under data_dir. With output_dir, results
+    keep their subfolder (sweep scenarios all share one file name).
+    """
+    jobs = []
+    for inp in sorted(Path(data_dir).glob(pattern)):
+        out = result_path_for(inp, Path(output_dir) / inp.parent.relative_to(data_dir) if output_dir else None)
+        if skip_existing and out.exists():
+            continue
+        jobs.append((inp, out))
+    return jobs
+
+
+def _shown(path: Path, root: Path) -> str:
+    """'path' relative to 'root' for the progress lines; the bare name says nothing for sweep folders."""
+    try:
+        return Path(path).relative_to(root).as_posix()
+    except ValueError:
+        return str(path)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="POST all dataloaders of a folder to the solver.")
+    ap.add_argument("data_dir")
+    ap.add_argument("--pattern", default="dataloader-*.json", help="also matches <name>.overlay.json")
+    ap.add_argument("--output-dir", default=None, help="default: next to the inputs")
+    ap.add_argument("--url", default=SOLVER_URL)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--retries", type=int, default=MAX_RETRIES)
+    ap.add_argument("--retry-timeouts", action="store_true", default=RETRY_READ_TIMEOUTS,
+                    help="also resend requests the solver did not answer within the timeout")
+    ap.add_argument("--skip-existing", action="store_true", help="skip inputs whose result file exists")
+    ap.add_argument("--refresh", action="store_true", help="fresh solver runs, ignore cached results (entries are updated)")
+    ap.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    ap.add_argument("--solver-version", default=result_cache.SOLVER_VERSION, help="result cache version tag")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    out_root = Path(args.output_dir) if args.output_dir else data_dir
+    jobs = collect_jobs(data_dir, args.pattern, Path(args.output_dir) if args.output_dir else None, args.skip_existing)
+    print(f"Running {len(jobs)} dataloader(s), {args.concurrency} at a time -> {args.url}")
+    t0 = time.perf_counter()
+    failed = 0
+    cache_dir = None if args.no_cache else result_cache.CACHE_DIR
+    for r in run_batch(jobs, args.concurrency, args.url, args.retries, cache_dir, args.solver_version, args.refresh,
+                       args.retry_timeouts):
+        inp, out = _shown(r.input_path, data_dir), _shown(r.output_path, out_root)
+        if r.cached:
+            print(f"✅ {inp} -> {out} (cached)")
+        elif r.ok:
+            print(f"✅ {inp} -> {out} ({r.seconds:.1f}s, attempt {r.attempts})")
+        else:
+            failed += 1
+            print(f"⚠️ {inp}: {r.error} after {r.attempts} attempt(s)")
+    print(f"⏱️ {len(jobs) - failed}/{len(jobs)} done in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
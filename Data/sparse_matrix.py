@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+Sparse (radius / k-nearest) distance-duration matrices.
+
+The solver treats a pair that is missing from the 'matrix' section as
+unreachable (Optimizer.TravelingCostFromTo / DrivingTimeInMinsFromTo return
+MaxValue), so a board does not need the pairs it would never drive anyway:
+
+  - radius mode: pairs whose store distance is <= radius (the options'
+    distance_limit_between_jobs),
+  - knn mode:    the k nearest locations of every location (great-circle),
+    made symmetric so that a kept pair can be driven both ways.
+
+The diagonal is always kept, and 'keep_full' coordinates (office, technician
+homes) keep their whole row and column so every job stays reachable from a
+start/end point. Candidate pairs come from a uniform grid over the registry's
+coordinates, so the work is ~N x neighbours instead of N^2.
+
+Storage is CSR in one .npz file: coordinates, indptr, indices, distance, duration.
+Note that the solver's IdealTravelTime is the mean of the pairs it receives,
+so it is lower for a sparse matrix than for the dense one.
+"""
+
+import math
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from coord_registry import CoordRegistry
+from geo_matrix import EARTH_RADIUS_M, haversine_m
+from matrix_store import STORE_DTYPE, MatrixStore, load_matrix_store
+
+# --- CONFIG ---
+STORE_PREFIX = "matrix_store"
+SPARSE_NPZ = "matrix_store.sparse.npz"
+MODE = "radius"                 # "radius" | "knn"
+RADIUS_M = 400000               # = options["distance_limit_between_jobs"]
+KNN_K = 50
+# ---------------
+
+GRID_SLACK = 0.02               # planar cells vs great-circle distance
+QUERY_CHUNK = 1024              # points per distance block
+
+
+class GridIndex:
+    """Uniform grid over [lon, lat] points (equirectangular projection, meters)."""
+
+    def __init__(self, lonlat: np.ndarray, cell_m: float):
+        self.lonlat = np.asarray(lonlat, dtype=np.float64).reshape(-1, 2)
+        self.cell_m = float(cell_m)
+        n = len(self.lonlat)
+        lat0 = math.radians(float(self.lonlat[:, 1].mean())) if n else 0.0
+        xy = np.radians(self.lonlat) * EARTH_RADIUS_M
+        xy[:, 0] *= math.cos(lat0)
+        self.cells = np.floor(xy / self.cell_m).astype(np.int64)
+
+        self._order = np.lexsort((self.cells[:, 1], self.cells[:, 0]))
+        self._buckets: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        if n:
+            uniq, start, count = np.unique(self.cells[self._order], axis=0,
+                                           return_index=True, return_counts=True)
+            for (cx, cy), s, c in zip(uniq.tolist(), start.tolist(), count.tolist()):
+                self._buckets[(cx, cy)] = (s, c)
+            self._span = int((self.cells.max(axis=0) - self.cells.min(axis=0)).max())
+        else:
+            self._span = 0
+
+    def __len__(self) -> int:
+        return len(self.lonlat)
+
+    def occupied(self) -> Iterator[Tuple[Tuple[int, int], np.ndarray]]:
+        """(cell, point ids) for every non-empty cell."""
+        for cell, (s, c) in self._buckets.items():
+            yield cell, self._order[s:s + c]
+
+    def ring_members(self, cell: Tuple[int, int], r: int) -> np.ndarray:
+        """Point ids in all cells within Chebyshev distance 'r' of 'cell'."""
+        cx, cy = cell
+        parts = []
+        for dx in range(-r, r + 1):
+            for dy in range(-r, r + 1):
+                b = self._buckets.get((cx + dx, cy + dy))
+                if b is not None:
+                    parts.append(self._order[b[0]:b[0] + b[1]])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def query_radius(self, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, cols) of all pairs with great-circle distance <= radius_m."""
+        rings = max(1, math.ceil(radius_m * (1 + GRID_SLACK) / self.cell_m))
+        rows, cols = [], []
+        for cell, pts in self.occupied():
+            cand = self.ring_members(cell, rings)
+            for s in range(0, len(pts), QUERY_CHUNK):
+                p = pts[s:s + QUERY_CHUNK]
+                ii, jj = np.nonzero(haversine_m(self.lonlat[p], self.lonlat[cand]) <= radius_m)
+                rows.append(p[ii])
+                cols.append(cand[jj])
+        return _concat(rows), _concat(cols)
+
+    def query_knn(self, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(rows, cols): every point with its k nearest other points (great-circle)."""
+        n = len(self)
+        if n <= k + 1:
+            ids = np.arange(n, dtype=np.int64)
+            return np.repeat(ids, n), np.tile(ids, n)
+        rows, cols = [], []
+        for cell, pts in self.occupied():
+            r = 1
+            while True:
+                cand = self.ring_members(cell, r)
+                if len(cand) > k or r > self._span:
+                    d = haversine_m(self.lonlat[pts], self.lonlat[cand])
+                    kk = min(k, len(cand) - 1)
+                    # points outside ring r are at least r cells away
+                    if r > self._span or np.partition(d, kk, axis=1)[:, kk].max() <= r * self.cell_m * (1 - GRID_SLACK):
+                        nearest = np.argpartition(d, kk, axis=1)[:, :kk + 1]
+                        rows.append(np.repeat(pts, kk + 1))
+                        cols.append(cand[nearest].ravel())
+                        break
+                r += 1
+        return _concat(rows), _concat(cols)
+
+
+def _concat(parts: List[np.ndarray]) -> np.ndarray:
+    return np.concatenate(parts).astype(np.int64) if parts else np.empty(0, dtype=np.int64)
+
+
+def knn_cell_size(lonlat: np.ndarray, k: int) -> float:
+    """Cell edge (m) so that an average cell holds about k points."""
+    lonlat = np.asarray(lonlat, dtype=np.float64)
+    if len(lonlat) < 2:
+        return 1000.0
+    lat0 = math.radians(float(lonlat[:, 1].mean()))
+    ext = np.radians(lonlat.max(axis=0) - lonlat.min(axis=0)) * EARTH_RADIUS_M
+    area = max(ext[0] * math.cos(lat0), 1.0) * max(ext[1], 1.0)
+    return max(math.sqrt(area * k / len(lonlat)), 100.0)
+
+
+def pairs_to_csr(n: int, rows: np.ndarray, cols: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Deduplicated, row-sorted CSR structure (indptr, indices) of the given pairs."""
+    keys = np.unique(rows.astype(np.int64) * n + cols.astype(np.int64))
+    r = keys // n
+    indices = (keys % n).astype(np.int32)
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(r, minlength=n), out=indptr[1:])
+    return indptr, indices
+
+
+class SparseMatrix:
+    """CSR distance/duration matrices over a coordinate list."""
+
+    def __init__(self, coordinates: Sequence[str], indptr: np.ndarray, indices: np.ndarray,
+                 distance: np.ndarray, duration: np.ndarray):
+        self.registry = CoordRegistry(coordinates)
+        n = len(self.registry)
+        if n != len(coordinates) or len(indptr) != n + 1:
+            raise ValueError("Sparse matrix index does not match its coordinates")
+        if not (len(indices) == len(distance) == len(duration) == indptr[-1]):
+            raise ValueError("Sparse matrix arrays have inconsistent lengths")
+        self.indptr = indptr
+        self.indices = indices
+        self.distance = distance
+        self.duration = duration
+
+    @property
+    def coordinates(self) -> List[str]:
+        return self.registry.keys
+
+    def __len__(self) -> int:
+        return len(self.coordinates)
+
+    @property
+    def nnz(self) -> int:
+        return int(self.indptr[-1])
+
+    def row(self, kind: str, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(column ids, values) of row i."""
+        s, e = self.indptr[i], self.indptr[i + 1]
+        return self.indices[s:e], getattr(self, kind)[s:e]
+
+    def value(self, kind: str, origin: Optional[str], dest: Optional[str]) -> Optional[float]:
+        i = self.registry.get(origin)
+        j = self.registry.get(dest)
+        if i is None or j is None:
+            return None
+        cols, vals = self.row(kind, i)
+        p = int(np.searchsorted(cols, j))
+        return float(vals[p]) if p < len(cols) and cols[p] == j else None
+
+    def iter_rows(self, kind: str,
+                  transform: Optional[Callable[[int, np.ndarray, np.ndarray], np.ndarray]] = None
+                  ) -> Iterator[Tuple[str, Dict[str, float]]]:
+        """Yield (from, {to: value}) for the kept pairs; 'transform(i, values, cols)' may rewrite a row."""
+        keys = self.coordinates
+        for i, k in enumerate(keys):
+            cols, vals = self.row(kind, i)
+            if transform is not None:
+                vals = transform(i, vals, cols)
+            yield k, {keys[j]: v for j, v in zip(cols.tolist(), vals.tolist())}
+
+
+def sparsify_store(store: MatrixStore,
+                   radius_m: Optional[float] = None,
+                   k: Optional[int] = None,
+                   keep_full: Iterable[Optional[str]] = ()) -> SparseMatrix:
+    """Radius (store distance <= radius_m) or symmetric kNN sparse copy of 'store'."""
+    if (radius_m is None) == (k is None):
+        raise ValueError("Give exactly one of radius_m or k")
+    n = len(store)
+    lonlat = store.registry.lonlat()
+
+    if k is not None:
+        grid = GridIndex(lonlat, knn_cell_size(lonlat, k))
+        rows, cols = grid.query_knn(k)
+        rows, cols = np.concatenate([rows, cols]), np.concatenate([cols, rows])
+    else:
+        # road distance >= great-circle distance, so this is a superset of the kept pairs
+        grid = GridIndex(lonlat, radius_m * (1 + GRID_SLACK))
+        rows, cols = grid.query_radius(radius_m * (1 + GRID_SLACK))
+        ok = np.asarray(store.distance[rows, cols]) <= radius_m
+        rows, cols = rows[ok], cols[ok]
+
+    full = store.registry.ids_of(keep_full)
+    full = full[full >= 0]
+    everyone = np.arange(n, dtype=np.int64)
+    diag = everyone
+    rows = np.concatenate([rows, diag, np.repeat(full, n), np.tile(everyone, len(full))])
+    cols = np.concatenate([cols, diag, np.tile(everyone, len(full)), np.repeat(full, n)])
+
+    indptr, indices = pairs_to_csr(n, rows, cols)
+    r = np.repeat(np.arange(n, dtype=np.int64), np.diff(indptr))
+    distance = np.asarray(store.distance[r, indices], dtype=STORE_DTYPE)
+    duration = np.asarray(store.duration[r, indices], dtype=STORE_DTYPE)
+    return SparseMatrix(store.coordinates, indptr, indices, distance, duration)
+
+
+def sparsity_summary(sm: SparseMatrix) -> str:
+    n = len(sm)
+    dense = n * n
+    kept = 100.0 * sm.nnz / dense if dense else 0.0
+    return f"sparse matrix {n} locations, {sm.nnz:,} of {dense:,} pairs ({kept:.1f}% kept, {sm.nnz / max(n, 1):.0f}/row)"
+
+
+def save_sparse_matrix(path: str, sm: SparseMatrix) -> None:
+    np.savez(path, coordinates=np.array(sm.coordinates), indptr=sm.indptr, indices=sm.indices,
+             distance=sm.distance, duration=sm.duration)
+
+
+def load_sparse_matrix(path: str) -> SparseMatrix:
+    with np.load(path) as z:
+        return SparseMatrix(z["coordinates"].tolist(), z["indptr"], z["indices"], z["distance"], z["duration"])
+
+
+def main():
+    store = load_matrix_store(STORE_PREFIX)
+    if MODE == "knn":
+        sm = sparsify_store(store, k=KNN_K)
+    elif MODE == "radius":
+        sm = sparsify_store(store, radius_m=RADIUS_M)
+    else:
+        raise ValueError(f"Unknown MODE {MODE!r} (expected 'radius' or 'knn')")
+    save_sparse_matrix(SPARSE_NPZ, sm)
+    print(f"✅ Wrote {SPARSE_NPZ}: {sparsity_summary(sm)}")
+
+
+if __name__ == "__main__":
+    main()
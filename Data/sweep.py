@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+Parameter sweeps over dataloader options and matrix variants.
+
+Instead of editing the options dict in data_parser.py and naming scenario
+folders by hand, a sweep is described by a small JSON spec:
+
+  {
+    "name": "capacity_sweep",
+    "day": "14_03_2025",                                  # RAPOR-<day> sheet
+    "matrix": {                                           # matrix variants
+      "dense": {},                                        #   data_parser.py settings
+      "worst_slot": {"DURATION_SLOT": "worst"},
+      "knn": {"MATRIX_MODE": "knn", "KNN_K": 30},
+      "prebuilt": {"dataloader": "scenarios/.../dataloader-14_03_2025_fixed_arrivals.json"}
+    },
+    "grid": {                                             # cartesian product ...
+      "capacity_weight": [1, 2, 5],
+      "run_time_limit": [60, 120],
+      "start_day_at_office": [true, false]
+    },
+    "list": [{"distance_weight": 2, "capacity_weight": 0}]   # ... and/or explicit combinations
+  }
+
+Option keys are paths inside payload["options"] ("planning_horizon.end" works).
+
+Every matrix variant is built once into <SWEEP_DIR>/<name>/bases/ with
+data_parser.build_dataloader(); every option combination is an overlay on it
+(scenario_overlay.py), so a scenario costs a few hundred bytes:
+
+  <SWEEP_DIR>/<name>/<matrix>/<key=value-key=value>/dataloader-<day>.overlay.json
+                                                  /result-<day>.json
+
+The scenarios are submitted in parallel with solver_client.py (result cache
+included). manifest.json records every scenario with its status and is
+rewritten atomically after each change, so an interrupted sweep continues
+with the scenarios that are not done yet:
+
+    python sweep.py sweep.json                  # build + run (resumes)
+    python sweep.py sweep.json --build-only
+    python sweep.py sweep.json --status
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import result_cache
+from scenario_overlay import write_overlay
+from solver_client import CONCURRENCY, SOLVER_URL, result_path_for, run_batch
+
+# --- CONFIG ---
+SWEEP_DIR = Path("./scenarios/sweeps")
+MANIFEST_NAME = "manifest.json"
+# data_parser.py module settings a matrix variant may override
+MATRIX_SETTINGS = {"MATRIX_STORE", "PRUNE_MATRIX", "MATRIX_MODE", "KNN_K", "DURATION_SLOT", "SNAP_MAPPING_CSV"}
+# ---------------
+
+STATUSES = ["pending", "done", "failed"]
+
+
+# ----------------- spec -> scenarios -----------------
+def load_spec(path) -> Dict[str, Any]:
+    spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    for key in ("name", "day"):
+        if not spec.get(key):
+            raise ValueError(f"{path}: '{key}' is required")
+    spec.setdefault("matrix", {"dense": {}})
+    for name, settings in spec["matrix"].items():
+        unknown = set(settings) - MATRIX_SETTINGS - {"dataloader"}
+        if unknown:
+            raise ValueError(f"{path}: matrix variant '{name}' has unknown settings {sorted(unknown)}")
+    if not spec.get("grid") and not spec.get("list"):
+        spec["list"] = [{}]
+    return spec
+
+
+def option_combinations(spec: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """grid (cartesian product, key order of the spec) followed by list; duplicates dropped."""
+    combos: List[Dict[str, Any]] = []
+    grid = spec.get("grid") or {}
+    if grid:
+        keys = list(grid)
+        combos += [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    combos += [dict(c) for c in spec.get("list") or []]
+    seen, out = set(), []
+    for c in combos:
+        sig = json.dumps(c, sort_keys=True)
+        if sig not in seen:
+            seen.add(sig)
+            out.append(c)
+    return out
+
+
+def _fmt_value(v: Any) -> str:
+    return v if isinstance(v, str) else json.dumps(v)
+
+
+def scenario_id(matrix: str, options: Dict[str, Any]) -> str:
+    """'dense/capacity_weight=1-run_time_limit=60' (folder name, same style as the hand-made scenarios)."""
+    label = "-".join(f"{k}={_fmt_value(v)}" for k, v in options.items()) or "base"
+    label = re.sub(r'[<>:"/\\|?*\s]+', "_", label)
+    if len(label) > 120:   # Windows path limits
+        label = label[:100] + "-" + hashlib.sha1(label.encode("utf-8")).hexdigest()[:12]
+    return f"{matrix}/{label}"
+
+
+def spec_scenarios(spec: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    for matrix in spec["matrix"]:
+        for options in option_combinations(spec):
+            yield {"id": scenario_id(matrix, options), "matrix": matrix, "options": options}
+
+
+# ----------------- manifest -----------------
+def manifest_path(sweep_dir: Path) -> Path:
+    return sweep_dir / MANIFEST_NAME
+
+
+def load_manifest(sweep_dir: Path) -> Dict[str, Any]:
+    p = manifest_path(sweep_dir)
+    if p.exists():
+        return json.loads(p.read_text(encoding="utf-8"))
+    return {"bases": {}, "scenarios": {}}
+
+
+def save_manifest(sweep_dir: Path, manifest: Dict[str, Any]) -> None:
+    """Atomic rewrite (a crash leaves the previous manifest, never a half-written one)."""
+    sweep_dir.mkdir(parents=True, exist_ok=True)
+    p = manifest_path(sweep_dir)
+    tmp = p.with_name(p.name + ".part")
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp, p)
+
+
+def merge_scenarios(manifest: Dict[str, Any], spec: Dict[str, Any], sweep_dir: Path) -> List[str]:
+    """
+    Add the spec's scenarios that are not in the manifest yet (existing entries
+    keep their status); returns the ids of the spec. Entries of scenarios that
+    were removed from the spec stay in the manifest but are not run.
+    """
+    scenarios = manifest["scenarios"]
+    ids = []
+    for sc in spec_scenarios(spec):
+        ids.append(sc["id"])
+        if sc["id"] in scenarios:
+            continue
+        overlay = sweep_dir / sc["id"] / f"dataloader-{spec['day']}.overlay.json"
+        scenarios[sc["id"]] = {
+            **sc,
+            "overlay": overlay.relative_to(sweep_dir).as_posix(),
+            "result": result_path_for(overlay).relative_to(sweep_dir).as_posix(),
+            "status": "pending",
+            "attempts": 0,
+        }
+    return ids
+
+
+# ----------------- building -----------------
+@contextmanager
+def parser_settings(settings: Dict[str, Any]):
+    """Temporarily override data_parser.py module settings (MATRIX_SETTINGS only)."""
+    import data_parser
+    old = {k: getattr(data_parser, k) for k in settings}
+    try:
+        for k, v in settings.items():
+            setattr(data_parser, k, v)
+        yield data_parser
+    finally:
+        for k, v in old.items():
+            setattr(data_parser, k, v)
+
+
+def build_bases(spec: Dict[str, Any], sweep_dir: Path, manifest: Dict[str, Any]) -> None:
+    """One base dataloader per matrix variant (skipped when the manifest already has it)."""
+    todo = {}
+    for name, settings in spec["matrix"].items():
+        entry = manifest["bases"].get(name)
+        if entry and entry.get("settings") == settings and (sweep_dir / entry["path"]).exists():
+            continue
+        todo[name] = settings
+
+    sheets = None
+    for name, settings in todo.items():
+        if "dataloader" in settings:   # prebuilt file, used as it is
+            path = Path(settings["dataloader"]).resolve()
+            if not path.exists():
+                raise FileNotFoundError(f"Matrix variant '{name}': {path} not found")
+            rel = os.path.relpath(path, sweep_dir)
+        else:
+            path = sweep_dir / "bases" / f"dataloader-{spec['day']}-{name}_fixed_arrivals.json"
+            with parser_settings(settings) as dp:
+                day = dp.day_of_sheet(f"RAPOR-{spec['day']}")
+                if day is None:
+                    raise ValueError(f"Spec day {spec['day']!r} is not a valid DD_MM_YYYY date")
+                if sheets is None:
+                    sheets = dp.read_sheets(dp.INPUT_XLSX, [f"RAPOR-{spec['day']}", dp.SHEET_TECH, dp.SHEET_UGCTS],
+                                            dtype=str)
+                print(f"Building matrix variant '{name}' {settings or ''}")
+                written = dp.build_dataloader(sheets[f"RAPOR-{spec['day']}"], sheets[dp.SHEET_TECH],
+                                              sheets[dp.SHEET_UGCTS], day, str(path))
+            rel = Path(written).relative_to(sweep_dir).as_posix()   # '_fixed_arrivals' added by the parser
+        manifest["bases"][name] = {"settings": settings, "path": Path(rel).as_posix()}
+        # a rebuilt base invalidates the results of its scenarios
+        for sc in manifest["scenarios"].values():
+            if sc["matrix"] == name and sc["status"] != "pending":
+                sc.update(status="pending", attempts=0)
+        save_manifest(sweep_dir, manifest)
+
+
+def write_overlays(sweep_dir: Path, manifest: Dict[str, Any], ids: List[str]) -> int:
+    """Overlay file of every scenario not done yet (cheap; rewritten so they follow a rebuilt base)."""
+    n = 0
+    for sc in (manifest["scenarios"][i] for i in ids):
+        if sc["status"] == "done":
+            continue
+        base = sweep_dir / manifest["bases"][sc["matrix"]]["path"]
+        patches = [{"option": k, "value": v} for k, v in sc["options"].items()]
+        write_overlay(sweep_dir / sc["overlay"], base, patches)
+        n += 1
+    return n
+
+
+# ----------------- running -----------------
+def run_pending(sweep_dir: Path, manifest: Dict[str, Any], ids: List[str], concurrency: int = CONCURRENCY,
+                url: str = SOLVER_URL, retry_failed: bool = True, **cache_kwargs) -> None:
+    """Submit the scenarios of 'ids' that are not done (or whose result file is gone)."""
+    wanted = {"pending", "failed"} if retry_failed else {"pending"}
+    todo = {sc["overlay"]: sc for sc in (manifest["scenarios"][i] for i in ids)
+            if sc["status"] in wanted or (sc["status"] == "done" and not (sweep_dir / sc["result"]).exists())}
+    if not todo:
+        print("Nothing to run.")
+        return
+    print(f"Running {len(todo)} scenario(s), {concurrency} at a time -> {url}")
+    jobs = ((sweep_dir / ov, sweep_dir / sc["result"]) for ov, sc in todo.items())
+    for r in run_batch(jobs, concurrency, url, **cache_kwargs):
+        sc = todo[r.input_path.relative_to(sweep_dir).as_posix()]
+        sc["attempts"] += r.attempts
+        sc.update(status="done" if r.ok else "failed", seconds=round(r.seconds, 1), cached=r.cached,
+                  error=r.error, finished_at=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        save_manifest(sweep_dir, manifest)   # after every result: resumable at any point
+        mark = "✅" if r.ok else "⚠️"
+        print(f"{mark} {sc['id']}" + (" (cached)" if r.cached else f" ({r.seconds:.0f}s)" if r.ok else f": {r.error}"))
+
+
+def status_summary(manifest: Dict[str, Any]) -> str:
+    counts = {s: 0 for s in STATUSES}
+    for sc in manifest["scenarios"].values():
+        counts[sc["status"]] = counts.get(sc["status"], 0) + 1
+    return ", ".join(f"{s}={c}" for s, c in counts.items())
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run a parameter sweep over options and matrix variants.")
+    ap.add_argument("spec", help="sweep spec JSON")
+    ap.add_argument("--sweep-dir", default=str(SWEEP_DIR))
+    ap.add_argument("--build-only", action="store_true", help="build bases and overlays, do not call the solver")
+    ap.add_argument("--status", action="store_true", help="print the manifest summary and exit")
+    ap.add_argument("--url", default=SOLVER_URL)
+    ap.add_argument("--concurrency", type=int, default=CONCURRENCY)
+    ap.add_argument("--no-retry-failed", action="store_true", help="leave failed scenarios alone")
+    ap.add_argument("--refresh", action="store_true", help="fresh solver runs, ignore cached results")
+    ap.add_argument("--no-cache", action="store_true", help="do not read or write the result cache")
+    args = ap.parse_args()
+
+    spec = load_spec(args.spec)
+    sweep_dir = Path(args.sweep_dir) / spec["name"]
+    manifest = load_manifest(sweep_dir)
+    if args.status:
+        print(f"{sweep_dir}: {len(manifest['scenarios'])} scenario(s): {status_summary(manifest)}")
+        return
+
+    manifest["spec"] = spec
+    ids = merge_scenarios(manifest, spec, sweep_dir)
+    save_manifest(sweep_dir, manifest)
+    build_bases(spec, sweep_dir, manifest)
+    n = write_overlays(sweep_dir, manifest, ids)
+    print(f"✅ {len(spec['matrix'])} matrix variant(s), {len(ids)} scenario(s) "
+          f"({n} overlay(s) written) in {sweep_dir}")
+    if args.build_only:
+        return
+
+    run_pending(sweep_dir, manifest, ids, args.concurrency, args.url, retry_failed=not args.no_retry_failed,
+                cache_dir=None if args.no_cache else result_cache.CACHE_DIR, refresh=args.refresh)
+    print(f"⏱️ {status_summary(manifest)} -> {manifest_path(sweep_dir)}")
+
+
+if __name__ == "__main__":
+    main()
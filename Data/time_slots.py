@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+"""
+The 2-hour appointment slots of a working day, shared by the reports
+(json_to_excel.py) and the time-dependent matrices (geo_matrix.py, slot_matrix.py).
+"""
+
+from typing import Dict, List, Tuple
+
+SLOT_DEFS: List[Tuple[str, int, int]] = [
+    ("08:00-10:00", 8, 10),
+    ("10:00-12:00", 10, 12),
+    ("13:00-15:00", 13, 15),
+    ("15:00-17:00", 15, 17),
+    ("17:00-19:00", 17, 19),
+    ("19:00-21:00", 19, 21),
+    ("21:00-23:00", 21, 23),
+]
+SLOT_LABELS = [s[0] for s in SLOT_DEFS]
+
+# Driving speed multiplier per slot, relative to the matrix's own speeds (1.0 = as measured;
+# < 1.0 slower, e.g. rush hour; > 1.0 faster, e.g. empty roads late in the evening)
+SLOT_SPEED_FACTORS: Dict[str, float] = {
+    "08:00-10:00": 0.75,
+    "10:00-12:00": 0.95,
+    "13:00-15:00": 1.00,
+    "15:00-17:00": 0.90,
+    "17:00-19:00": 0.70,
+    "19:00-21:00": 0.95,
+    "21:00-23:00": 1.10,
+}
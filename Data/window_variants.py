@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk arrival-window variants (slot-offer analysis for many bookings at once).
+
+For every selected appointment x every candidate window one variant of the
+base dataloader is produced: the same board with only that appointment's
+arrival_window moved. Variants are overlays (scenario_overlay.py), so each
+costs a few hundred bytes on disk.
+
+  - select_appointments()  ids / business units / predicate -> appointment ids
+                           (appointments indexed by id once, no list scans),
+  - iter_variants()        lazy generator over appointments x windows;
+                           patches that do not change the board are dropped
+                           and variants are deduped by the hash of the
+                           remaining change, so a window listed twice or an
+                           appointment's own window never repeats a scenario
+                           (the unchanged board is emitted once, as "current"),
+  - main()                 writes one overlay per variant into OUTPUT_DIR.
+
+    python window_variants.py --appointments 9098841329
+    python window_variants.py --bu 2541 2542
+    python window_variants.py --all --limit 100
+"""
+
+import argparse
+import hashlib
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from json_stream import write_json
+from scenario_overlay import apply_patches, id_index, load_base, overlay_path_for, write_overlay
+from time_slots import SLOT_DEFS
+
+# --- CONFIG ---
+INPUT_DATALOADER = Path("./scenarios/capacity_weight=1/technician_capacity_100-driving_speed_dynamic/diff_slots/dataloader-14_03_2025_pruned.json")
+OUTPUT_DIR = INPUT_DATALOADER.parent / "window_variants"
+# Yeni arrival windowlar (default: the 2-hour slots up to 21:00)
+NEW_WINDOWS: List[Tuple[str, str]] = [(f"{a:02d}:00:00", f"{b:02d}:00:00") for _, a, b in SLOT_DEFS if b <= 21]
+WRITE_OVERLAYS = True   # False -> full dataloader per variant
+COMPACT_JSON = True
+# ---------------
+
+
+CURRENT_LABEL = "current"
+
+
+@dataclass(frozen=True)
+class Variant:
+    appointment_id: Optional[str]      # None for the unchanged board
+    window: Optional[Tuple[str, str]]  # ("08:00:00", "10:00:00")
+    patches: Tuple[Dict[str, Any], ...]
+    digest: str                        # content hash of the effective change
+
+    @property
+    def is_current(self) -> bool:
+        return not self.patches
+
+    @property
+    def label(self) -> str:
+        if self.is_current:
+            return CURRENT_LABEL
+        return f"{self.appointment_id}_{self.window[0][:2]}-{self.window[1][:2]}"
+
+
+def parse_window(w) -> Tuple[str, str]:
+    """('08:00:00', '10:00:00') / ('08:00', '10:00') / '08:00-10:00' -> ('08:00:00', '10:00:00')."""
+    a, b = w.split("-", 1) if isinstance(w, str) else w
+    return tuple(t.strip() + ":00" * (2 - t.strip().count(":")) for t in (a, b))
+
+
+def select_appointments(payload: Dict[str, Any],
+                        ids: Optional[Iterable[str]] = None,
+                        business_units: Optional[Iterable[str]] = None,
+                        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[str]:
+    """
+    Appointment ids in payload order. 'ids' / 'business_units' / 'predicate'
+    narrow the set (all None = every appointment of the board).
+    """
+    appts = payload.get("appointments") or []
+    index = id_index(appts)
+    if ids is not None:
+        wanted = [str(i) for i in ids]
+        missing = [i for i in wanted if i not in index]
+        if missing:
+            raise KeyError(f"Appointment(s) not found in the dataloader: {', '.join(missing[:10])}")
+        positions = sorted({index[i] for i in wanted})
+    else:
+        positions = range(len(appts))
+    bus: Optional[Set[str]] = {str(b) for b in business_units} if business_units is not None else None
+
+    out = []
+    for pos in positions:
+        ap = appts[pos]
+        if bus is not None and str(ap.get("business_unit_id")) not in bus:
+            continue
+        if predicate is not None and not predicate(ap):
+            continue
+        out.append(str(ap.get("id")))
+    return out
+
+
+def window_patches(appointment: Dict[str, Any], window: Tuple[str, str], day: str) -> List[Dict[str, Any]]:
+    """Patches moving 'appointment' to 'window' on 'day' (YYYY-MM-DD)."""
+    aid = str(appointment.get("id"))
+    return [{"appointment": aid, "path": f"arrival_window.{k}", "value": f"{day}T{t}.000Z"}
+            for k, t in (("start", window[0]), ("end", window[1]))]
+
+
+def effective_patches(appointment: Dict[str, Any], patches: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The patches that actually change 'appointment' (no-op sets are dropped)."""
+    aw = appointment.get("arrival_window") or {}
+    return [p for p in patches if aw.get(p["path"].split(".")[-1]) != p["value"]]
+
+
+def patches_digest(patches: Sequence[Dict[str, Any]]) -> str:
+    """Content hash of a patch list (key order and patch order do not matter)."""
+    canon = sorted(json.dumps(p, sort_keys=True, separators=(",", ":"), ensure_ascii=False) for p in patches)
+    return hashlib.sha256("\n".join(canon).encode("utf-8")).hexdigest()
+
+
+def iter_variants(payload: Dict[str, Any],
+                  appointment_ids: Iterable[str],
+                  windows: Iterable = NEW_WINDOWS,
+                  seen: Optional[Set[str]] = None,
+                  keep_current: bool = True) -> Iterator[Variant]:
+    """
+    Lazily yields one Variant per distinct scenario of (appointment, window).
+    Variants are deduped by the hash of their effective patches: the
+    appointment's own window is a no-op, so all of them collapse into one
+    shared "current" variant (the unchanged board), skipped with
+    keep_current=False. 'seen' (digests) is updated in place, so several
+    calls can share one dedupe set.
+    """
+    appts = payload.get("appointments") or []
+    index = id_index(appts)
+    wins = [parse_window(w) for w in windows]
+    ph_day = str(((payload.get("options") or {}).get("planning_horizon") or {}).get("start") or "").split("T")[0]
+    seen = set() if seen is None else seen
+    for aid in appointment_ids:
+        ap = appts[index[str(aid)]]
+        day = str((ap.get("arrival_window") or {}).get("start") or "").split("T")[0] or ph_day
+        for w in wins:
+            patches = effective_patches(ap, window_patches(ap, w, day))
+            if not patches and not keep_current:
+                continue
+            digest = patches_digest(patches)
+            if digest in seen:
+                continue
+            seen.add(digest)
+            if not patches:
+                yield Variant(None, None, (), digest)
+            else:
+                yield Variant(str(aid), w, tuple(patches), digest)
+
+
+def variant_path(output_dir: Path, base_path: Path, variant: Variant, overlay: bool = WRITE_OVERLAYS) -> Path:
+    """<output_dir>/<base stem>_<appointment>_<HH>-<HH>.json (or _current.json; .overlay.json for overlays)."""
+    p = Path(output_dir) / f"{Path(base_path).stem}_{variant.label}.json"
+    return overlay_path_for(p) if overlay else p
+
+
+def write_variants(base_path: Path, variants: Iterable[Variant], output_dir: Path,
+                   overlay: bool = WRITE_OVERLAYS, compact: bool = COMPACT_JSON) -> Iterator[Path]:
+    """Writes each variant as it is generated; yields the written paths."""
+    base = load_base(base_path) if not overlay else None
+    for v in variants:
+        out = variant_path(output_dir, base_path, v, overlay)
+        if overlay:
+            write_overlay(out, base_path, list(v.patches))
+        else:
+            write_json(out, apply_patches(base, v.patches), compact=compact)
+        yield out
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Arrival-window variants for many appointments.")
+    ap.add_argument("--dataloader", default=str(INPUT_DATALOADER))
+    ap.add_argument("--output-dir", default=None, help=f"default: {OUTPUT_DIR}")
+    sel = ap.add_mutually_exclusive_group(required=True)
+    sel.add_argument("--appointments", nargs="+", help="appointment ids")
+    sel.add_argument("--bu", nargs="+", help="all appointments of these business units")
+    sel.add_argument("--all", action="store_true", help="all appointments of the board")
+    ap.add_argument("--windows", nargs="+", help="e.g. 08:00-10:00 13:00-15:00 (default: NEW_WINDOWS)")
+    ap.add_argument("--limit", type=int, default=None, help="stop after this many variants")
+    ap.add_argument("--skip-current", action="store_true", help="no variant for the appointment's own window")
+    ap.add_argument("--full", action="store_true", help="write full dataloaders instead of overlays")
+    args = ap.parse_args()
+
+    base_path = Path(args.dataloader)
+    output_dir = Path(args.output_dir) if args.output_dir else base_path.parent / OUTPUT_DIR.name
+    payload = load_base(base_path)
+    ids = select_appointments(payload, ids=args.appointments, business_units=args.bu)
+    windows = args.windows or NEW_WINDOWS
+
+    variants = iter_variants(payload, ids, windows, keep_current=not args.skip_current)
+    if args.limit is not None:
+        variants = (v for i, v in zip(range(args.limit), variants))
+    written = 0
+    for path in write_variants(base_path, variants, output_dir, overlay=not args.full):
+        written += 1
+    print(f"✅ Wrote {written} variant(s) for {len(ids)} appointment(s) x {len(windows)} window(s) -> {output_dir}")
+
+
+if __name__ == "__main__":
+    main()